@@ -0,0 +1,73 @@
+"""
+Benchmark: serialización del histórico con iterrows vs lectura desde HistoryStore.
+
+Mide el camino caliente de /api/market/history con la serie ya guardada
+(sin red: el costo de Yahoo queda fuera en ambos casos).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_history
+    python -m benchmarks.bench_history --years 20 40
+"""
+import argparse
+import time
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+from sqlmodel import Session, SQLModel, create_engine
+
+from models.models import PriceBar, PriceSeries  # noqa: F401 (registra las tablas)
+from services.history_store import HistoryStore
+
+
+def make_history(years: int) -> pd.DataFrame:
+    dates = pd.bdate_range(end="2024-06-03", periods=years * 252, tz="America/New_York")
+    close = 100 + np.cumsum(np.random.default_rng(42).normal(0, 1, len(dates)))
+    return pd.DataFrame({"Open": close, "High": close, "Low": close, "Close": close, "Volume": 1e6}, index=dates)
+
+
+def legacy_iterrows(hist: pd.DataFrame):
+    """Camino original de get_market_history: iterrows fila por fila."""
+    data = []
+    for index, row in hist.iterrows():
+        if pd.isna(row['Close']):
+            continue
+        data.append({"time": int(index.timestamp()), "value": round(float(row['Close']), 2)})
+    return data
+
+
+def stored(session: Session):
+    ts, close = HistoryStore.get_series(session, "BENCH", "max", "1d")
+    return HistoryStore.to_points(ts, close)
+
+
+def timed(fn, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, nargs="+", default=[20])
+    args = parser.parse_args()
+
+    print(f"{'bars':>7} | {'iterrows':>10} | {'store':>10} | speedup")
+    for years in args.years:
+        hist = make_history(years)
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session, patch("services.history_store.yf.Ticker") as mock_ticker:
+            mock_ticker.return_value = MagicMock(**{"history.return_value": hist})
+            stored(session)  # Primera carga: descarga + guardado
+            assert stored(session) == legacy_iterrows(hist)
+            legacy = timed(legacy_iterrows, hist)
+            fast = timed(stored, session)
+        print(f"{len(hist):>7} | {legacy * 1000:>8.1f}ms | {fast * 1000:>8.1f}ms | {legacy / fast:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: replay de lotes (LotEngine) para todo el historial, por método.
+
+Objetivo: 100k trades en 500 tickers en menos de 1 s (replay en memoria).
+También mide el recálculo completo contra la DB (consulta + UPDATE de ganancia_realizada).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_lots
+    python -m benchmarks.bench_lots --trades 200000 --tickers 1000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import insert
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from models.models import TradeHistory
+from services.lot_engine import LOT_METHODS, LotEngine, replay_lots
+
+BASE = datetime(2010, 1, 1)
+TARGET_S = 1.0
+
+
+def make_rows(trades: int, tickers: int, seed: int = 42):
+    """Historial sintético: ~70% compras; las ventas nunca superan la posición abierta."""
+    rng = random.Random(seed)
+    shares = [0.0] * tickers
+    rows = []
+    for i in range(trades):
+        t = rng.randrange(tickers)
+        qty = round(rng.uniform(0.1, 5.0), 4)
+        tipo = "SELL" if shares[t] > qty and rng.random() < 0.3 else "BUY"
+        shares[t] += qty if tipo == "BUY" else -qty
+        rows.append({
+            "ticker": f"T{t:04d}",
+            "tipo": tipo,
+            "cantidad": qty,
+            "precio": rng.randint(5_000, 50_000),
+            "total": 0,
+            "commission": rng.randint(0, 200),
+            "fecha": BASE + timedelta(minutes=i),
+        })
+    return rows
+
+
+def replay_in_memory(grouped, method: str):
+    return {ticker: replay_lots(rows, method) for ticker, rows in grouped}
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trades", type=int, default=100_000)
+    parser.add_argument("--tickers", type=int, default=500)
+    args = parser.parse_args()
+
+    rows = make_rows(args.trades, args.tickers)
+    # Mismo orden que la consulta de LotEngine: (ticker, fecha, id)
+    ordered = sorted(enumerate(rows, 1), key=lambda r: (r[1]["ticker"], r[1]["fecha"], r[0]))
+    grouped = [
+        (ticker, [(i, r["tipo"], r["cantidad"], r["precio"], r["commission"]) for i, r in group])
+        for ticker, group in groupby(ordered, key=lambda r: r[1]["ticker"])
+    ]
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(insert(TradeHistory), rows)
+        session.commit()
+
+        print(f"{args.trades:,} trades / {args.tickers} tickers")
+        print(f"{'método':>8} | {'replay':>9} | {'recompute DB':>12} | objetivo < {TARGET_S:.0f}s")
+        for method in LOT_METHODS:
+            in_memory = timed(lambda: replay_in_memory(grouped, method))
+            with_db = timed(lambda: LotEngine.recompute(session, method=method), repeat=1)
+            status = "OK" if in_memory < TARGET_S else "LENTO"
+            print(f"{method:>8} | {in_memory * 1000:>7.1f}ms | {with_db * 1000:>10.1f}ms | {status}")
+
+
+if __name__ == "__main__":
+    main()
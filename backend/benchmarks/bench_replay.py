@@ -0,0 +1,106 @@
+"""
+Benchmark: replay completo vs replay con checkpoints (PositionEngine).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_replay
+    python -m benchmarks.bench_replay --sizes 1000 10000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models.models import Asset, TradeHistory
+from services.position_engine import PositionEngine, apply_trade
+
+TICKER = "BENCH"
+BASE = datetime(2010, 1, 1)
+
+
+def make_session() -> Session:
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return Session(engine)
+
+
+def seed(session: Session, n: int, seed: int = 42):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        tipo = "SELL" if rng.random() < 0.3 else "BUY"
+        rows.append({
+            "ticker": TICKER,
+            "tipo": tipo,
+            "cantidad": round(rng.uniform(0.1, 5.0), 4),
+            "precio": rng.randint(5_000, 50_000),
+            "total": 0,
+            "commission": rng.randint(0, 200),
+            "fecha": BASE + timedelta(minutes=i),
+        })
+    session.execute(insert(TradeHistory), rows)
+    session.commit()
+
+
+def legacy_full_replay(session: Session, ticker: str):
+    """Replay original: carga todos los TradeHistory como objetos ORM."""
+    history = session.exec(
+        select(TradeHistory).where(TradeHistory.ticker == ticker).order_by(TradeHistory.fecha.asc())
+    ).all()
+    shares, cost = 0.0, 0.0
+    for trade in history:
+        shares, cost = apply_trade(shares, cost, trade.tipo, trade.cantidad, trade.precio, trade.commission)
+    asset = session.exec(select(Asset).where(Asset.ticker == ticker)).first()
+    asset.cantidad_total = shares
+    asset.precio_promedio = int(round(cost / shares)) if shares > 0 else 0
+    session.add(asset)
+    session.commit()
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n: int) -> dict:
+    session = make_session()
+    seed(session, n)
+    PositionEngine.replay(session, TICKER)  # Construye checkpoints
+
+    # Editamos un trade en el último 1% del historial (caso típico: corrección reciente)
+    edited = session.exec(
+        select(TradeHistory).where(TradeHistory.ticker == TICKER).order_by(TradeHistory.fecha.desc()).offset(max(n // 100, 1))
+    ).first()
+
+    legacy = timed(lambda: legacy_full_replay(session, TICKER))
+    full = timed(lambda: PositionEngine.replay(session, TICKER))
+    incremental = timed(lambda: PositionEngine.replay(session, TICKER, desde=edited.fecha))
+    session.close()
+    return {"trades": n, "legacy_s": legacy, "full_s": full, "incremental_s": incremental}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'trades':>8} | {'legacy ORM':>11} | {'full replay':>11} | {'checkpoint':>11} | speedup")
+    for n in args.sizes:
+        r = run(n)
+        speedup = r["legacy_s"] / r["incremental_s"] if r["incremental_s"] else float("inf")
+        print(f"{n:>8} | {r['legacy_s'] * 1000:>9.1f}ms | {r['full_s'] * 1000:>9.1f}ms | {r['incremental_s'] * 1000:>9.1f}ms | {speedup:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
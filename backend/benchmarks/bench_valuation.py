@@ -0,0 +1,82 @@
+"""
+Benchmark: valuación de posiciones con pandas apply/iterrows vs kernel NumPy.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_valuation
+    python -m benchmarks.bench_valuation --positions 10000 100000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.valuation import valuar_posiciones
+
+
+def make_positions(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [
+        {
+            "ticker": f"T{i:05d}",
+            "cantidad_total": round(rng.uniform(0.01, 500.0), 5),
+            "precio_promedio": rng.randint(100, 100_000),  # CENTS
+            "precio_actual": rng.randint(100, 100_000),    # CENTS
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_pandas(rows):
+    """Camino original de obtener_portafolio: DataFrame + apply(axis=1) + iterrows."""
+    df = pd.DataFrame(rows)
+    df['precio_promedio'] = df['precio_promedio'] / 100.0
+    df['Precio_Actual'] = df['precio_actual'] / 100.0
+    df['Valor_Mercado'] = df['cantidad_total'] * df['Precio_Actual']
+    df['Costo_Base'] = df['cantidad_total'] * df['precio_promedio']
+    df['Ganancia_USD'] = df['Valor_Mercado'] - df['Costo_Base']
+    df['Rendimiento_Porc'] = df.apply(lambda x: (x['Ganancia_USD'] / x['Costo_Base'] * 100) if x['Costo_Base'] > 0 else 0, axis=1)
+    return [
+        {"Ticker": row['ticker'], "Valor_Mercado": round(float(row['Valor_Mercado']), 2), "Rendimiento_Porc": round(float(row['Rendimiento_Porc']), 2)}
+        for _, row in df.iterrows()
+    ]
+
+
+def kernel(rows):
+    tickers = [r["ticker"] for r in rows]
+    v = valuar_posiciones(
+        [r["cantidad_total"] for r in rows],
+        [r["precio_promedio"] for r in rows],
+        [r["precio_actual"] for r in rows],
+    )
+    return [
+        {"Ticker": t, "Valor_Mercado": valor, "Rendimiento_Porc": rend}
+        for t, valor, rend in zip(tickers, np.round(v.valor_mercado / 100.0, 2).tolist(), np.round(v.rendimiento_porc, 2).tolist())
+    ]
+
+
+def timed(fn, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, nargs="+", default=[10_000])
+    args = parser.parse_args()
+
+    print(f"{'positions':>9} | {'pandas':>10} | {'numpy':>10} | speedup")
+    for n in args.positions:
+        rows = make_positions(n)
+        legacy = timed(legacy_pandas, rows)
+        fast = timed(kernel, rows)
+        print(f"{n:>9} | {legacy * 1000:>8.1f}ms | {fast * 1000:>8.1f}ms | {legacy / fast:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
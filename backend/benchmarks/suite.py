@@ -0,0 +1,357 @@
+"""
+Suite de benchmarks reproducible: portafolios sintéticos sembrados, servicios externos simulados.
+
+Genera una base en memoria (testing.memory_engine, la misma que usa conftest.py) por tamaño con
+benchmarks.synthetic, apunta la app a esa base y mide las rutas calientes:
+dashboard, portafolio, historial de trades, importación, replay de posiciones y lotes.
+Yahoo (yf.download / yf.Ticker) y dolarapi se reemplazan por fakes locales: nada sale a internet
+y los tiempos no dependen de la red.
+
+Los resultados se escriben en JSON para comparar entre commits.
+
+Uso (desde backend/):
+    python -m benchmarks.suite run                                 # small + medium
+    python -m benchmarks.suite run --sizes small medium large --repeat 10
+    python -m benchmarks.suite run --only dashboard portfolio -o /tmp/antes.json
+    python -m benchmarks.suite compare /tmp/antes.json benchmarks/results/<commit>.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import zlib
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from benchmarks.synthetic import BASE, SIZES, Size, base_price, generate, make_snapshot
+from database import get_session
+from main import app
+from models.models import Asset
+from services.dashboard_cache import dashboard_cache
+from services.fx_service import fx_service
+from services.lot_engine import LotEngine
+from services.market_service import MarketDataService, price_cache
+from services.networth_history import NetWorthHistory, networth_tail
+from services.position_engine import PositionEngine
+from testing import DolarApiStub, memory_engine
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_SIZES = ["small", "medium"]
+# Diferencia de mediana a partir de la cual `compare` marca el cambio
+DEFAULT_THRESHOLD = 0.10
+
+
+# --- Servicios externos simulados ---
+class FakeYahoo:
+    """Reemplaza yf.download (precios en batch) y yf.Ticker().history (velas OHLC)."""
+
+    def __init__(self, seed: int, latency: float = 0.0):
+        self.seed = seed
+        self.latency = latency
+
+    def _price(self, ticker: str) -> float:
+        digits = "".join(c for c in ticker if c.isdigit())
+        return base_price(int(digits or 0), self.seed) / 100.0
+
+    def download(self, tickers, period: str = "5d", **kwargs) -> pd.DataFrame:
+        time.sleep(self.latency)
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        index = pd.date_range(end=datetime.now(), periods=5, freq="D")
+        closes = pd.DataFrame({t: [self._price(t)] * len(index) for t in tickers}, index=index)
+        return pd.concat({"Close": closes}, axis=1)
+
+    def ticker(self, ticker: str) -> "FakeTicker":
+        return FakeTicker(self, ticker)
+
+
+class FakeTicker:
+
+    def __init__(self, yahoo: FakeYahoo, ticker: str):
+        self.yahoo, self.ticker = yahoo, ticker
+
+    def history(self, period: Optional[str] = None, interval: str = "1d", start=None, **kwargs) -> pd.DataFrame:
+        time.sleep(self.yahoo.latency)
+        freq = "1D" if interval.endswith("d") else "1h"
+        index = pd.date_range(start=start or BASE, end=datetime.now(), freq=freq, tz="America/New_York")
+        rng = np.random.default_rng(zlib.crc32(self.ticker.encode()) + self.yahoo.seed)
+        closes = self.yahoo._price(self.ticker) * np.exp(np.cumsum(rng.normal(0, 0.01, len(index))))
+        return pd.DataFrame(
+            {"Open": closes, "High": closes, "Low": closes, "Close": closes, "Volume": np.full(len(index), 1000.0)},
+            index=index,
+        )
+
+
+@contextmanager
+def mocked_services(seed: int, latency: float = 0.0) -> Iterator[FakeYahoo]:
+    yahoo = FakeYahoo(seed, latency)
+    stub = DolarApiStub()
+    with ExitStack() as stack:
+        stack.enter_context(patch("services.market_service.yf.download", side_effect=yahoo.download))
+        stack.enter_context(patch("services.history_store.yf.Ticker", side_effect=yahoo.ticker))
+        stack.enter_context(patch.object(fx_service, "url", stub.url))
+        fx_service.clear()
+        try:
+            yield yahoo
+        finally:
+            fx_service.clear()
+            stub.shutdown()
+
+
+# --- Medición ---
+def measure(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None, warmup: int = 1) -> Dict:
+    """Corre `fn` warmup + repeat veces (setup fuera del tiempo medido). Segundos."""
+    runs = []
+    for i in range(warmup + repeat):
+        # Los services imprimen cada descarga/consulta: en el benchmark sólo ensucia la salida
+        with redirect_stdout(io.StringIO()):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            runs.append(elapsed)
+    ordered = sorted(runs)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "mean": statistics.fmean(ordered),
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "runs": len(ordered),
+    }
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url}: {response.status_code} {response.text[:200]}")
+    return response
+
+
+def use_session(session: Session):
+    def override():
+        yield session
+    app.dependency_overrides[get_session] = override
+
+
+class Bench:
+    """Una base sintética de un tamaño + cliente HTTP apuntando a ella."""
+
+    def __init__(self, size: Size, seed: int):
+        self.size, self.seed = size, seed
+        self.engine = memory_engine()
+        self.session = Session(self.engine)
+        start = time.perf_counter()
+        self.counts = generate(self.session, size.assets, size.trades, size.transactions, seed)
+        self.generate_seconds = time.perf_counter() - start
+        self.tickers = sorted(self.session.exec(select(Asset.ticker)).all())
+        self.client = TestClient(app)
+        use_session(self.session)
+
+    def close(self):
+        app.dependency_overrides.clear()
+        self.session.close()
+        self.engine.dispose()
+
+    # --- Escenarios ---
+    def dashboard(self):
+        _ok(self.client.get("/api/dashboard"))
+
+    def portfolio(self):
+        _ok(self.client.get("/api/portfolio"))
+
+    def trade_history(self):
+        _ok(self.client.get("/api/trade/history", params={"limit": 100}))
+
+    def trade_history_export(self):
+        _ok(self.client.get("/api/trade/history", params={"format": "ndjson", "limit": 1000}))
+
+    def networth_history(self):
+        _ok(self.client.get("/api/dashboard/history", params={"points": 500}))
+
+    def market_refresh(self):
+        assets = self.session.exec(select(Asset)).all()
+        MarketDataService.refresh_prices(self.session, assets)
+
+    def market_history(self):
+        _ok(self.client.get(f"/api/market/history/{self.tickers[0]}", params={"range": "1y"}))
+
+    def position_replay(self):
+        PositionEngine.rebuild(self.session, self.tickers)
+
+    def lot_replay(self):
+        LotEngine.recompute(self.session, method="FIFO")
+
+    def import_snapshot(self, snapshot: str):
+        _ok(self.client.post("/api/portfolio/import", json={"content": snapshot}))
+
+
+def run_size(size: Size, seed: int, repeat: int, only: Optional[List[str]]) -> Dict:
+    bench = Bench(size, seed)
+    print(f"[{size.name}] {bench.counts} generado en {bench.generate_seconds:.2f}s")
+
+    def cold_dashboard():
+        dashboard_cache.clear()
+
+    def cold_networth():
+        # Nada guardado: todos los días se calculan en memoria
+        NetWorthHistory.invalidate(bench.session, BASE.date())
+        bench.session.commit()
+        networth_tail.clear()
+
+    def synced_networth():
+        # Días cerrados ya guardados por el refresco en background: sólo hoy queda abierto
+        NetWorthHistory.sync(bench.session)
+        networth_tail.clear()
+
+    snapshot = json.dumps(make_snapshot(size.assets, seed))
+    import_db: Dict[str, object] = {}
+
+    def fresh_import_db():
+        # Cada importación arranca de una base vacía (si no, se acumulan trades entre corridas)
+        if import_db:
+            import_db["session"].close()
+            import_db["engine"].dispose()
+        import_db["engine"] = memory_engine()
+        import_db["session"] = Session(import_db["engine"])
+        use_session(import_db["session"])
+
+    scenarios = {
+        "dashboard": (bench.dashboard, cold_dashboard),
+        "dashboard_cached": (bench.dashboard, None),
+        "portfolio": (bench.portfolio, None),
+        "trade_history": (bench.trade_history, None),
+        "trade_history_export": (bench.trade_history_export, None),
+        "networth_history": (bench.networth_history, cold_networth),
+        "networth_history_synced": (bench.networth_history, synced_networth),
+        "market_refresh": (bench.market_refresh, price_cache.clear),
+        "market_history": (bench.market_history, None),
+        "position_replay": (bench.position_replay, None),
+        "lot_replay": (bench.lot_replay, None),
+        "import": (lambda: bench.import_snapshot(snapshot), fresh_import_db),
+    }
+    results = {}
+    try:
+        for name, (fn, setup) in scenarios.items():
+            if only and name not in only:
+                continue
+            use_session(bench.session)
+            results[name] = measure(fn, repeat, setup)
+            print(f"  {name:<22} mediana {results[name]['median'] * 1000:>9.2f} ms  (p95 {results[name]['p95'] * 1000:.2f} ms)")
+    finally:
+        if import_db:
+            import_db["session"].close()
+        bench.close()
+    return {"size": vars(size), "generate_seconds": bench.generate_seconds, "scenarios": results}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: List[str], seed: int, repeat: int, only: Optional[List[str]], latency: float) -> Dict:
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "latencia_simulada": latency,
+        },
+        "sizes": {},
+    }
+    with mocked_services(seed, latency):
+        for name in sizes:
+            result["sizes"][name] = run_size(SIZES[name], seed, repeat, only)
+    return result
+
+
+# --- Comparación ---
+def compare(base: Dict, new: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """Diferencia de medianas por (tamaño, escenario) presente en ambos resultados."""
+    rows = []
+    for size, data in new["sizes"].items():
+        before = base["sizes"].get(size, {}).get("scenarios", {})
+        for name, stats in data["scenarios"].items():
+            if name not in before:
+                continue
+            old, cur = before[name]["median"], stats["median"]
+            change = (cur - old) / old if old > 0 else 0.0
+            estado = "REGRESIÓN" if change > threshold else "MEJORA" if change < -threshold else "="
+            rows.append({"size": size, "scenario": name, "antes": old, "despues": cur, "cambio": change, "estado": estado})
+    return rows
+
+
+def print_comparison(rows: List[Dict], base: Dict, new: Dict):
+    print(f"{base['meta'].get('commit') or '?'} -> {new['meta'].get('commit') or '?'}")
+    print(f"{'tamaño':<8} {'escenario':<22} {'antes':>11} {'después':>11} {'cambio':>8}")
+    for r in rows:
+        print(f"{r['size']:<8} {r['scenario']:<22} {r['antes'] * 1000:>9.2f}ms {r['despues'] * 1000:>9.2f}ms "
+              f"{r['cambio'] * 100:>+7.1f}% {r['estado']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Generar las bases y medir")
+    p_run.add_argument("--sizes", nargs="+", choices=list(SIZES), default=DEFAULT_SIZES)
+    p_run.add_argument("--seed", type=int, default=42)
+    p_run.add_argument("--repeat", type=int, default=5)
+    p_run.add_argument("--only", nargs="+", help="Sólo estos escenarios")
+    p_run.add_argument("--latency", type=float, default=0.0, help="Latencia simulada de Yahoo (segundos)")
+    p_run.add_argument("-o", "--output", help="Archivo JSON (default: benchmarks/results/<commit>.json)")
+    p_run.add_argument("--baseline", help="JSON previo contra el que comparar al terminar")
+    p_run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    p_cmp = sub.add_parser("compare", help="Comparar dos resultados JSON")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    p_cmp.add_argument("--fail-on-regression", action="store_true", help="Salir con código 1 si hay regresiones")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare(base, new, args.threshold)
+        print_comparison(rows, base, new)
+        if args.fail_on_regression and any(r["estado"] == "REGRESIÓN" for r in rows):
+            sys.exit(1)
+        return
+
+    result = run(args.sizes, args.seed, args.repeat, args.only, args.latency)
+    output = args.output or os.path.join(RESULTS_DIR, f"{result['meta']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Resultados en {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        print_comparison(compare(base, result, args.threshold), base, result)
+
+
+if __name__ == "__main__":
+    main()
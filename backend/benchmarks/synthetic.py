@@ -0,0 +1,159 @@
+"""
+Generador sembrado de portafolios sintéticos para benchmarks.
+
+Misma semilla -> misma base: trades coherentes (nunca se vende más de lo que hay),
+comisiones, dividendos, fondeos del broker y movimientos de billetera en USD/UYU.
+Las tablas derivadas (Asset, checkpoints, lotes, ledger de caja) se construyen con
+los mismos motores que usa la app, así la base queda igual que una real.
+
+Uso como librería:
+    from testing import memory_engine
+    engine = memory_engine()
+    with Session(engine) as session:
+        generate(session, assets=200, trades=20_000, transactions=10_000)
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from models.models import BrokerCash, BrokerSettings, Transaction, TradeHistory
+from services.cash_ledger import CashLedger
+from services.lot_engine import LotEngine
+from services.position_engine import PositionEngine
+
+BASE = datetime(2015, 1, 1)
+INSERT_BATCH = 5000
+
+CATEGORIAS_INGRESO = ["Sueldo", "Freelance", "Intereses", "Venta"]
+CATEGORIAS_GASTO = ["Supermercado", "Alquiler", "Servicios", "Transporte", "Salidas", "Salud"]
+
+
+@dataclass(frozen=True)
+class Size:
+    name: str
+    assets: int
+    trades: int
+    transactions: int
+
+
+SIZES: Dict[str, Size] = {s.name: s for s in (
+    Size("small", 20, 1_000, 500),
+    Size("medium", 100, 10_000, 5_000),
+    Size("large", 500, 100_000, 50_000),
+)}
+
+
+def ticker_name(i: int) -> str:
+    return f"SYN{i:04d}"
+
+
+def base_price(i: int, seed: int = 42) -> int:
+    """Precio de referencia (CENTS) del ticker i, estable para una semilla."""
+    return random.Random(seed * 100_003 + i).randint(1_000, 60_000)
+
+
+def make_trades(assets: int, trades: int, seed: int = 42) -> List[Dict]:
+    """
+    Historial de trading: ~65% compras, ~25% ventas, ~5% dividendos y el resto fondeos.
+    Precios con caminata aleatoria por ticker; cantidades fraccionales.
+    """
+    rng = random.Random(seed)
+    shares = [0.0] * assets
+    prices = [float(base_price(i, seed)) for i in range(assets)]
+    step = timedelta(minutes=max(1, (10 * 365 * 24 * 60) // max(trades, 1)))
+    rows = []
+    for n in range(trades):
+        fecha = BASE + step * n
+        r = rng.random()
+        if r < 0.05:
+            monto = rng.randint(10_000, 500_000)
+            tipo = "DEPOSIT" if rng.random() < 0.8 else "WITHDRAW"
+            rows.append({"ticker": "CASH", "tipo": tipo, "cantidad": 1.0, "precio": monto, "total": monto,
+                         "commission": 0, "fecha": fecha})
+            continue
+
+        i = rng.randrange(assets)
+        prices[i] = max(100.0, prices[i] * (1 + rng.gauss(0, 0.01)))
+        precio = int(round(prices[i]))
+        if r < 0.10 and shares[i] > 0:
+            monto = int(round(shares[i] * precio * 0.005))
+            rows.append({"ticker": ticker_name(i), "tipo": "DIVIDEND", "cantidad": 0.0, "precio": monto,
+                         "total": monto, "commission": 0, "fecha": fecha})
+            continue
+
+        qty = round(rng.uniform(0.05, 10.0), 5)
+        tipo = "SELL" if r > 0.75 and shares[i] > qty else "BUY"
+        shares[i] += qty if tipo == "BUY" else -qty
+        commission = 100 if qty.is_integer() else rng.randint(0, 150)
+        rows.append({"ticker": ticker_name(i), "tipo": tipo, "cantidad": qty, "precio": precio,
+                     "total": int(round(qty * precio)), "commission": commission, "fecha": fecha})
+    return rows
+
+
+def make_transactions(transactions: int, seed: int = 42) -> List[Dict]:
+    """Movimientos de billetera: ~30% ingresos, el resto gastos; ~60% en UYU."""
+    rng = random.Random(seed + 1)
+    step = timedelta(minutes=max(1, (10 * 365 * 24 * 60) // max(transactions, 1)))
+    rows = []
+    for n in range(transactions):
+        ingreso = rng.random() < 0.3
+        moneda = "UYU" if rng.random() < 0.6 else "USD"
+        escala = 40 if moneda == "UYU" else 1
+        monto = rng.randint(500, 300_000 if ingreso else 50_000) * escala
+        rows.append({
+            "tipo": "ingreso" if ingreso else "gasto",
+            "monto": monto,
+            "moneda": moneda,
+            "categoria": rng.choice(CATEGORIAS_INGRESO if ingreso else CATEGORIAS_GASTO),
+            "fecha": BASE + step * n,
+        })
+    return rows
+
+
+def make_snapshot(assets: int, seed: int = 42) -> List[Dict]:
+    """Snapshot del broker en el formato de /api/portfolio/import."""
+    rng = random.Random(seed + 2)
+    return [
+        {"Ticker": ticker_name(i), "Cantidad_Total": round(rng.uniform(0.01, 200.0), 5),
+         "Precio_Promedio": base_price(i, seed) / 100.0}
+        for i in range(assets)
+    ]
+
+
+def _bulk_insert(session: Session, model, rows: List[Dict]):
+    for start in range(0, len(rows), INSERT_BATCH):
+        session.execute(insert(model), rows[start:start + INSERT_BATCH])
+
+
+def generate(session: Session, assets: int, trades: int, transactions: int, seed: int = 42,
+             lot_method: str = "AVERAGE") -> Dict[str, int]:
+    """
+    Llena la base con un portafolio sintético y construye las tablas derivadas.
+    Los precios cacheados quedan frescos: los benchmarks de lectura no descargan nada.
+    """
+    trade_rows = make_trades(assets, trades, seed)
+    _bulk_insert(session, TradeHistory, trade_rows)
+    _bulk_insert(session, Transaction, make_transactions(transactions, seed))
+
+    session.add(BrokerSettings(id=1, default_fee_integer=100, default_fee_fractional=50, lot_method=lot_method))
+    flujo = sum(
+        -(r["total"] + r["commission"]) if r["tipo"] == "BUY"
+        else r["total"] - r["commission"] if r["tipo"] in ("SELL", "DIVIDEND", "DEPOSIT")
+        else -r["total"]
+        for r in trade_rows
+    )
+    session.add(BrokerCash(id=1, saldo_usd=max(flujo, 0)))
+
+    tickers = sorted({r["ticker"] for r in trade_rows if r["ticker"] != "CASH"})
+    now = datetime.now()
+    for asset in PositionEngine.rebuild(session, tickers, commit=False).values():
+        asset.cached_price = base_price(int(asset.ticker[3:]), seed)
+        asset.last_updated = now
+    LotEngine.recompute(session, tickers, commit=False)
+    CashLedger.rebuild(session)
+    session.commit()
+    return {"assets": len(tickers), "trades": len(trade_rows), "transactions": transactions}
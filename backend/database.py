@@ -5,6 +5,32 @@ import os # <--- Importante
 # Si no existe, usamos SQLite (Configuración local de respaldo)
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///financial.db")
 
+# Pool de conexiones (PostgreSQL): tamaño, overflow, pre-ping y reciclado por entorno
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") != "0"
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # segundos
+
+# Modo async opcional (DB_ASYNC=1): rutas de lectura con AsyncSession (asyncpg / aiosqlite)
+DB_ASYNC = os.environ.get("DB_ASYNC", "0") == "1"
+
+def pool_options(url: str) -> dict:
+    if "sqlite" in url:
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+def to_async_url(url: str) -> str:
+    """sqlite:// -> sqlite+aiosqlite://, postgresql:// (o +psycopg2) -> postgresql+asyncpg://"""
+    scheme, rest = url.split("://", 1)
+    driver = {"sqlite": "sqlite+aiosqlite", "postgres": "postgresql+asyncpg", "postgresql": "postgresql+asyncpg",
+              "postgresql+psycopg2": "postgresql+asyncpg"}.get(scheme, scheme)
+    return f"{driver}://{rest}"
+
 # 2. Configuración del Engine
 if "sqlite" in DATABASE_URL:
     # Configuración específica para SQLite
@@ -14,11 +40,27 @@ if "sqlite" in DATABASE_URL:
     )
 else:
     # Configuración para PostgreSQL
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+
+async_engine = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    async_engine = create_async_engine(to_async_url(DATABASE_URL), **pool_options(DATABASE_URL))
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    if async_engine is None:
+        raise RuntimeError("Modo async desactivado (DB_ASYNC=1 para habilitarlo)")
+    # expire_on_commit=False: en async no se puede recargar un atributo expirado de forma implícita
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    SQLModel.metadata.create_all(engine)
+    # Índices / pasos de esquema sobre tablas que ya existían (create_all no los agrega)
+    from migrations import run_migrations
+    run_migrations(engine)
\ No newline at end of file
@@ -1,7 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from database import create_db_and_tables
-from routers import transactions, portfolio, dashboard, settings, trading, market
+from database import DB_ASYNC, async_engine, create_db_and_tables
+from services.fx_service import fx_service
+from services.metrics import HTTP_SECONDS
+from services.price_refresher import price_refresher
+import os
+import time
+from routers import transactions, portfolio, dashboard, settings, trading, market, metrics, accounts
 
 app = FastAPI(title="Financial OS Backend")
 
@@ -12,19 +17,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Paginación de /api/trade/history
 )
 
+@app.middleware("http")
+async def medir_latencia(request: Request, call_next):
+    # Latencia por ruta (plantilla, no path concreto: /api/market/history/{ticker})
+    # En respuestas en streaming mide hasta que empieza el cuerpo
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route is not None else "sin_ruta",
+            status=status,
+        )
+
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    # Pre-calentamos la cotización para que el primer dashboard no espere a dolarapi
+    fx_service.refresh_async()
+    # Refresco de precios fuera del camino de los requests (PRICE_REFRESHER=0 lo desactiva)
+    if os.environ.get("PRICE_REFRESHER", "1") != "0":
+        price_refresher.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    price_refresher.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 # Conectar rutas
+if DB_ASYNC:
+    # Rutas de lectura async: registradas primero para que reemplacen a las sync
+    from routers import async_api
+    app.include_router(async_api.router)
 app.include_router(transactions.router)
 app.include_router(portfolio.router)
 app.include_router(dashboard.router)
 app.include_router(settings.router)
 app.include_router(trading.router)
 app.include_router(market.router)
+app.include_router(metrics.router)
+app.include_router(accounts.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,124 +1,249 @@
 # backend/migrate_to_postgres.py
+"""
+Migración de datos SQLite -> PostgreSQL, por bloques y reanudable.
+
+    python migrate_to_postgres.py                          # financial.db -> $DATABASE_URL
+    python migrate_to_postgres.py --source sqlite:///otra.db --chunk-size 20000 --workers 4
+    python migrate_to_postgres.py --fresh                  # vacía el destino y empieza de cero
+
+- Cada tabla se lee en orden de clave primaria con un cursor en streaming (no se cargan
+  tablas enteras en memoria) y se escribe por bloques: COPY en Postgres, executemany en el resto.
+- Las tablas no tienen FKs entre sí: se migran en paralelo (--workers).
+- Cada bloque se commitea en el destino; si se corta, volver a correrlo retoma cada tabla
+  después de la última clave primaria que ya está en el destino.
+- Se conservan todas las columnas (ids, commission, ...). Las que falten en una DB vieja se
+  completan con el default del modelo.
+- Los datos derivados (ledger de caja, checkpoints, patrimonio diario) no se copian: se reconstruyen.
+"""
+import argparse
+import io
 import os
-from sqlmodel import SQLModel, create_engine, Session, select, text
-from models.models import Asset, Transaction, BrokerCash, TradeHistory
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
 
-# 1. Configuración
-SQLITE_FILE = "financial.db"
-sqlite_url = f"sqlite:///{SQLITE_FILE}"
-engine_sqlite = create_engine(sqlite_url)
+from sqlalchemy import Table, delete, func, inspect, insert, select, text, tuple_
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlmodel import Session, SQLModel, create_engine
 
-postgres_url = os.environ.get("DATABASE_URL")
-if not postgres_url:
-    raise ValueError("❌ No se encontró DATABASE_URL.")
+from models.models import CashBalance, NetWorthPoint, PositionCheckpoint
+from services.cash_ledger import CashLedger
 
-engine_postgres = create_engine(postgres_url)
+DEFAULT_SOURCE = "sqlite:///financial.db"
+CHUNK_SIZE = 5000
+WORKERS = 4
 
-def migrate():
-    print("🚀 Iniciando migración de datos: SQLite -> PostgreSQL")
-    
-    if not os.path.exists(SQLITE_FILE):
-        print(f"❌ Error: No encuentro '{SQLITE_FILE}' dentro del contenedor.")
-        return
+# Derivadas: se reconstruyen en el destino en lugar de copiarse
+DERIVED_TABLES = {CashBalance.__tablename__, PositionCheckpoint.__tablename__, NetWorthPoint.__tablename__}
+
+
+class Progress:
+    """Avance por tabla, impreso a medida que se commitea cada bloque (thread-safe)."""
+
+    def __init__(self, totals: Dict[str, int]):
+        self._lock = threading.Lock()
+        self.totals = totals
+        self.done = {name: 0 for name in totals}
+        self.started = time.perf_counter()
+
+    def advance(self, name: str, rows: int):
+        with self._lock:
+            self.done[name] += rows
+            done, total = self.done[name], self.totals[name]
+            pct = 100 * done / total if total else 100
+            elapsed = time.perf_counter() - self.started
+            all_done = sum(self.done.values())
+            print(f"   {name:<18} {done:>10,}/{total:<10,} ({pct:5.1f}%)  ~{all_done / elapsed:,.0f} filas/s", flush=True)
+
+
+def model_defaults(table: Table) -> Dict[str, object]:
+    """Defaults del modelo SQLModel para cada columna (columnas que una DB vieja no tiene)."""
+    model = next(m.class_ for m in SQLModel._sa_registry.mappers if m.local_table is table)
+    defaults = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None:
+            defaults[name] = field.default_factory()
+        elif not field.is_required():
+            defaults[name] = field.default
+    return defaults
+
+
+def tables_to_migrate(source: Engine, only: Optional[Sequence[str]] = None) -> List[Table]:
+    existing = set(inspect(source).get_table_names())
+    tables = [
+        t for t in SQLModel.metadata.sorted_tables
+        if t.name in existing and t.name not in DERIVED_TABLES
+    ]
+    if only:
+        tables = [t for t in tables if t.name in only]
+    return tables
+
+
+def resume_key(dest: Connection, table: Table) -> Optional[tuple]:
+    """Última clave primaria ya migrada (el destino se llena en orden de PK)."""
+    pk = list(table.primary_key.columns)
+    row = dest.execute(select(*pk).order_by(*[c.desc() for c in pk]).limit(1)).first()
+    return tuple(row) if row else None
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""  # NULL en COPY ... (FORMAT csv)
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_rows(dest: Connection, table: Table, columns: List[str], rows: List[tuple]):
+    """COPY FROM STDIN (psycopg2) dentro de la transacción de `dest`."""
+    quote = dest.dialect.identifier_preparer.quote
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_csv_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cols = ", ".join(quote(c) for c in columns)
+    cursor = dest.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {quote(table.name)} ({cols}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def migrate_table(source: Engine, dest: Engine, table: Table, chunk_size: int, progress: Progress) -> int:
+    """Copia las filas de `table` que el destino todavía no tiene. Devuelve cuántas copió."""
+    source_columns = {c["name"] for c in inspect(source).get_columns(table.name)}
+    read_columns = [c for c in table.columns if c.name in source_columns]
+    missing = [c.name for c in table.columns if c.name not in source_columns]
+    defaults = model_defaults(table)
+    fill = tuple(defaults.get(name) for name in missing)
+    columns = [c.name for c in read_columns] + missing
+    use_copy = dest.dialect.name == "postgresql"
+
+    pk = list(table.primary_key.columns)
+    with dest.connect() as conn:
+        last = resume_key(conn, table)
 
-    # Crear tablas limpias en Postgres
-    print("🔧 Creando tablas en Postgres...")
-    SQLModel.metadata.create_all(engine_postgres)
-
-    with Session(engine_sqlite) as src, Session(engine_postgres) as dest:
-        
-        # --- 1. MIGRAR CASH FLOW (TRANSACTIONS) ---
-        print("\n💸 Migrando Transacciones (Cash Flow)...")
-        try:
-            txs = src.exec(select(Transaction)).all()
-            print(f"   -> Encontradas {len(txs)} transacciones.")
-            for t in txs:
-                new_tx = Transaction(
-                    tipo=t.tipo,
-                    monto=t.monto,
-                    moneda=t.moneda,
-                    categoria=t.categoria,
-                    fecha=t.fecha
-                )
-                dest.add(new_tx)
-        except Exception as e:
-            print(f"   ⚠️ No se pudieron migrar transacciones (quizás la tabla no existía): {e}")
-        
-        # --- 2. MIGRAR PORTAFOLIO (ASSETS) - CORREGIDO CON SQL PURO ---
-        print("\n📈 Migrando Portafolio (Assets)...")
-        try:
-            # USAMOS SQL PURO PARA LEER SOLO LAS COLUMNAS QUE EXISTEN
-            # Esto evita el error "no such column: cached_price"
-            query = text("SELECT ticker, cantidad_total, precio_promedio FROM asset")
-            results = src.connection().execute(query)
-            
-            count = 0
-            for row in results:
-                new_asset = Asset(
-                    ticker=row.ticker,
-                    cantidad_total=row.cantidad_total,
-                    precio_promedio=row.precio_promedio,
-
-                    # Los campos nuevos los ponemos vacíos para Postgres
-                    cached_price=None,
-                    last_updated=None
-                )
-                dest.add(new_asset)
-                count += 1
-            print(f"   -> Encontrados {count} activos.")
-            
-        except Exception as e:
-            print(f"   ⚠️ Error migrando Assets: {e}")
-
-        # --- 3. MIGRAR CAJA BROKER ---
-        print("\n💰 Migrando Caja del Broker...")
-        try:
-            # Intentamos leer con ORM, si falla (porque no existe tabla), ignoramos
-            cash_query = text("SELECT id, saldo_usd FROM brokercash WHERE id = 1")
-            cash_res = src.connection().execute(cash_query).first()
-            
-            if cash_res:
-                print(f"   -> Saldo encontrado: ${cash_res.saldo_usd}")
-                existing_cash = dest.get(BrokerCash, 1)
-                if existing_cash:
-                    existing_cash.saldo_usd = cash_res.saldo_usd
-                    dest.add(existing_cash)
+    query = select(*read_columns).order_by(*pk)
+    if last is not None:
+        query = query.where(pk[0] > last[0] if len(pk) == 1 else tuple_(*pk) > tuple_(*last))
+
+    copied = 0
+    with source.connect() as src:
+        # Cursor en streaming: el driver entrega las filas de a `chunk_size`
+        result = src.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for chunk in result.partitions():
+            rows = [tuple(row) + fill for row in chunk]
+            with dest.begin() as conn:
+                if use_copy:
+                    copy_rows(conn, table, columns, rows)
                 else:
-                    new_cash = BrokerCash(id=1, saldo_usd=cash_res.saldo_usd)
-                    dest.add(new_cash)
-            else:
-                print("   -> No se encontró saldo previo, se usará $0.0 por defecto.")
-        except Exception:
-            print("   -> Tabla BrokerCash no existía en la versión vieja. Se creará nueva.")
-
-        # --- 4. MIGRAR HISTORIAL ---
-        print("\n📜 Migrando Historial de Trading...")
-        try:
-            # Igual que assets, usamos SQL puro por seguridad
-            hist_query = text("SELECT ticker, tipo, cantidad, precio, total, fecha, ganancia_realizada FROM tradehistory")
-            hist_results = src.connection().execute(hist_query)
-            
-            h_count = 0
-            for th in hist_results:
-                new_th = TradeHistory(
-                    ticker=th.ticker,
-                    tipo=th.tipo,
-                    cantidad=th.cantidad,
-                    precio=th.precio,
-                    total=th.total,
-                    fecha=datetime.fromisoformat(str(th.fecha)) if isinstance(th.fecha, str) else th.fecha,
-                    ganancia_realizada=th.ganancia_realizada
-                )
-                dest.add(new_th)
-                h_count += 1
-            print(f"   -> Encontradas {h_count} operaciones históricas.")
-        except Exception:
-             print("   -> Tabla TradeHistory no existía en la versión vieja. Se creará vacía.")
-
-        print("\n💾 Guardando cambios en PostgreSQL...")
-        dest.commit()
-        print("✅ ¡MIGRACIÓN COMPLETADA! 🎉")
+                    conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+            copied += len(rows)
+            progress.advance(table.name, len(rows))
+    return copied
+
+
+def reset_sequences(dest: Engine, tables: List[Table]):
+    """Ids copiados a mano: las secuencias de Postgres tienen que seguir desde el máximo."""
+    if dest.dialect.name != "postgresql":
+        return
+    quote = dest.dialect.identifier_preparer.quote
+    with dest.begin() as conn:
+        for table in tables:
+            pk = list(table.primary_key.columns)
+            if len(pk) != 1 or not pk[0].autoincrement or pk[0].type.python_type is not int:
+                continue
+            name, col = quote(table.name), quote(pk[0].name)
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', '{pk[0].name}'), "
+                f"COALESCE(MAX({col}), 1), MAX({col}) IS NOT NULL) FROM {name}"
+            ))
+
+
+def migrate(source_url: str, dest_url: str, chunk_size: int = CHUNK_SIZE, workers: int = WORKERS,
+            only: Optional[Sequence[str]] = None, fresh: bool = False) -> Dict[str, int]:
+    """Migra todas las tablas y reconstruye lo derivado. Devuelve las filas copiadas por tabla."""
+    print(f"🚀 Migrando datos: {source_url} -> {make_url(dest_url).render_as_string(hide_password=True)}")
+    connect_args = {"check_same_thread": False} if source_url.startswith("sqlite") else {}
+    source = create_engine(source_url, connect_args=connect_args)
+    # Una conexión por hilo (+1 para el control)
+    dest = create_engine(dest_url) if dest_url.startswith("sqlite") else create_engine(dest_url, pool_size=workers + 1)
+
+    try:
+        print("🔧 Creando tablas en el destino...")
+        SQLModel.metadata.create_all(dest)
+
+        tables = tables_to_migrate(source, only)
+        if fresh:
+            with dest.begin() as conn:
+                for table in tables + [CashBalance.__table__, PositionCheckpoint.__table__, NetWorthPoint.__table__]:
+                    conn.execute(delete(table))
+
+        with source.connect() as src, dest.connect() as dst:
+            totals = {
+                t.name: src.execute(select(func.count()).select_from(t)).scalar_one()
+                for t in tables
+            }
+            already = {
+                t.name: dst.execute(select(func.count()).select_from(t)).scalar_one()
+                for t in tables
+            }
+        progress = Progress(totals)
+        progress.done.update(already)
+        pending = [t for t in tables if already[t.name] < totals[t.name]]
+        for t in tables:
+            if t not in pending:
+                print(f"   {t.name:<18} ya migrada ({totals[t.name]:,} filas)")
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {t.name: pool.submit(migrate_table, source, dest, t, chunk_size, progress) for t in pending}
+            copied = {name: f.result() for name, f in futures.items()}
+
+        reset_sequences(dest, tables)
+
+        print("\n💰 Reconstruyendo ledger de caja...")
+        with Session(dest) as session:
+            CashLedger.rebuild(session)
+            session.commit()
+
+        with dest.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+        elapsed = time.perf_counter() - progress.started
+        print(f"✅ ¡MIGRACIÓN COMPLETADA! {sum(copied.values()):,} filas en {elapsed:.1f}s 🎉")
+        return copied
+    finally:
+        source.dispose()
+        dest.dispose()
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help=f"DB de origen (default {DEFAULT_SOURCE})")
+    parser.add_argument("--dest", default=os.environ.get("DATABASE_URL"), help="DB de destino (default $DATABASE_URL)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Tablas migradas en paralelo")
+    parser.add_argument("--tables", help="Sólo estas tablas (separadas por coma)")
+    parser.add_argument("--fresh", action="store_true", help="Vaciar las tablas del destino antes de copiar")
+    args = parser.parse_args(argv)
+
+    if not args.dest:
+        parser.error("❌ No se encontró DATABASE_URL (o --dest).")
+    if args.source.startswith("sqlite:///") and not os.path.exists(args.source[len("sqlite:///"):]):
+        sys.exit(f"❌ Error: No encuentro '{args.source[len('sqlite:///'):]}'.")
+
+    migrate(
+        args.source, args.dest,
+        chunk_size=args.chunk_size, workers=args.workers,
+        only=args.tables.split(",") if args.tables else None, fresh=args.fresh,
+    )
+
 
 if __name__ == "__main__":
-    from datetime import datetime # Import local para evitar conflictos arriba
-    migrate()
\ No newline at end of file
+    main()
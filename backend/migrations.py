@@ -0,0 +1,126 @@
+"""
+Migraciones de esquema in-place (SQLite y Postgres).
+
+create_all() sólo crea tablas nuevas: no agrega índices ni columnas a tablas que
+ya existen. Este módulo completa lo que falte sobre una DB existente:
+- Índices declarados en los modelos (__table_args__ / Field(index=True)).
+- Pasos con nombre (MIGRATIONS), aplicados una sola vez y registrados en SchemaMigration.
+
+Se ejecuta en cada arranque (create_db_and_tables) y también a mano:
+    python migrations.py          # usa DATABASE_URL (o sqlite:///financial.db)
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+from models.models import DEFAULT_ACCOUNT_ID, Account, SchemaMigration, TradeHistory
+
+def add_column(table: str, column: str, ddl: str) -> Callable[[Connection], None]:
+    """Paso que agrega una columna si falta (en una DB nueva create_all ya la creó)."""
+    def step(conn: Connection):
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+def drop_index(table: str, name: str) -> Callable[[Connection], None]:
+    """Paso que borra un índice reemplazado (si existe; sync_indexes crea los nuevos)."""
+    def step(conn: Connection):
+        if name in {ix["name"] for ix in inspect(conn).get_indexes(table)}:
+            conn.execute(text(f"DROP INDEX {name}"))
+    return step
+
+
+def create_default_account(conn: Connection):
+    """Cuenta a la que pertenecen los datos previos a multi-cuenta (account_id = 1)."""
+    if conn.execute(select(Account.id).where(Account.id == DEFAULT_ACCOUNT_ID)).first() is None:
+        if conn.execute(select(Account.id).limit(1)).first() is None:
+            # Sin id explícito: en Postgres la secuencia queda en 1
+            conn.execute(insert(Account).values(nombre="Principal", creada=datetime.now()))
+        else:
+            conn.execute(insert(Account).values(id=DEFAULT_ACCOUNT_ID, nombre="Principal", creada=datetime.now()))
+
+
+def mark_imported_snapshots(conn: Connection):
+    """
+    Saldos importados antes de existir importado_en (BUY a SNAPSHOT_DATE con ganancia 0):
+    su cantidad ya refleja las acciones corporativas hasta hoy, se marcan como importados ahora
+    (y sin movimiento de caja del broker).
+    """
+    from services.import_service import SNAPSHOT_DATE
+
+    trades = TradeHistory.__table__
+    conn.execute(
+        update(trades)
+        .where(trades.c.importado_en.is_(None), trades.c.tipo == "BUY", trades.c.fecha == SNAPSHOT_DATE,
+               trades.c.ganancia_realizada == 0)
+        .values(importado_en=datetime.now(), usar_caja_broker=False)
+    )
+
+
+# (nombre, paso): se aplican en orden, dentro de la misma transacción que su registro
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("brokersettings_lot_method", add_column("brokersettings", "lot_method", "VARCHAR NOT NULL DEFAULT 'AVERAGE'")),
+    # Multi-cuenta: lo existente queda en la cuenta 1; BrokerCash/BrokerSettings ya usan id = cuenta
+    ("account_default", create_default_account),
+    ("asset_account_id", add_column("asset", "account_id", f"INTEGER NOT NULL DEFAULT {DEFAULT_ACCOUNT_ID}")),
+    ("tradehistory_account_id", add_column("tradehistory", "account_id", f"INTEGER NOT NULL DEFAULT {DEFAULT_ACCOUNT_ID}")),
+    # ix_asset_ticker era UNIQUE: el mismo ticker puede estar en varias cuentas (índice (account_id, ticker))
+    ("asset_drop_ticker_unique", drop_index("asset", "ix_asset_ticker")),
+    # Acciones corporativas: dividendos (cobrados o estimados) por posición
+    ("asset_dividendos", add_column("asset", "dividendos", "INTEGER NOT NULL DEFAULT 0")),
+    # Saldos importados: las acciones corporativas anteriores a la importación no se reaplican
+    ("tradehistory_importado_en", add_column("tradehistory", "importado_en", "TIMESTAMP")),
+    # Patrimonio diario: sólo los trades que movieron la caja del broker cuentan en ella
+    ("tradehistory_usar_caja_broker", add_column("tradehistory", "usar_caja_broker", "BOOLEAN NOT NULL DEFAULT TRUE")),
+    ("tradehistory_mark_imported_snapshots", mark_imported_snapshots),
+]
+
+
+def sync_indexes(conn: Connection) -> List[str]:
+    """Crea los índices de los modelos que falten en tablas existentes. Devuelve los creados."""
+    inspector = inspect(conn)
+    created = []
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                print(f"Migración: creando índice {index.name}")
+                index.create(conn)
+                created.append(index.name)
+    return created
+
+
+def run_migrations(engine: Engine) -> List[str]:
+    """Aplica pasos pendientes e índices faltantes. Devuelve lo aplicado (para logs/tests)."""
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    applied: List[str] = []
+
+    with engine.begin() as conn:
+        done = set(conn.execute(select(SchemaMigration.nombre)).scalars())
+        for nombre, step in MIGRATIONS:
+            if nombre in done:
+                continue
+            print(f"Migración: aplicando {nombre}")
+            step(conn)
+            conn.execute(insert(SchemaMigration).values(nombre=nombre, aplicada=datetime.now()))
+            applied.append(nombre)
+
+        created = sync_indexes(conn)
+        if created:
+            # Estadísticas al día para que el planner elija los índices nuevos
+            conn.execute(text("ANALYZE"))
+        applied.extend(created)
+
+    return applied
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    SQLModel.metadata.create_all(engine)
+    result = run_migrations(engine)
+    print(f"Migraciones aplicadas: {result}" if result else "Esquema al día.")
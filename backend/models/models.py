@@ -1,10 +1,26 @@
 # backend/models/models.py
 from typing import Optional
 from sqlmodel import Field, SQLModel
-from datetime import datetime
+from sqlalchemy import Index
+from datetime import date, datetime
+
+# Cuenta a la que van los datos que no indican una (y todos los de antes de multi-cuenta)
+DEFAULT_ACCOUNT_ID = 1
+
+# --- CUENTAS DE BROKER ---
+class Account(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    nombre: str = Field(unique=True)
+    broker: Optional[str] = None  # Informativo (ej: "Interactive Brokers")
+    creada: datetime = Field(default_factory=datetime.now)
 
 # --- CASH FLOW (Tus gastos personales diarios) ---
 class Transaction(SQLModel, table=True):
+    __table_args__ = (
+        # /api/movimientos ordena por (fecha, id) descendente
+        Index("ix_transaction_fecha_id", "fecha", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     tipo: str       # "ingreso" | "gasto"
     monto: int      # CENTS: 10050 = $100.50
@@ -14,8 +30,14 @@ class Transaction(SQLModel, table=True):
 
 # --- PORTAFOLIO (Tus Activos Actuales) ---
 class Asset(SQLModel, table=True):
+    __table_args__ = (
+        # Una posición por ticker en cada cuenta (el mismo ticker puede estar en varias)
+        Index("ix_asset_account_ticker", "account_id", "ticker", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    ticker: str = Field(index=True, unique=True)
+    account_id: int = Field(default=DEFAULT_ACCOUNT_ID)
+    ticker: str
     cantidad_total: float      # FLOAT: Cantidad de acciones (puede ser fraccional)
     precio_promedio: int       # CENTS: Precio promedio de compra
     
@@ -23,20 +45,41 @@ class Asset(SQLModel, table=True):
     cached_price: Optional[int] = Field(default=None) # CENTS: Precio actual de mercado
     last_updated: Optional[datetime] = Field(default=None)
 
-# --- CONFIGURACIÓN DE BROKER (Singleton) ---
+    # Dividendos de la posición (CENTS): los registrados (TradeHistory DIVIDEND) o, si no hay, los estimados
+    # con las acciones corporativas (dividendo por acción x acciones al ex-date). Ver PositionEngine
+    dividendos: int = Field(default=0)
+
+# --- CONFIGURACIÓN DE BROKER (Una fila por cuenta: id = Account.id) ---
 class BrokerSettings(SQLModel, table=True):
-    id: int = Field(default=1, primary_key=True)
+    id: int = Field(default=DEFAULT_ACCOUNT_ID, primary_key=True)
     default_fee_integer: int = Field(default=0)    # CENTS: Costo por acción entera
     default_fee_fractional: int = Field(default=0) # CENTS: Costo por fracción
+    lot_method: str = Field(default="AVERAGE")     # FIFO | LIFO | AVERAGE (P&L realizado, ver LotEngine)
 
-# --- CAJA DEL BROKER (Dinero listo para invertir) ---
+# --- SALDOS DE LA BILLETERA (Ledger materializado de Transaction) ---
+class CashBalance(SQLModel, table=True):
+    """Saldo acumulado por moneda (ingresos - gastos), mantenido en cada alta de Transaction."""
+    moneda: str = Field(primary_key=True)  # "USD" | "UYU"
+    saldo: int = Field(default=0)          # CENTS
+    actualizado: datetime = Field(default_factory=datetime.now)
+
+# --- CAJA DEL BROKER (Dinero listo para invertir, una fila por cuenta: id = Account.id) ---
 class BrokerCash(SQLModel, table=True):
-    id: int = Field(default=1, primary_key=True)
+    id: int = Field(default=DEFAULT_ACCOUNT_ID, primary_key=True)
     saldo_usd: int = Field(default=0) # CENTS
 
 # --- HISTORIAL DE TRADING (Compras y Ventas) ---
 class TradeHistory(SQLModel, table=True):
+    __table_args__ = (
+        # Replay de posiciones y /api/trading/history/{ticker}: filtro por (cuenta, ticker), orden por (fecha, id)
+        Index("ix_tradehistory_account_ticker_fecha", "account_id", "ticker", "fecha", "id"),
+        # /api/trade/history (keyset sobre fecha, id), de todas las cuentas o de una
+        Index("ix_tradehistory_fecha_id", "fecha", "id"),
+        Index("ix_tradehistory_account_fecha", "account_id", "fecha", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    account_id: int = Field(default=DEFAULT_ACCOUNT_ID)
     ticker: str
     tipo: str       # "BUY" | "SELL" | "DIVIDEND" | "DEPOSIT" | "WITHDRAW"
     cantidad: float # Positivo
@@ -48,4 +91,97 @@ class TradeHistory(SQLModel, table=True):
     ganancia_realizada: Optional[int] = None # CENTS
     
     # Costo de la operación
-    commission: int = Field(default=0) # CENTS
\ No newline at end of file
+    commission: int = Field(default=0) # CENTS
+
+    # Si el trade movió la caja del broker (usar_caja_broker); los saldos importados no la mueven
+    usar_caja_broker: bool = Field(default=True)
+
+    # Sólo saldos importados (snapshot): cuándo se importaron. La cantidad ya refleja los
+    # splits y dividendos hasta ese momento; el replay no se los vuelve a aplicar a esta fila
+    importado_en: Optional[datetime] = None
+
+# --- CHECKPOINTS DE POSICIÓN (Replay incremental) ---
+class PositionCheckpoint(SQLModel, table=True):
+    """
+    Estado (acciones, costo base) de un ticker de una cuenta justo después de aplicar el trade `trade_id`.
+    Permite reproducir sólo la cola del historial en lugar de todo desde cero.
+    """
+    __table_args__ = (
+        Index("ix_positioncheckpoint_account_ticker_fecha", "account_id", "ticker", "fecha", "trade_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    account_id: int = Field(default=DEFAULT_ACCOUNT_ID)
+    ticker: str
+    trade_id: int      # Último TradeHistory.id incluido en el estado
+    fecha: datetime    # Fecha de ese trade (orden del replay: fecha, id)
+    cantidad: float    # Acciones acumuladas
+    costo_base: float  # CENTS (float para no perder precisión entre trades)
+    dividendos: float = Field(default=0.0)            # CENTS registrados (TradeHistory DIVIDEND)
+    dividendos_estimados: float = Field(default=0.0)  # CENTS según CorporateAction
+
+
+# --- ACCIONES CORPORATIVAS (Splits y dividendos de Yahoo, caché local) ---
+class CorporateAction(SQLModel, table=True):
+    __table_args__ = (
+        # Replay: acciones de un ticker ordenadas por fecha; también evita duplicados al sincronizar
+        Index("ix_corporateaction_ticker_fecha_tipo", "ticker", "fecha", "tipo", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ticker: str        # En mayúsculas
+    tipo: str          # "SPLIT" | "DIVIDEND"
+    fecha: datetime    # Ex-date (00:00): aplica antes de los trades de ese día
+    valor: float       # SPLIT: acciones nuevas por acción (4.0 = 4x1, 0.1 = inverso 1x10); DIVIDEND: DÓLARES por acción
+
+class CorporateActionSync(SQLModel, table=True):
+    """Última consulta a Yahoo de las acciones corporativas de un ticker."""
+    ticker: str = Field(primary_key=True)
+    actualizado: datetime = Field(default_factory=datetime.now)
+
+
+# --- HISTÓRICO DE PRECIOS (Caché local de velas OHLC) ---
+class PriceBar(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_pricebar_ticker_intervalo_ts", "ticker", "intervalo", "ts", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ticker: str
+    intervalo: str     # "1d" | "60m" | "15m" (mismo valor que yfinance)
+    ts: int            # Unix seconds (UTC) de apertura de la vela
+    # Precios tal como los entrega Yahoo (DÓLARES float, sólo para gráficos)
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: Optional[float] = None
+
+class PriceSeries(SQLModel, table=True):
+    """Cobertura descargada por (ticker, intervalo): desde cuándo y cuándo se refrescó."""
+    ticker: str = Field(primary_key=True)
+    intervalo: str = Field(primary_key=True)
+    inicio: Optional[int] = None   # Unix seconds más antiguo pedido a Yahoo
+    completo: bool = Field(default=False)  # Se descargó period="max"
+    actualizado: datetime = Field(default_factory=datetime.now)
+
+# --- PATRIMONIO DIARIO (Serie materializada, ver NetWorthHistory) ---
+class NetWorthPoint(SQLModel, table=True):
+    """Cierre de un día (CENTS). Las escrituras de trades, movimientos y velas borran los días que afectan."""
+    fecha: date = Field(primary_key=True)
+    valor_portafolio: int = Field(default=0)
+    caja_broker: int = Field(default=0)
+    billetera_usd: int = Field(default=0)
+    billetera_uyu: int = Field(default=0)  # Todo lo que no es USD (mismo criterio que el dashboard)
+    pnl: int = Field(default=0)            # Valor de mercado + ventas/dividendos cobrados - compras pagadas
+
+# --- VERSIÓN DE LOS DATOS COMPARTIDA ENTRE WORKERS (services/data_version.py) ---
+class DataVersionCounter(SQLModel, table=True):
+    """Una sola fila (id = 1): se incrementa tras cada commit que toca las tablas del dashboard."""
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+
+# --- CONTROL DE MIGRACIONES (migrations.py) ---
+class SchemaMigration(SQLModel, table=True):
+    nombre: str = Field(primary_key=True)
+    aplicada: datetime = Field(default_factory=datetime.now)
@@ -0,0 +1,47 @@
+# routers/accounts.py
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlmodel import Session, select
+from database import get_session
+from models.models import Account, BrokerCash, BrokerSettings
+from services.account_service import AccountService
+from services.lot_engine import DEFAULT_LOT_METHOD
+
+router = APIRouter(prefix="/api/accounts", tags=["accounts"])
+
+class AccountCreate(BaseModel):
+    nombre: str
+    broker: Optional[str] = None
+
+def account_to_dict(account: Account, saldo_cents: int = 0, lot_method: Optional[str] = None):
+    return {
+        "id": account.id,
+        "nombre": account.nombre,
+        "broker": account.broker,
+        "saldo_broker": saldo_cents / 100.0,
+        "lot_method": lot_method or DEFAULT_LOT_METHOD,
+    }
+
+@router.get("/")
+def listar_cuentas(session: Session = Depends(get_session)):
+    cuentas = AccountService.list_accounts(session)
+    # Cajas y métodos de lotes en una consulta cada una (id = cuenta)
+    saldos = dict(session.execute(select(BrokerCash.id, BrokerCash.saldo_usd)).all())
+    metodos = dict(session.execute(select(BrokerSettings.id, BrokerSettings.lot_method)).all())
+    return [account_to_dict(c, saldos.get(c.id, 0), metodos.get(c.id)) for c in cuentas]
+
+@router.post("/")
+def crear_cuenta(cuenta_in: AccountCreate, session: Session = Depends(get_session)):
+    nombre = cuenta_in.nombre.strip()
+    if not nombre:
+        raise HTTPException(status_code=400, detail="El nombre de la cuenta es obligatorio")
+    AccountService.get_or_create_default(session)
+    if session.exec(select(Account).where(Account.nombre == nombre)).first():
+        raise HTTPException(status_code=400, detail=f"Ya existe una cuenta llamada '{nombre}'")
+
+    cuenta = Account(nombre=nombre, broker=cuenta_in.broker)
+    session.add(cuenta)
+    session.commit()
+    session.refresh(cuenta)
+    return account_to_dict(cuenta)
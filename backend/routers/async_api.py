@@ -0,0 +1,110 @@
+# backend/routers/async_api.py
+"""
+Versiones async (AsyncSession) de las rutas de lectura más consultadas.
+Sólo se registran con DB_ASYNC=1 (ver main.py), antes que las sync, así que toman sus paths.
+Las consultas a la DB no ocupan un worker del threadpool; lo que sigue siendo bloqueante
+(descargas de Yahoo / dolarapi) se deriva al threadpool.
+"""
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from database import engine, get_async_session
+from routers.dashboard import cached_response
+from routers.market import get_market_history
+from routers.portfolio import armar_portafolio
+from services.dashboard_cache import dashboard_cache
+from services.data_version import data_version
+from services.market_service import MarketDataService
+from services.portfolio_service import PortfolioService
+from services.position_snapshot import position_snapshot
+from services.trade_history_service import TradeHistoryService
+
+router = APIRouter(tags=["async"])
+
+@router.get("/api/dashboard")
+async def obtener_dashboard_async(
+    request: Request,
+    account_id: Optional[int] = Query(None, description="Cuenta a resumir (sin indicar: todas)"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    await data_version.refresh_async(session)
+    entry = dashboard_cache.lookup(account_id)
+    if entry is None:
+        version = data_version.current()
+        try:
+            summary = await PortfolioService.get_dashboard_summary_async(session, account_id)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+        entry = dashboard_cache.store(version, summary, account_id)
+    return cached_response(request, entry)
+
+@router.get("/api/portfolio")
+async def obtener_portafolio_async(
+    max_age: Optional[int] = Query(None, ge=0, description="Antigüedad máxima aceptada de los precios (segundos)"),
+    account_id: Optional[int] = Query(None, description="Sólo esta cuenta (sin indicar: todas)"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    snapshot = (await position_snapshot.get_async(session)).cuenta(account_id).abiertas()
+    precios_cents_map = await MarketDataService.get_snapshot_prices_async(session, snapshot, max_age=max_age)
+    return armar_portafolio(snapshot, precios_cents_map)
+
+@router.get("/api/trade/history")
+async def get_history_async(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=TradeHistoryService.MAX_PAGE_SIZE,
+                                 description="Filas por página (sin cursor ni limit: todo el historial)"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    account_id: Optional[int] = Query(None, description="Sólo esta cuenta (sin indicar: todas)"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    paginado = cursor is not None or limit is not None
+    limit = limit or TradeHistoryService.DEFAULT_PAGE_SIZE
+    try:
+        query = TradeHistoryService.page_query(cursor, limit, account_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        async def stream():
+            page_query = query
+            while True:
+                rows, next_cursor = TradeHistoryService.page_result(await session.exec(page_query), limit)
+                for row in rows:
+                    yield json.dumps(jsonable_encoder(row)) + "\n"
+                if next_cursor is None:
+                    return
+                page_query = TradeHistoryService.page_query(next_cursor, limit, account_id)
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    rows, next_cursor = TradeHistoryService.page_result(await session.exec(query), limit)
+    if not paginado:
+        # Sin cursor ni limit: el historial completo, como antes de paginar (leído de a páginas)
+        while next_cursor is not None:
+            page, next_cursor = TradeHistoryService.page_result(
+                await session.exec(TradeHistoryService.page_query(next_cursor, limit, account_id)), limit
+            )
+            rows.extend(page)
+        return rows
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@router.get("/api/market/history/{ticker}")
+async def get_market_history_async(
+    ticker: str,
+    range: str = "1y",
+    points: Optional[int] = Query(None, ge=3, description="Máximo de puntos a devolver (downsampling LTTB)"),
+):
+    # La cola faltante se pide a Yahoo con yfinance (bloqueante): todo el handler va al threadpool
+    def run():
+        with Session(engine) as session:
+            return get_market_history(ticker, range, points, session)
+    return await run_in_threadpool(run)
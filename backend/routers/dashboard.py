@@ -1,16 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlmodel import Session
 from database import get_session
+from services.dashboard_cache import dashboard_cache
+from services.data_version import data_version
+from services.downsampling import lttb
+from services.networth_history import NetWorthHistory
 from services.portfolio_service import PortfolioService
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
 @router.get("")
-def obtener_dashboard(session: Session = Depends(get_session)):
+def obtener_dashboard(
+    request: Request,
+    account_id: Optional[int] = Query(None, description="Cuenta a resumir (sin indicar: todas)"),
+    session: Session = Depends(get_session),
+):
     try:
-        # Delegamos toda la lógica al servicio
-        return PortfolioService.get_dashboard_summary(session)
+        # Delegamos toda la lógica al servicio (cacheado por cuenta hasta la próxima escritura, de cualquier worker)
+        data_version.refresh(session)
+        entry = dashboard_cache.get(lambda: PortfolioService.get_dashboard_summary(session, account_id), key=account_id)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+    return cached_response(request, entry)
+
+def cached_response(request: Request, entry) -> Response:
+    """Cuerpo ya serializado + ETag; 304 sin cuerpo si el cliente ya tiene esa versión."""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if_none_match = {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}
+    if entry.etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@router.get("/history")
+def obtener_historial_patrimonio(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    points: Optional[int] = Query(None, ge=3, description="Máximo de puntos a devolver (downsampling LTTB)"),
+    session: Session = Depends(get_session),
+):
+    """Patrimonio y P&L diarios (DÓLARES). Sólo se recalculan los días cuyos datos cambiaron."""
+    puntos = NetWorthHistory.get_points(session, desde, hasta)
+    if points is not None and len(puntos) > points:
+        # Mismo criterio que el gráfico de precios: reducir conservando la forma de la curva
+        x = np.array([p.fecha.toordinal() for p in puntos], dtype=float)
+        y = np.array([p.valor_portafolio + p.caja_broker + p.billetera_usd for p in puntos], dtype=float)
+        puntos = [puntos[i] for i in lttb(x, y, points)]
+
+    # Pesos convertidos con la cotización actual (no hay histórico de cotizaciones)
+    dolar = PortfolioService.get_dolar_price()
+    resultado = []
+    for p in puntos:
+        billetera = p.billetera_usd / 100.0 + (p.billetera_uyu / 100.0 / dolar if dolar > 0 else 0.0)
+        acciones, broker = p.valor_portafolio / 100.0, p.caja_broker / 100.0
+        resultado.append({
+            "fecha": p.fecha.isoformat(),
+            "net_worth": round(acciones + broker + billetera, 2),
+            "acciones": round(acciones, 2),
+            "caja_broker": round(broker, 2),
+            "billetera": round(billetera, 2),
+            "pnl": round(p.pnl / 100.0, 2),
+        })
+    return resultado
+
+@router.get("/cache/stats")
+def get_dashboard_cache_stats():
+    return dashboard_cache.stats()
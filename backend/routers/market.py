@@ -1,12 +1,38 @@
-import yfinance as yf
-import pandas as pd
-from fastapi import APIRouter
-from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from database import get_session
+from services.corporate_actions import CorporateActionService
+from services.downsampling import lttb
+from services.history_store import HistoryStore
 
 router = APIRouter(prefix="/api/market", tags=["market"])
 
+@router.get("/refresher/status")
+def get_price_refresher_status():
+    # Último ciclo del refresco en background: duración, tickers actualizados y fallos
+    from services.price_refresher import price_refresher
+    return price_refresher.status()
+
+@router.get("/cache/stats")
+def get_price_cache_stats():
+    # Contadores de la caché en memoria de precios (hits / misses / descargas)
+    from services.market_service import price_cache
+    return price_cache.stats()
+
+@router.get("/corporate-actions/{ticker}")
+def get_corporate_actions(ticker: str, session: Session = Depends(get_session)):
+    # Splits y dividendos guardados (los sincroniza el refresco en background)
+    actions = CorporateActionService.by_ticker(session, [ticker]).get(ticker.upper(), [])
+    return [{"fecha": fecha.date().isoformat(), "tipo": tipo, "valor": valor} for fecha, tipo, valor in actions]
+
 @router.get("/history/{ticker}")
-def get_market_history(ticker: str, range: str = "1y"):
+def get_market_history(
+    ticker: str,
+    range: str = "1y",
+    points: Optional[int] = Query(None, ge=3, description="Máximo de puntos a devolver (downsampling LTTB)"),
+    session: Session = Depends(get_session),
+):
     # Configuración "Perfil Inversor"
     interval = "1d"
     period = "1y"
@@ -29,31 +55,14 @@ def get_market_history(ticker: str, range: str = "1y"):
         period = "max"
         interval = "1d"
     
-    print(f"DEBUG: Fetching {ticker} | Period: {period} | Interval: {interval}")
-
     try:
-        ticker_obj = yf.Ticker(ticker)
-        hist = ticker_obj.history(period=period, interval=interval, auto_adjust=True)
-        
-        if hist.empty:
-            return {"data": []}
-
-        data = []
-        for index, row in hist.iterrows():
-            # Validación de datos sucios
-            if pd.isna(row['Close']):
-                continue
-                
-            # Conversión Timestamp -> Unix Seconds
-            # index es un datetime con timezone, timestamp() lo maneja a UTC
-            ts = int(index.timestamp())
-            
-            data.append({
-                "time": ts,
-                "value": round(float(row['Close']), 2)
-            })
-            
-        return {"data": data}
+        # Velas desde la caché local; a Yahoo sólo se le pide la cola faltante
+        ts, close = HistoryStore.get_series(session, ticker, period, interval)
+        if points is not None:
+            # El gráfico no dibuja más puntos que píxeles: reducimos conservando la forma
+            keep = lttb(ts, close, points)
+            ts, close = ts[keep], close[keep]
+        return {"data": HistoryStore.to_points(ts, close)}
 
     except Exception as e:
         print(f"ERROR: Fallo en yfinance para {ticker}: {e}")
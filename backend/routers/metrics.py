@@ -0,0 +1,28 @@
+from typing import Iterator
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.dashboard_cache import dashboard_cache
+from services.market_service import price_cache
+from services.metrics import metrics
+from services.position_snapshot import position_snapshot
+
+router = APIRouter(tags=["metrics"])
+
+@metrics.collector
+def cache_metrics() -> Iterator[str]:
+    # Contadores que ya llevan las cachés en memoria (mismos datos que /cache/stats)
+    caches = (
+        ("price_cache", price_cache.stats(), ("hits", "misses")),
+        ("dashboard_cache", dashboard_cache.stats(), ("hits", "misses")),
+        ("position_snapshot", position_snapshot.stats(), ("hits", "builds")),
+    )
+    for name, stats, fields in caches:
+        for field in fields:
+            metric = f"{name}_{field}_total"
+            yield f"# TYPE {metric} counter"
+            yield f"{metric} {stats[field]}"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Formato de exposición de texto de Prometheus
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,13 +1,18 @@
 # backend/routers/portfolio.py
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlmodel import Session, select
-from typing import List, Optional
-import requests
-import pandas as pd
-import yfinance as yf
+from fastapi import APIRouter, Depends, HTTPException, Body, File, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from typing import Dict, List, Literal, Optional
+import json
+import numpy as np
 from datetime import datetime, timedelta
 from database import get_session
-from models.models import Asset, BrokerCash, TradeHistory, Transaction
+from models.models import DEFAULT_ACCOUNT_ID, BrokerCash, TradeHistory, Transaction
+from services.account_service import AccountService
+from services.cash_ledger import CashLedger
+from services.position_snapshot import PositionSnapshot, position_snapshot
+from services.trade_history_service import TradeHistoryService
+from services.valuation import valuar_posiciones
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api", tags=["portfolio"])
@@ -19,14 +24,20 @@ class TradeAction(BaseModel):
     fecha: Optional[datetime] = None
     applied_fee: float = 0.0
     usar_caja_broker: bool = True # Si True, descuenta/suma al saldo del broker
+    account_id: int = DEFAULT_ACCOUNT_ID
+
+class BatchTradeAction(TradeAction):
+    tipo: Literal["BUY", "SELL"]
 
 class BrokerFund(BaseModel):
     monto_enviado: float   # <--- Verifica que tengas estos dos nombres exactos
     monto_recibido: float
     tipo: str              # "DEPOSIT" | "WITHDRAW"
+    account_id: int = DEFAULT_ACCOUNT_ID
 
 class ImportRequest(BaseModel):
     content: str
+    account_id: int = DEFAULT_ACCOUNT_ID
 # --- AUXILIARES ---
 # Eliminadas funciones duplicadas (get_or_create_broker_cash, get_dolar_price) en favor de PortfolioService
 
@@ -34,9 +45,14 @@ class ImportRequest(BaseModel):
 
 # --- ENDPOINTS DE CAJA (BUYING POWER) ---
 @router.get("/broker/cash")
-def get_broker_cash(session: Session = Depends(get_session)):
+def get_broker_cash(account_id: int = DEFAULT_ACCOUNT_ID, session: Session = Depends(get_session)):
     from services.portfolio_service import PortfolioService
-    cash = PortfolioService.get_or_create_broker_cash(session)
+    # Lectura desde la foto de posiciones; sólo si la cuenta no tiene caja se va a la DB (y se crea)
+    saldo_cents = position_snapshot.get(session).broker_cash.get(account_id)
+    if saldo_cents is not None:
+        return {"saldo_usd": saldo_cents / 100.0}
+    AccountService.require(session, account_id)
+    cash = PortfolioService.get_or_create_broker_cash(session, account_id)
     # Return Dollars
     return {"saldo_usd": cash.saldo_usd / 100.0}
 
@@ -45,81 +61,91 @@ def get_broker_cash(session: Session = Depends(get_session)):
 def fund_broker(fund: BrokerFund, session: Session = Depends(get_session)):
     from services.portfolio_service import PortfolioService
     # Usamos el servicio
-    cash = PortfolioService.get_or_create_broker_cash(session)
+    AccountService.require(session, fund.account_id)
+    PortfolioService.get_or_create_broker_cash(session, fund.account_id)
     
     # Inputs en Dólares (Float)
     monto_enviado_cents = int(round(fund.monto_enviado * 100))
     monto_recibido_cents = int(round(fund.monto_recibido * 100))
     
     comision_cents = monto_enviado_cents - monto_recibido_cents
-    
-    if fund.tipo == "DEPOSIT":
-        # Aumentamos saldo Broker (Cents)
-        cash.saldo_usd += monto_recibido_cents
-        
-        # REGISTRO AUTOMÁTICO EN CASH FLOW (Billetera Principal)
-        # 1. El dinero que salió de la cuenta (Transferencia)
-        gasto_transferencia = Transaction(
-            tipo="gasto",
-            monto=monto_recibido_cents, # CENTS
-            moneda="USD",
-            categoria="Transferencia a Broker",
-            fecha=datetime.now()
-        )
-        session.add(gasto_transferencia)
 
-        # 2. Si hubo comisión, la registramos aparte para tener control
-        if comision_cents > 0:
-            gasto_comision = Transaction(
+    # El saldo del broker se actualiza en la DB (UPDATE atómico), igual que en compras/ventas:
+    # un fondeo concurrente con un trade no pisa el saldo del otro
+    def run():
+        nuevo_saldo_cents = None
+        if fund.tipo == "DEPOSIT":
+            # Aumentamos saldo Broker (Cents)
+            nuevo_saldo_cents = PortfolioService.credit_broker_cash(session, monto_recibido_cents, fund.account_id)
+            
+            # REGISTRO AUTOMÁTICO EN CASH FLOW (Billetera Principal)
+            # 1. El dinero que salió de la cuenta (Transferencia)
+            gasto_transferencia = Transaction(
                 tipo="gasto",
-                monto=comision_cents, # CENTS
+                monto=monto_recibido_cents, # CENTS
+                moneda="USD",
+                categoria="Transferencia a Broker",
+                fecha=datetime.now()
+            )
+            CashLedger.record(session, gasto_transferencia)
+
+            # 2. Si hubo comisión, la registramos aparte para tener control
+            if comision_cents > 0:
+                gasto_comision = Transaction(
+                    tipo="gasto",
+                    monto=comision_cents, # CENTS
+                    moneda="USD",
+                    categoria="Comisión Broker / Transferencia",
+                    fecha=datetime.now()
+                )
+                CashLedger.record(session, gasto_comision)
+
+        elif fund.tipo == "WITHDRAW":
+            # Restamos del Broker (aquí sale el total), sólo si alcanza
+            nuevo_saldo_cents = PortfolioService.debit_broker_cash(session, monto_enviado_cents, fund.account_id)
+            if nuevo_saldo_cents is None:
+                raise HTTPException(status_code=400, detail="Saldo insuficiente en broker")
+            
+            # Ingreso en Cash Flow (Banco)
+            ingreso_banco = Transaction(
+                tipo="ingreso",
+                monto=monto_recibido_cents, # Llega menos por comisión (CENTS)
                 moneda="USD",
-                categoria="Comisión Broker / Transferencia",
+                categoria="Retiro desde Broker",
                 fecha=datetime.now()
             )
-            session.add(gasto_comision)
-
-    elif fund.tipo == "WITHDRAW":
-        if cash.saldo_usd < monto_enviado_cents:
-            raise HTTPException(status_code=400, detail="Saldo insuficiente en broker")
-        
-        # Restamos del Broker
-        cash.saldo_usd -= monto_enviado_cents # Aquí sale el total
-        
-        # Ingreso en Cash Flow (Banco)
-        ingreso_banco = Transaction(
-            tipo="ingreso",
-            monto=monto_recibido_cents, # Llega menos por comisión (CENTS)
-            moneda="USD",
-            categoria="Retiro desde Broker",
-            fecha=datetime.now()
+            CashLedger.record(session, ingreso_banco)
+
+            if comision_cents > 0:
+                 # Opcional: Registrar la comisión de salida como gasto o simplemente registrar el ingreso neto
+                 pass 
+
+        # Guardar Historial de Trading (Solo informativo)
+        # Convertimos a CENTS para historial
+        hist = TradeHistory(
+            account_id=fund.account_id,
+            ticker="CASH", 
+            tipo=fund.tipo, 
+            cantidad=1, 
+            precio=monto_recibido_cents, # Cents
+            total=monto_recibido_cents    # Cents
         )
-        session.add(ingreso_banco)
-
-        if comision_cents > 0:
-             # Opcional: Registrar la comisión de salida como gasto o simplemente registrar el ingreso neto
-             pass 
-
-    # Guardar Historial de Trading (Solo informativo)
-    # Convertimos a CENTS para historial
-    hist = TradeHistory(
-        ticker="CASH", 
-        tipo=fund.tipo, 
-        cantidad=1, 
-        precio=monto_recibido_cents, # Cents
-        total=monto_recibido_cents    # Cents
-    )
-    session.add(hist)
-    session.add(cash)
-    session.commit()
-    
-    return {"nuevo_saldo": cash.saldo_usd / 100.0, "comision_registrada": comision_cents / 100.0}
+        session.add(hist)
+        session.commit()
+
+        if nuevo_saldo_cents is None:
+            nuevo_saldo_cents = PortfolioService.get_or_create_broker_cash(session, fund.account_id).saldo_usd
+        return nuevo_saldo_cents
+
+    nuevo_saldo_cents = PortfolioService.run_with_retry(session, run)
+    return {"nuevo_saldo": nuevo_saldo_cents / 100.0, "comision_registrada": comision_cents / 100.0}
 
 # --- OPERACIONES DE TRADING (BUY / SELL) ---
 @router.post("/trade/buy")
 def comprar_accion(trade: TradeAction, session: Session = Depends(get_session)):
     # Delegar lógica compleja al servicio
     from services.portfolio_service import PortfolioService
+    AccountService.require(session, trade.account_id)
     try:
         resultado = PortfolioService.execute_buy(
             session=session,
@@ -128,7 +154,8 @@ def comprar_accion(trade: TradeAction, session: Session = Depends(get_session)):
             precio=trade.precio,
             usar_caja_broker=trade.usar_caja_broker,
             applied_fee=trade.applied_fee,
-            fecha=trade.fecha
+            fecha=trade.fecha,
+            account_id=trade.account_id,
         )
         return resultado
     except HTTPException as e:
@@ -140,6 +167,7 @@ def comprar_accion(trade: TradeAction, session: Session = Depends(get_session)):
 @router.post("/trade/sell")
 def vender_accion(trade: TradeAction, session: Session = Depends(get_session)):
     from services.portfolio_service import PortfolioService
+    AccountService.require(session, trade.account_id)
     try:
         resultado = PortfolioService.execute_sell(
             session=session,
@@ -148,7 +176,8 @@ def vender_accion(trade: TradeAction, session: Session = Depends(get_session)):
             precio=trade.precio,
             usar_caja_broker=trade.usar_caja_broker,
             applied_fee=trade.applied_fee,
-            fecha=trade.fecha
+            fecha=trade.fecha,
+            account_id=trade.account_id,
         )
         return resultado
     except HTTPException as e:
@@ -157,11 +186,29 @@ def vender_accion(trade: TradeAction, session: Session = Depends(get_session)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/trade/batch")
+def operar_lote(trades: List[BatchTradeAction], session: Session = Depends(get_session)):
+    """
+    Varias compras/ventas en una sola transacción (backfills, rebalanceos), aplicadas en orden de fecha.
+    Todo o nada: si una falla (saldo o acciones insuficientes) no se aplica ninguna.
+    """
+    from services.portfolio_service import PortfolioService
+    for account_id in sorted({trade.account_id for trade in trades}):
+        AccountService.require(session, account_id)
+    try:
+        return PortfolioService.execute_batch(session, [trade.model_dump() for trade in trades])
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/portfolio/import")
 def import_snapshot(request: ImportRequest, session: Session = Depends(get_session)):
     from services.import_service import ImportService
+    AccountService.require(session, request.account_id)
     try:
-        result = ImportService.import_snapshot(session, request.content)
+        result = ImportService.import_snapshot(session, request.content, request.account_id)
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -169,94 +216,112 @@ def import_snapshot(request: ImportRequest, session: Session = Depends(get_sessi
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/portfolio/import/file")
+def import_snapshot_file(archivo: UploadFile = File(...), account_id: int = DEFAULT_ACCOUNT_ID, session: Session = Depends(get_session)):
+    # Archivos grandes del broker: se parsean en streaming sin cargarlos enteros en memoria
+    from services.import_service import ImportService
+    AccountService.require(session, account_id)
+    try:
+        return ImportService.import_snapshot(session, archivo.file, account_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # --- GETTERS ---
 @router.get("/portfolio")
-def obtener_portafolio(session: Session = Depends(get_session)):
-    # ... (Tu código anterior de obtener_portafolio, MANTENLO IGUAL) ...
-    # Solo agrega al principio para incluir el saldo en caja si quieres retornarlo aqui tambien
-    # Pero idealmente el Dashboard lo pide por separado.
-    # COPIA AQUI TU LOGICA DE OBTENER_PORTAFOLIO QUE YA TENIAS EN EL MENSAJE ANTERIOR
-    # O SI QUIERES TE LA PEGO DE NUEVO COMPLETA ABAJO
-    
-    activos_db = session.exec(select(Asset).where(Asset.cantidad_total > 0)).all() # Filtramos los que estan en 0
-    if not activos_db:
-         return {"resumen": {"valor_total_portafolio": 0, "ganancia_total_usd": 0, "rendimiento_total_porc": 0}, "posiciones": []}
-
-    data = [asset.dict() for asset in activos_db]
-    df = pd.DataFrame(data)
-    
-    # CONVERTIR CENTS A DOLLARS para cálculos de visualización
-    # precio_promedio viene en Cents desde DB
-    df['precio_promedio'] = df['precio_promedio'] / 100.0
+def obtener_portafolio(
+    max_age: Optional[int] = Query(None, ge=0, description="Antigüedad máxima aceptada de los precios (segundos)"),
+    account_id: Optional[int] = Query(None, description="Sólo esta cuenta (sin indicar: todas)"),
+    session: Session = Depends(get_session),
+):
+    from services.market_service import MarketDataService
 
-    lista_tickers = df['ticker'].unique().tolist()
-    precios_actuales = pd.Series()
-    
-    if lista_tickers:
-        try:
-            datos_mercado = yf.download(lista_tickers, period="1d", threads=True)['Close']
-            precios_actuales = datos_mercado.iloc[-1] if not datos_mercado.empty else pd.Series()
-        except: pass
+    # Foto columnar de posiciones (sin objetos ORM); filtramos las que están en 0
+    snapshot = position_snapshot.get(session).cuenta(account_id).abiertas()
+    # Precios desde la caché compartida (memoria -> DB -> Yahoo sólo si están vencidos),
+    # una sola descarga aunque el ticker esté en varias cuentas
+    precios_cents_map = MarketDataService.get_snapshot_prices(session, snapshot, max_age=max_age)
+    return armar_portafolio(snapshot, precios_cents_map)
 
-    def get_precio_live(ticker):
-        try:
-            if isinstance(precios_actuales, pd.Series): return float(precios_actuales.get(ticker, 0))
-            return float(precios_actuales) if lista_tickers[0] == ticker else 0.0
-        except: return 0.0
+def armar_portafolio(snapshot: PositionSnapshot, precios_cents_map: Dict[str, int]) -> dict:
+    """Respuesta de /api/portfolio a partir de la foto de posiciones (compartida con la versión async)."""
+    if not len(snapshot):
+        return {"resumen": {"valor_total_portafolio": 0, "ganancia_total_usd": 0, "rendimiento_total_porc": 0}, "posiciones": []}
 
-    df['Precio_Actual'] = df['ticker'].apply(get_precio_live).fillna(0)
-    df['Valor_Mercado'] = df['cantidad_total'] * df['Precio_Actual']
-    
-    # Costo Base (Dollars) = Cantidad * PrecioPromedio(Dollars)
-    df['Costo_Base'] = df['cantidad_total'] * df['precio_promedio']
-    
-    df['Ganancia_USD'] = df['Valor_Mercado'] - df['Costo_Base']
-    df['Rendimiento_Porc'] = df.apply(lambda x: (x['Ganancia_USD'] / x['Costo_Base'] * 100) if x['Costo_Base'] > 0 else 0, axis=1)
-
-    total_invertido = df['Costo_Base'].sum()
-    valor_actual = df['Valor_Mercado'].sum()
-    ganancia_total = valor_actual - total_invertido
-    rendimiento_total = (ganancia_total / total_invertido * 100) if total_invertido > 0 else 0
-
-    posiciones = []
-    for _, row in df.iterrows():
-        posiciones.append({
-            "Ticker": row['ticker'],
-            "Cantidad_Total": round(float(row['cantidad_total']), 5),
-            "Precio_Promedio": round(float(row['precio_promedio']), 2),
-            "Precio_Actual": round(float(row['Precio_Actual']), 2),
-            "Valor_Mercado": round(float(row['Valor_Mercado']), 2),
-            "Ganancia_USD": round(float(row['Ganancia_USD']), 2),
-            "Rendimiento_Porc": round(float(row['Rendimiento_Porc']), 2),
-
-        })
+    cantidades, promedios_cents = snapshot.cantidades, snapshot.promedios
+    precios_cents = np.fromiter((precios_cents_map.get(t, 0) for t in snapshot.tickers), dtype=np.int64, count=len(snapshot))
+    # Valuación vectorizada (CENTS) -> DOLLARS para la UI
+    v = valuar_posiciones(cantidades, promedios_cents, precios_cents)
+    columnas = zip(
+        snapshot.account_ids.tolist(),
+        snapshot.tickers,
+        np.round(cantidades, 5).tolist(),
+        np.round(promedios_cents / 100.0, 2).tolist(),
+        np.round(precios_cents / 100.0, 2).tolist(),
+        np.round(v.valor_mercado / 100.0, 2).tolist(),
+        np.round(v.ganancia / 100.0, 2).tolist(),
+        np.round(v.rendimiento_porc, 2).tolist(),
+    )
+    posiciones = [
+        {
+            "Cuenta": cuenta,
+            "Ticker": ticker,
+            "Cantidad_Total": cantidad,
+            "Precio_Promedio": promedio,
+            "Precio_Actual": precio,
+            "Valor_Mercado": valor,
+            "Ganancia_USD": ganancia,
+            "Rendimiento_Porc": rendimiento,
+        }
+        for cuenta, ticker, cantidad, promedio, precio, valor, ganancia, rendimiento in columnas
+    ]
 
     return {
         "resumen": {
-            "valor_total_portafolio": round(float(valor_actual), 2),
-            "ganancia_total_usd": round(float(ganancia_total), 2),
-            "rendimiento_total_porc": round(float(rendimiento_total), 2)
+            "valor_total_portafolio": round(v.valor_total / 100.0, 2),
+            "ganancia_total_usd": round(v.ganancia_total / 100.0, 2),
+            "rendimiento_total_porc": round(v.rendimiento_total_porc, 2)
         },
         "posiciones": posiciones
     }
 
 @router.get("/trade/history")
-def get_history(session: Session = Depends(get_session)):
-    hist = session.exec(select(TradeHistory).order_by(TradeHistory.fecha.desc())).all()
-    # Convert cents back to dollars for display
-    # This might be slow if list is huge, but safe for MVP.
-    # Alternatively, frontend handles formatting, but we promised to return dollars.
-    # Better to do this in SQL or Pydantic, but manual is explicit.
-    res = []
-    for h in hist:
-        d = h.dict()
-        d['precio'] = h.precio / 100.0
-        d['total'] = h.total / 100.0
-        d['commission'] = h.commission / 100.0
-        if h.ganancia_realizada is not None:
-             d['ganancia_realizada'] = h.ganancia_realizada / 100.0
-        res.append(d)
-    return res
+def get_history(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=TradeHistoryService.MAX_PAGE_SIZE,
+                                 description="Filas por página (sin cursor ni limit: todo el historial)"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    account_id: Optional[int] = Query(None, description="Sólo esta cuenta (sin indicar: todas)"),
+    session: Session = Depends(get_session),
+):
+    # Montos en DÓLARES (convertidos en SQL), orden (fecha, id) descendente
+    paginado = cursor is not None or limit is not None
+    limit = limit or TradeHistoryService.DEFAULT_PAGE_SIZE
+    if cursor:
+        try:
+            TradeHistoryService.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        # Todo el historial (desde `cursor`) en streaming: una línea JSON por trade, de a `limit` filas por query
+        def stream():
+            for row in TradeHistoryService.iter_rows(session, cursor, limit, account_id):
+                row["fecha"] = row["fecha"].isoformat()
+                yield json.dumps(row) + "\n"
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    if not paginado:
+        # Sin cursor ni limit: el historial completo, como antes de paginar (leído de a páginas)
+        return list(TradeHistoryService.iter_rows(session, None, limit, account_id))
+
+    rows, next_cursor = TradeHistoryService.get_page(session, cursor, limit, account_id)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 
  
@@ -264,25 +329,6 @@ def get_history(session: Session = Depends(get_session)):
 # --- ENDPOINT PÚBLICO COTIZACIÓN (Recuperado) ---
 @router.get("/dolar-uy")
 def obtener_cotizacion_endpoint():
-    try:
-        # Usamos la API pública de Uruguay
-        resp = requests.get("https://uy.dolarapi.com/v1/cotizaciones/usd", timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        return {
-            "moneda": data.get("moneda", "USD"),
-            "compra": data.get("compra", 0),
-            "venta": data.get("venta", 0),
-            "fecha": data.get("fechaActualizacion", ""),
-            "fuente": "DolarApi.com"
-        }
-    except Exception as e:
-        print(f"Error obteniendo dólar: {e}")
-        # Fallback manual por si la API falla
-        return {
-            "compra": 39.0, 
-            "venta": 41.0, 
-            "fuente": "Backup (Error API)", 
-            "error": str(e)
-        }
\ No newline at end of file
+    # Misma caché que el dashboard: último valor bueno + flag `stale` si dolarapi falla
+    from services.fx_service import fx_service
+    return fx_service.get_quote()
@@ -1,44 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
 from pydantic import BaseModel
 from database import get_session
-from models.models import BrokerSettings
+from models.models import DEFAULT_ACCOUNT_ID, BrokerSettings
+from services.account_service import AccountService
+from services.lot_engine import LotEngine
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 class SettingsUpdate(BaseModel):
     default_fee_integer: float
     default_fee_fractional: float
+    lot_method: Optional[Literal["FIFO", "LIFO", "AVERAGE"]] = None  # None: no cambia
 
-def get_or_create_settings(session: Session) -> BrokerSettings:
-    settings = session.get(BrokerSettings, 1)
+def get_or_create_settings(session: Session, account_id: int = DEFAULT_ACCOUNT_ID) -> BrokerSettings:
+    # Una fila por cuenta: BrokerSettings.id = Account.id
+    settings = session.get(BrokerSettings, account_id)
     if not settings:
-        settings = BrokerSettings(id=1, default_fee_integer=0, default_fee_fractional=0)
+        settings = BrokerSettings(id=account_id, default_fee_integer=0, default_fee_fractional=0)
         session.add(settings)
         session.commit()
         session.refresh(settings)
     return settings
 
 @router.get("/")
-def get_settings(session: Session = Depends(get_session)):
-    s = get_or_create_settings(session)
+def get_settings(account_id: int = Query(DEFAULT_ACCOUNT_ID), session: Session = Depends(get_session)):
+    AccountService.require(session, account_id)
+    s = get_or_create_settings(session, account_id)
     return {
         "id": s.id,
         "default_fee_integer": s.default_fee_integer / 100.0,
-        "default_fee_fractional": s.default_fee_fractional / 100.0
+        "default_fee_fractional": s.default_fee_fractional / 100.0,
+        "lot_method": s.lot_method,
     }
 
 @router.post("/")
-def update_settings(update: SettingsUpdate, session: Session = Depends(get_session)):
-    settings = get_or_create_settings(session)
+def update_settings(update: SettingsUpdate, account_id: int = Query(DEFAULT_ACCOUNT_ID), session: Session = Depends(get_session)):
+    AccountService.require(session, account_id)
+    settings = get_or_create_settings(session, account_id)
     settings.default_fee_integer = int(round(update.default_fee_integer * 100))
     settings.default_fee_fractional = int(round(update.default_fee_fractional * 100))
+    metodo_anterior = settings.lot_method
+    if update.lot_method:
+        settings.lot_method = update.lot_method
     session.add(settings)
+    if settings.lot_method != metodo_anterior:
+        # Otro método de lotes: se recalcula la ganancia realizada de todo el historial de la cuenta
+        LotEngine.recompute(session, method=settings.lot_method, commit=False, account_id=account_id)
     session.commit()
     session.refresh(settings)
     
     return {
         "id": settings.id,
         "default_fee_integer": settings.default_fee_integer / 100.0,
-        "default_fee_fractional": settings.default_fee_fractional / 100.0
+        "default_fee_fractional": settings.default_fee_fractional / 100.0,
+        "lot_method": settings.lot_method,
     }
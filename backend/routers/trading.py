@@ -1,20 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from sqlmodel import Session
 from database import get_session
-from models.models import TradeHistory
+from models.models import DEFAULT_ACCOUNT_ID, TradeHistory
 from models.schemas import TradeHistoryUpdate
-from services.portfolio_service import PortfolioService, to_cents, to_dollars
+from services.portfolio_service import PortfolioService, naive_utc, to_cents, to_dollars
+from services.trade_history_service import TradeHistoryService
 from typing import List
 
 router = APIRouter(prefix="/api/trading", tags=["trading"])
 
 @router.get("/history/{ticker}")
-def get_history(ticker: str, session: Session = Depends(get_session)):
-    history = session.exec(
-        select(TradeHistory)
-        .where(TradeHistory.ticker == ticker)
-        .order_by(TradeHistory.fecha.desc())
-    ).all()
+def get_history(ticker: str, account_id: int = DEFAULT_ACCOUNT_ID, session: Session = Depends(get_session)):
+    history = session.exec(TradeHistoryService.ticker_query(ticker, account_id)).all()
     
     # Convert cents to dollars for UI
     return [
@@ -34,6 +31,9 @@ def update_trade(id: int, trade_in: TradeHistoryUpdate, session: Session = Depen
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
         
+    # Fecha original: si el trade se mueve, el replay debe arrancar desde la más antigua
+    fecha_original = trade.fecha
+
     # Update fields if provided
     # Input is Dollar Float -> Store as Cents
     if trade_in.precio is not None:
@@ -46,7 +46,7 @@ def update_trade(id: int, trade_in: TradeHistoryUpdate, session: Session = Depen
         trade.cantidad = trade_in.cantidad
         
     if trade_in.fecha is not None:
-        trade.fecha = trade_in.fecha
+        trade.fecha = naive_utc(trade_in.fecha)
         
     if trade_in.tipo is not None:
         trade.tipo = trade_in.tipo
@@ -61,11 +61,14 @@ def update_trade(id: int, trade_in: TradeHistoryUpdate, session: Session = Depen
         trade.total = int(round(cost_gross - trade.commission))
     # DEPOSIT/DIVIDEND logic could be added here if needed
     
+    # Los días del patrimonio afectados (fecha vieja y nueva) los descarta el hook de flush
     session.add(trade)
     session.commit()
     
-    # TRIGGER REPLAY
-    PortfolioService.recalculate_asset_from_history(session, trade.ticker)
+    # TRIGGER REPLAY (desde el checkpoint anterior a la fecha afectada)
+    PortfolioService.recalculate_asset_from_history(
+        session, trade.ticker, desde=min(fecha_original, trade.fecha), account_id=trade.account_id
+    )
     
     return {"message": "Trade updated and asset recalculated"}
 
@@ -76,10 +79,12 @@ def delete_trade(id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Trade not found")
         
     ticker = trade.ticker
+    fecha = trade.fecha
+    account_id = trade.account_id
     session.delete(trade)
     session.commit()
     
     # TRIGGER REPLAY
-    PortfolioService.recalculate_asset_from_history(session, ticker)
+    PortfolioService.recalculate_asset_from_history(session, ticker, desde=fecha, account_id=account_id)
     
     return {"message": "Trade deleted and asset recalculated"}
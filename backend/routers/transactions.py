@@ -5,6 +5,7 @@ from typing import List
 from database import get_session
 from models.models import Transaction
 from models.schemas import TransactionCreate
+from services.cash_ledger import CashLedger
 from datetime import datetime
 
 router = APIRouter(prefix="/api/movimientos", tags=["movimientos"])
@@ -20,10 +21,13 @@ def transaction_to_dict(t: Transaction):
         "fecha": t.fecha.isoformat() if t.fecha else None
     }
 
+def movimientos_query(skip: int = 0, limit: int = 100):
+    # SELECT * FROM transaction ORDER BY fecha DESC, id DESC LIMIT limit OFFSET skip
+    return select(Transaction).order_by(Transaction.fecha.desc(), Transaction.id.desc()).offset(skip).limit(limit)
+
 @router.get("/")
 def leer_movimientos(skip: int = 0, limit: int = 100, session: Session = Depends(get_session)):
-    # SELECT * FROM transaction LIMIT limit OFFSET skip
-    movimientos = session.exec(select(Transaction).order_by(Transaction.fecha.desc()).offset(skip).limit(limit)).all()
+    movimientos = session.exec(movimientos_query(skip, limit)).all()
     # Convertimos los montos (cents) a dolares (float) para el frontend
     return [transaction_to_dict(m) for m in movimientos]
 
@@ -40,7 +44,8 @@ def agregar_movimiento(movimiento_in: TransactionCreate, session: Session = Depe
         fecha=movimiento_in.fecha or datetime.now()
     )
     
-    session.add(nuevo_movimiento)
+    # Alta + saldo de la moneda en la misma transacción
+    CashLedger.record(session, nuevo_movimiento)
     session.commit()
     session.refresh(nuevo_movimiento)
     return transaction_to_dict(nuevo_movimiento)
\ No newline at end of file
@@ -0,0 +1,43 @@
+from typing import Dict, List
+from fastapi import HTTPException
+from sqlmodel import Session, select
+from migrations import create_default_account
+from models.models import DEFAULT_ACCOUNT_ID, Account
+
+
+class AccountService:
+    """
+    Cuentas de broker. Cada una tiene sus Assets, su historial, su caja (BrokerCash.id = cuenta)
+    y su configuración (BrokerSettings.id = cuenta). La cuenta 1 existe siempre
+    (la crea la migración, o el primer uso en una DB sin migrar).
+    """
+
+    @staticmethod
+    def get_or_create_default(session: Session) -> Account:
+        account = session.get(Account, DEFAULT_ACCOUNT_ID)
+        if not account:
+            # Mismo camino que la migración: sin id explícito si la tabla está vacía (secuencia de Postgres)
+            create_default_account(session.connection())
+            session.commit()
+            account = session.get(Account, DEFAULT_ACCOUNT_ID)
+        return account
+
+    @staticmethod
+    def require(session: Session, account_id: int) -> Account:
+        """Cuenta existente o HTTPException 404 (la cuenta por defecto se crea si falta)."""
+        if account_id == DEFAULT_ACCOUNT_ID:
+            return AccountService.get_or_create_default(session)
+        account = session.get(Account, account_id)
+        if not account:
+            raise HTTPException(status_code=404, detail=f"Cuenta {account_id} no encontrada")
+        return account
+
+    @staticmethod
+    def list_accounts(session: Session) -> List[Account]:
+        AccountService.get_or_create_default(session)
+        return session.exec(select(Account).order_by(Account.id)).all()
+
+    @staticmethod
+    def names(session: Session) -> Dict[int, str]:
+        """{id: nombre} de todas las cuentas (sin crear nada: se usa en lecturas)."""
+        return dict(session.execute(select(Account.id, Account.nombre)).all())
@@ -0,0 +1,113 @@
+"""
+Saldos de la billetera (Cash Flow) materializados por moneda.
+
+Cada alta de Transaction suma su monto firmado al CashBalance de su moneda en la
+misma transacción de DB, así el dashboard lee N monedas en lugar de agregar toda
+la tabla Transaction.
+
+Reconciliación (recalcula desde cero y reporta diferencias):
+    python -m services.cash_ledger
+"""
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import case, delete, func, insert
+from sqlmodel import Session, select
+from models.models import CashBalance, Transaction
+from services.upsert import upsert
+
+# Monto firmado en CENTS: los gastos restan, todo lo demás suma (mismo criterio que el dashboard)
+SIGNED_MONTO = case((Transaction.tipo == "gasto", -Transaction.monto), else_=Transaction.monto)
+
+
+def signed_amount(tipo: str, monto: int) -> int:
+    return -monto if tipo == "gasto" else monto
+
+
+class CashLedger:
+
+    @staticmethod
+    def _is_built(session: Session) -> bool:
+        return session.exec(select(CashBalance.moneda).limit(1)).first() is not None
+
+    @staticmethod
+    def compute(session: Session) -> Dict[str, int]:
+        """Saldos recalculados desde Transaction (agregado completo): {moneda: CENTS}."""
+        rows = session.exec(
+            select(Transaction.moneda, func.sum(SIGNED_MONTO)).group_by(Transaction.moneda)
+        ).all()
+        return {moneda: int(total or 0) for moneda, total in rows}
+
+    @staticmethod
+    def rebuild(session: Session) -> Dict[str, int]:
+        """Reemplaza el ledger por los saldos recalculados (sin commit)."""
+        balances = CashLedger.compute(session)
+        session.execute(delete(CashBalance))
+        if balances:
+            now = datetime.now()
+            session.execute(insert(CashBalance), [
+                {"moneda": moneda, "saldo": saldo, "actualizado": now} for moneda, saldo in balances.items()
+            ])
+        return balances
+
+    @staticmethod
+    def record(session: Session, tx: Transaction):
+        """
+        Aplica una Transaction nueva al ledger (sin commit: va en la misma transacción que el alta).
+        Si el ledger todavía no existe (DB previa) se construye completo, incluyendo `tx`.
+        """
+        session.add(tx)
+        session.flush()
+        if not CashLedger._is_built(session):
+            CashLedger.rebuild(session)
+            return
+
+        delta = signed_amount(tx.tipo, tx.monto)
+        now = datetime.now()
+        table = CashBalance.__table__
+        # Un solo statement (saldo = saldo + delta o fila nueva): no depende de un valor leído antes
+        # ni deja carrera entre dos altas concurrentes de la primera transacción de una moneda
+        session.execute(upsert(
+            session.get_bind().dialect.name, table,
+            {"moneda": tx.moneda, "saldo": delta, "actualizado": now},
+            ["moneda"],
+            {"saldo": table.c.saldo + delta, "actualizado": now},
+        ))
+
+    @staticmethod
+    def get_balances(session: Session) -> Dict[str, int]:
+        """Saldos por moneda en CENTS. La primera lectura sobre una DB previa construye el ledger."""
+        if not CashLedger._is_built(session):
+            balances = CashLedger.rebuild(session)
+            if balances:
+                session.commit()
+            return balances
+        return {moneda: saldo for moneda, saldo in session.exec(select(CashBalance.moneda, CashBalance.saldo))}
+
+    @staticmethod
+    def reconcile(session: Session) -> Dict[str, Dict[str, int]]:
+        """
+        Recalcula desde cero, corrige el ledger y devuelve las diferencias encontradas:
+        {moneda: {"ledger", "recalculado", "diferencia"}} (vacío si no había drift).
+        """
+        stored = {moneda: saldo for moneda, saldo in session.exec(select(CashBalance.moneda, CashBalance.saldo))}
+        balances = CashLedger.rebuild(session)
+        session.commit()
+
+        drift = {}
+        for moneda in sorted(set(stored) | set(balances)):
+            ledger = stored.get(moneda, 0)
+            recalculado = balances.get(moneda, 0)
+            if ledger != recalculado:
+                drift[moneda] = {"ledger": ledger, "recalculado": recalculado, "diferencia": recalculado - ledger}
+        return drift
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    with Session(engine) as session:
+        drift = CashLedger.reconcile(session)
+    if not drift:
+        print("Ledger de caja OK: sin diferencias.")
+    for moneda, d in drift.items():
+        print(f"{moneda}: ledger {d['ledger'] / 100:.2f} -> recalculado {d['recalculado'] / 100:.2f} (diferencia {d['diferencia'] / 100:+.2f})")
@@ -0,0 +1,236 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+from models.models import Asset, CorporateAction, CorporateActionSync
+from services.metrics import timed
+
+# Columnas de yf.download(actions=True) -> CorporateAction.tipo
+ACTION_FIELDS = {"Stock Splits": "SPLIT", "Dividends": "DIVIDEND"}
+ACTION_TYPES = tuple(ACTION_FIELDS.values())
+
+# (fecha, tipo, valor) de una acción, en el orden del replay
+Action = Tuple[datetime, str, float]
+
+
+def interleave(rows: Iterable[Sequence], actions: Sequence[Tuple[datetime, Sequence]], fecha_at: int) -> Iterator[Sequence]:
+    """
+    Intercala filas de acciones [(fecha, fila)] entre las del historial, ambas ordenadas por fecha.
+    Cada acción va antes del primer trade con fecha >= la suya (el ex-date ya aplica a los trades
+    de ese día); las posteriores al último trade van al final.
+    """
+    i, n = 0, len(actions)
+    for row in rows:
+        fecha = row[fecha_at]
+        while i < n and actions[i][0] <= fecha:
+            yield actions[i][1]
+            i += 1
+        yield row
+    for _, row in actions[i:]:
+        yield row
+
+
+def split_factor(actions: Sequence[Action], desde: datetime, hasta: datetime) -> float:
+    """Producto de los splits con ex-date en (desde, hasta]."""
+    factor = 1.0
+    for fecha, tipo, valor in actions:
+        if tipo == "SPLIT" and desde < fecha <= hasta:
+            factor *= valor
+    return factor
+
+
+def rebase_imported(rows: Iterable[Sequence], actions: Sequence[Action], fecha_at: int, qty_at: int,
+                    importado_at: int) -> Iterator[Sequence]:
+    """
+    Lleva cada saldo importado (importado_en no nulo) a la base de su fecha: cantidad / F y
+    precio x F, con F los splits entre la fecha de la fila y la importación. La cantidad importada
+    ya los refleja; al intercalarlos en el replay vuelve a la importada, mismo costo total.
+    Las demás filas (trades cargados a mano) pasan sin cambios y reciben todas las acciones.
+    """
+    for row in rows:
+        importado_en = row[importado_at]
+        if importado_en is not None:
+            factor = split_factor(actions, row[fecha_at], importado_en)
+            if factor != 1.0:
+                row = list(row)
+                row[qty_at] /= factor
+                row[qty_at + 1] *= factor  # precio
+        yield row
+
+
+def _chunks(items: List[str], size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class CorporateActionService:
+    """
+    Splits y dividendos por ticker (tabla CorporateAction), descargados de Yahoo en batch.
+    - sync: sólo los tickers no consultados en FRESHNESS_SECONDS; de los ya consultados
+      se pide la cola (desde la última consulta), de los nuevos toda la historia.
+    - Las acciones nuevas se reaplican incrementalmente: replay de posiciones desde el
+      checkpoint anterior a la acción más vieja y recálculo de lotes, sólo de esos tickers.
+    """
+    FRESHNESS_SECONDS = 24 * 3600
+    BATCH_SIZE = 50
+    # Margen al pedir la cola: Yahoo puede publicar un evento unos días tarde
+    OVERLAP_DAYS = 7
+
+    @staticmethod
+    def download(tickers: List[str], start: Optional[date] = None) -> Optional[pd.DataFrame]:
+        """Velas diarias con las columnas de acciones (Dividends, Stock Splits) de varios tickers a la vez."""
+        with timed("yahoo"):
+            if start is not None:
+                return yf.download(tickers, start=start, interval="1d", actions=True, auto_adjust=False, threads=True, progress=False)
+            return yf.download(tickers, period="max", interval="1d", actions=True, auto_adjust=False, threads=True, progress=False)
+
+    @staticmethod
+    def _frame_to_rows(data: Optional[pd.DataFrame], tickers: List[str]) -> List[Dict]:
+        """DataFrame de yf.download(actions=True) -> filas CorporateAction (sólo los días con evento)."""
+        if data is None or data.empty:
+            return []
+        multi = isinstance(data.columns, pd.MultiIndex)
+        fechas = pd.DatetimeIndex(data.index)
+        rows = []
+        for field, tipo in ACTION_FIELDS.items():
+            if multi:
+                if field not in data.columns.get_level_values(0):
+                    continue
+                block = data[field]
+            elif field in data.columns and len(tickers) == 1:
+                # Un solo ticker sin MultiIndex (versiones viejas de yfinance)
+                block = data[[field]].set_axis(tickers, axis=1)
+            else:
+                continue
+            for ticker in block.columns:
+                valores = block[ticker].to_numpy(dtype=np.float64)
+                # 0 (o NaN) = ese día no hubo evento
+                for i in np.flatnonzero(np.nan_to_num(valores) > 0).tolist():
+                    f = fechas[i]
+                    rows.append({"ticker": str(ticker).upper(), "tipo": tipo, "fecha": datetime(f.year, f.month, f.day), "valor": float(valores[i])})
+        return rows
+
+    @staticmethod
+    def actions_query(tickers: List[str], tipos: Sequence[str] = ACTION_TYPES, desde: Optional[datetime] = None):
+        query = (
+            select(CorporateAction.ticker, CorporateAction.fecha, CorporateAction.tipo, CorporateAction.valor)
+            .where(CorporateAction.ticker.in_(tickers), CorporateAction.tipo.in_(list(tipos)))
+            .order_by(CorporateAction.ticker, CorporateAction.fecha, CorporateAction.tipo)
+        )
+        if desde is not None:
+            query = query.where(CorporateAction.fecha > desde)
+        return query
+
+    @staticmethod
+    def by_ticker(session: Session, tickers: Iterable[str], tipos: Sequence[str] = ACTION_TYPES,
+                  desde: Optional[datetime] = None) -> Dict[str, List[Action]]:
+        """{TICKER: [(fecha, tipo, valor)]} ordenadas por fecha; `desde` excluye las de esa fecha o anteriores."""
+        result: Dict[str, List[Action]] = {}
+        for chunk in _chunks(sorted({t.upper() for t in tickers})):
+            query = CorporateActionService.actions_query(chunk, tipos, desde)
+            for ticker, fecha, tipo, valor in session.execute(query):
+                result.setdefault(ticker, []).append((fecha, tipo, valor))
+        return result
+
+    @staticmethod
+    def exists_since(session: Session, ticker: str, desde: datetime) -> bool:
+        """Hay alguna acción del ticker con ex-date posterior a `desde` (un trade con fecha pasada la cruza)."""
+        return session.execute(
+            select(CorporateAction.id)
+            .where(CorporateAction.ticker == ticker.upper(), CorporateAction.fecha > desde)
+            .limit(1)
+        ).first() is not None
+
+    @staticmethod
+    def _store(session: Session, rows: List[Dict]) -> List[Dict]:
+        """Inserta en bloque las acciones que no estaban guardadas. Devuelve las nuevas."""
+        if not rows:
+            return []
+        desde = min(r["fecha"] for r in rows)
+        existing = set()
+        for chunk in _chunks(sorted({r["ticker"] for r in rows})):
+            existing.update(session.execute(
+                select(CorporateAction.ticker, CorporateAction.fecha, CorporateAction.tipo)
+                .where(CorporateAction.ticker.in_(chunk), CorporateAction.fecha >= desde)
+            ).all())
+
+        added = []
+        for row in rows:
+            key = (row["ticker"], row["fecha"], row["tipo"])
+            if key not in existing:
+                existing.add(key)
+                added.append(row)
+        if added:
+            session.execute(insert(CorporateAction), added)
+        return added
+
+    @staticmethod
+    def sync(session: Session, tickers: Iterable[str], now: Optional[datetime] = None) -> Dict[str, datetime]:
+        """
+        Trae de Yahoo las acciones de los tickers vencidos, guarda las nuevas y las reaplica.
+        Devuelve {TICKER: ex-date de la acción nueva más vieja} (vacío si no hubo novedades).
+        """
+        now = now or datetime.now()
+        claves = sorted({t.upper() for t in tickers})
+        if not claves:
+            return {}
+
+        consultados = dict(session.execute(
+            select(CorporateActionSync.ticker, CorporateActionSync.actualizado).where(CorporateActionSync.ticker.in_(claves))
+        ).all())
+        limite = now - timedelta(seconds=CorporateActionService.FRESHNESS_SECONDS)
+        vencidos = [t for t in claves if t not in consultados or consultados[t] <= limite]
+        if not vencidos:
+            return {}
+
+        # Nunca consultados: historia completa; el resto, la cola desde la consulta más vieja del grupo
+        nuevos = [t for t in vencidos if t not in consultados]
+        cola = [t for t in vencidos if t in consultados]
+        grupos = [(nuevos, None)]
+        if cola:
+            start = min(consultados[t] for t in cola).date() - timedelta(days=CorporateActionService.OVERLAP_DAYS)
+            grupos.append((cola, start))
+
+        rows: List[Dict] = []
+        for grupo, start in grupos:
+            for i in range(0, len(grupo), CorporateActionService.BATCH_SIZE):
+                batch = grupo[i:i + CorporateActionService.BATCH_SIZE]
+                rows.extend(CorporateActionService._frame_to_rows(CorporateActionService.download(batch, start), batch))
+
+        added = CorporateActionService._store(session, rows)
+        session.execute(delete(CorporateActionSync).where(CorporateActionSync.ticker.in_(vencidos)))
+        session.execute(insert(CorporateActionSync), [{"ticker": t, "actualizado": now} for t in vencidos])
+
+        desde: Dict[str, datetime] = {}
+        for row in added:
+            if row["ticker"] not in desde or row["fecha"] < desde[row["ticker"]]:
+                desde[row["ticker"]] = row["fecha"]
+        if desde:
+            CorporateActionService.reapply(session, desde, commit=False)
+        session.commit()
+        return desde
+
+    @staticmethod
+    def reapply(session: Session, desde: Dict[str, datetime], commit: bool = True) -> int:
+        """
+        Reaplica acciones nuevas ({TICKER: ex-date más viejo}) a todas las cuentas que tienen el ticker:
+        replay desde el checkpoint anterior a esa fecha y lotes de esos tickers. Devuelve las posiciones tocadas.
+        """
+        from services.lot_engine import LotEngine
+        from services.position_engine import PositionEngine
+
+        holders = session.execute(
+            select(Asset.account_id, Asset.ticker).where(func.upper(Asset.ticker).in_(list(desde)))
+        ).all()
+        por_cuenta: Dict[int, List[str]] = {}
+        for account_id, ticker in holders:
+            PositionEngine.replay(session, ticker, desde=desde[ticker.upper()], account_id=account_id, commit=False)
+            por_cuenta.setdefault(account_id, []).append(ticker)
+        for account_id, account_tickers in por_cuenta.items():
+            LotEngine.recompute(session, account_tickers, commit=False, account_id=account_id)
+        if commit:
+            session.commit()
+        return len(holders)
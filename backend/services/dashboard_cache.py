@@ -0,0 +1,92 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict, Hashable, NamedTuple, Optional
+from services.data_version import data_version
+
+
+class _Entry(NamedTuple):
+    version: int
+    created: float  # monotonic
+    body: bytes     # JSON ya serializado
+    etag: str
+
+
+class DashboardCache:
+    """
+    Último resumen del dashboard por clave (None = todas las cuentas, o el id de una),
+    válido mientras no cambie `data_version` (quien llama lee antes la versión compartida
+    con data_version.refresh, así ve también las escrituras de otros workers).
+    - El TTL refresca precios/cotización aunque nadie escriba.
+    - Single-flight: si vence con varios requests a la vez, uno recalcula y el resto espera.
+    - ETag = hash del cuerpo: permite responder 304 a los que consultan periódicamente.
+    """
+    TTL_SECONDS = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _valid(self, version: int, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry and entry.version == version and time.monotonic() - entry.created < self.TTL_SECONDS:
+            return entry
+        return None
+
+    def lookup(self, key: Hashable = None) -> Optional[_Entry]:
+        """Entrada vigente para la versión actual (o None). No calcula."""
+        with self._lock:
+            entry = self._valid(data_version.current(), key)
+            if entry:
+                self.hits += 1
+            return entry
+
+    def store(self, version: int, summary: Dict, key: Hashable = None) -> _Entry:
+        """Guarda un resumen calculado con los datos de `version` (tomada antes de calcular)."""
+        body = json.dumps(summary, separators=(",", ":")).encode()
+        entry = _Entry(version, time.monotonic(), body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+        with self._lock:
+            self.misses += 1
+            # Las entradas de otras claves calculadas con datos viejos ya no sirven
+            self._entries = {k: e for k, e in self._entries.items() if e.version == version}
+            self._entries[key] = entry
+        return entry
+
+    def get(self, compute: Callable[[], Dict], key: Hashable = None) -> _Entry:
+        entry = self.lookup(key)
+        if entry:
+            return entry
+
+        with self._compute_lock:
+            # Versión tomada ANTES de calcular: si una escritura entra durante el cálculo,
+            # el próximo request ya ve otra versión y recalcula
+            version = data_version.current()
+            with self._lock:
+                entry = self._valid(version, key)
+                if entry:
+                    self.hits += 1
+                    return entry
+            return self.store(version, compute(), key)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "version": max((e.version for e in self._entries.values()), default=None),
+                "entries": len(self._entries),
+                "data_version": data_version.current(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.TTL_SECONDS,
+            }
+
+
+dashboard_cache = DashboardCache()
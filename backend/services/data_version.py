@@ -0,0 +1,108 @@
+import threading
+from itertools import chain
+from typing import Optional
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from models.models import DataVersionCounter
+from services.upsert import upsert
+
+# Tablas que alimentan el dashboard y la foto de posiciones (trades, movimientos, caja, importaciones, settings, precios, cuentas)
+TRACKED_TABLES = {"asset", "tradehistory", "transaction", "cashbalance", "brokercash", "brokersettings", "account"}
+
+_PENDING = "data_version_pending"
+
+_COUNTER = DataVersionCounter.__table__
+SHARED_VERSION_QUERY = select(_COUNTER.c.version).where(_COUNTER.c.id == 1)
+
+
+class DataVersion:
+    """
+    Contador que cambia con cada escritura que afecta al dashboard, compartido entre workers.
+    - Tras el commit de una sesión que tocó TRACKED_TABLES (ORM o insert/update/delete en bloque)
+      se incrementa DataVersionCounter en su propia transacción (upsert, sin leer antes).
+    - Cada proceso sigue la versión de la DB con refresh() al empezar una lectura cacheada:
+      si cambió (la escribió otro worker o este), cambia current().
+    - La cotización del dólar es por proceso: su cambio sólo mueve la parte local.
+    current() es un entero que sólo crece; sirve de clave para las cachés en memoria.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+        self._shared: Optional[int] = None  # Último valor visto de DataVersionCounter
+
+    def current(self) -> int:
+        with self._lock:
+            return self._value
+
+    def bump(self) -> int:
+        """Cambio sólo de este proceso (cotización)."""
+        with self._lock:
+            self._value += 1
+            return self._value
+
+    def observe(self, shared: Optional[int]) -> int:
+        """Registra el valor de la DB; si difiere del último visto, cambia la versión."""
+        with self._lock:
+            if shared is not None and shared != self._shared:
+                self._shared = shared
+                self._value += 1
+            return self._value
+
+    def publish(self, bind) -> int:
+        """Incrementa la versión compartida (commit propio) y la registra."""
+        statement = upsert(
+            bind.dialect.name, _COUNTER, {"id": 1, "version": 1}, ["id"], {"version": _COUNTER.c.version + 1}
+        ).returning(_COUNTER.c.version)
+        if isinstance(bind, Engine):
+            with bind.begin() as conn:
+                shared = conn.execute(statement).scalar_one()
+        else:
+            # Sesión atada a una conexión: va en la transacción de quien la maneja
+            shared = bind.execute(statement).scalar_one()
+        return self.observe(shared)
+
+    def refresh(self, session: Session) -> int:
+        """Lee la versión compartida (una fila por PK) antes de consultar una caché."""
+        return self.observe(session.execute(SHARED_VERSION_QUERY).scalar_one_or_none())
+
+    async def refresh_async(self, session) -> int:
+        """Igual que refresh con AsyncSession."""
+        return self.observe((await session.execute(SHARED_VERSION_QUERY)).scalar_one_or_none())
+
+
+data_version = DataVersion()
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed_writes(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if getattr(obj, "__tablename__", None) in TRACKED_TABLES:
+            session.info[_PENDING] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in TRACKED_TABLES:
+            orm_execute_state.session.info[_PENDING] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    if session.info.pop(_PENDING, False):
+        try:
+            data_version.publish(session.get_bind())
+        except Exception as e:
+            # Los datos ya están guardados: al menos este proceso invalida sus cachés
+            # (los demás workers las renuevan por TTL)
+            print(f"WARNING: No se pudo publicar la versión de datos ({e}).")
+            data_version.bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: índices de `n_out` puntos que preservan la forma de la serie.
+    - El primer y el último punto se conservan siempre.
+    - El resto se divide en n_out - 2 buckets; de cada uno se elige el punto que forma
+      el triángulo de mayor área con el punto elegido antes y el promedio del bucket siguiente.
+    Si la serie ya tiene <= n_out puntos (o n_out < 3) se devuelven todos los índices.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bordes de los buckets sobre [1, n - 1): paso >= 1, ningún bucket queda vacío
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+
+    # Promedio de cada bucket (vectorizado); el "siguiente" del último bucket es el último punto
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    next_x = np.append(avg_x[1:], x[n - 1])
+    next_y = np.append(avg_y[1:], y[n - 1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        # Área (x2) del triángulo (a, candidato, promedio siguiente) para todo el bucket
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
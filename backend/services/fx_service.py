@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+import requests
+from services.data_version import data_version
+from services.metrics import timed
+
+DOLAR_API_URL = os.environ.get("DOLAR_API_URL", "https://uy.dolarapi.com/v1/cotizaciones/usd")
+
+
+class FxRateService:
+    """
+    Cotización USD/UYU con caché (stale-while-revalidate):
+    - Si la última cotización buena venció, se devuelve igual y se refresca en background.
+    - Si dolarapi está caído, se sigue sirviendo el último valor bueno marcado como `stale`.
+    - Sólo el primer request del proceso (sin ningún valor) espera a la API.
+    """
+    TTL_SECONDS = 5 * 60
+    TIMEOUT_SECONDS = 3
+    # Tras un fallo en frío no volvemos a bloquear requests durante este lapso
+    RETRY_COOLDOWN_SECONDS = 30
+    # Último recurso si nunca obtuvimos una cotización (mismo backup que tenía /api/dolar-uy)
+    FALLBACK = {"moneda": "USD", "compra": 39.0, "venta": 41.0, "fecha": "", "fuente": "Backup (Error API)"}
+
+    def __init__(self, url: str):
+        self.url = url
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._quote: Optional[Dict] = None
+        self._fetched_at: Optional[float] = None  # monotonic
+        self._refreshing = False
+        self._thread: Optional[threading.Thread] = None
+        # Cambia con clear(): un fetch lanzado antes no pisa el estado nuevo
+        self._generation = 0
+        self._last_error: Optional[str] = None
+        self._failed_at: Optional[float] = None  # monotonic
+
+    def _fetch(self) -> Dict:
+        with timed("fx"):
+            resp = requests.get(self.url, timeout=self.TIMEOUT_SECONDS)
+            resp.raise_for_status()
+        data = resp.json()
+        venta = float(data.get("venta") or 0)
+        if venta <= 0:
+            raise ValueError("Cotización inválida (venta <= 0)")
+        return {
+            "moneda": data.get("moneda", "USD"),
+            "compra": float(data.get("compra") or 0),
+            "venta": venta,
+            "fecha": data.get("fechaActualizacion", ""),
+            "fuente": "DolarApi.com",
+        }
+
+    def refresh(self, only_if_missing: bool = False) -> bool:
+        """Consulta la API (bloqueante). Devuelve True si hay una cotización nueva."""
+        with self._fetch_lock:
+            if only_if_missing and self._quote is not None:
+                # Otro request la trajo mientras esperábamos el lock
+                return True
+            with self._lock:
+                generation = self._generation
+            try:
+                quote = self._fetch()
+            except Exception as e:
+                print(f"Error obteniendo dólar: {e}")
+                with self._lock:
+                    if generation != self._generation:
+                        return False
+                    self._last_error = str(e)
+                    self._failed_at = time.monotonic()
+                return False
+            with self._lock:
+                if generation != self._generation:
+                    return False
+                changed = self._quote is None or (self._quote["compra"], self._quote["venta"]) != (quote["compra"], quote["venta"])
+                self._quote = quote
+                self._fetched_at = time.monotonic()
+                self._last_error = None
+                self._failed_at = None
+            if changed:
+                # El dashboard cacheado depende de la cotización
+                data_version.bump()
+            return True
+
+    def refresh_async(self):
+        """Lanza un refresh en background (uno por vez)."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    if self._thread is threading.current_thread():
+                        self._refreshing = False
+                        self._thread = None
+
+        thread = threading.Thread(target=run, name="fx-refresh", daemon=True)
+        with self._lock:
+            self._thread = thread
+        thread.start()
+
+    def get_quote(self) -> Dict:
+        """
+        Devuelve la cotización con metadatos de frescura:
+        {"moneda", "compra", "venta", "fecha", "fuente", "stale", "edad_segundos"}.
+        """
+        with self._lock:
+            has_quote = self._quote is not None
+            cooling_down = self._failed_at is not None and time.monotonic() - self._failed_at < self.RETRY_COOLDOWN_SECONDS
+
+        if not has_quote:
+            if cooling_down:
+                # La API acaba de fallar: servimos el backup y reintentamos en background
+                self.refresh_async()
+            else:
+                # Arranque en frío: no hay nada que servir, esperamos una vez a la API
+                self.refresh(only_if_missing=True)
+
+        with self._lock:
+            if self._quote is None:
+                return {**self.FALLBACK, "stale": True, "edad_segundos": None, "error": self._last_error}
+            age = time.monotonic() - self._fetched_at
+            expired = age >= self.TTL_SECONDS
+            result = {**self._quote, "stale": expired or self._last_error is not None, "edad_segundos": round(age, 1)}
+
+        if expired:
+            self.refresh_async()
+        return result
+
+    def clear(self, timeout: Optional[float] = None):
+        """
+        Olvida la cotización. Espera (hasta `timeout`, por defecto TIMEOUT_SECONDS) al refresh en
+        background en curso; si sigue corriendo, su resultado se descarta al terminar.
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.TIMEOUT_SECONDS if timeout is None else timeout)
+        with self._lock:
+            self._generation += 1
+            self._refreshing = False
+            self._thread = None
+            self._quote = None
+            self._fetched_at = None
+            self._last_error = None
+            self._failed_at = None
+
+
+# Instancia compartida por dashboard y /api/dolar-uy
+fx_service = FxRateService(DOLAR_API_URL)
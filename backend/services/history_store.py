@@ -0,0 +1,223 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+from models.models import PriceBar, PriceSeries
+from services.metrics import timed
+from services.networth_history import NOT_AN_INPUT
+
+# Ventana (segundos) que cubre cada `period` de Yahoo; None = toda la historia.
+# "5d" son 5 ruedas: una semana calendario para no perder días por el fin de semana.
+PERIOD_SECONDS = {
+    "1d": 86400,
+    "5d": 7 * 86400,
+    "1mo": 31 * 86400,
+    "3mo": 92 * 86400,
+    "6mo": 183 * 86400,
+    "1y": 366 * 86400,
+    "2y": 731 * 86400,
+    "5y": 1827 * 86400,
+    "max": None,
+}
+
+_EMPTY = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+
+class HistoryStore:
+    """
+    Caché local (tabla PriceBar) de velas OHLC por (ticker, intervalo).
+    - Primera consulta de un rango: descarga el `period` completo de Yahoo.
+    - Consultas siguientes: sólo la cola faltante (desde el día de la última vela),
+      y como mucho una vez cada FRESHNESS_SECONDS.
+    - La lectura es una sola query por columnas -> arrays numpy.
+    - Si la cola trae un split nuevo, Yahoo ya re-escaló las velas anteriores:
+      se descartan las guardadas del ticker y se vuelve a bajar el rango completo.
+    - Las velas intradiarias se guardan sólo RETENTION_SECONDS hacia atrás.
+    Si Yahoo falla y hay velas guardadas, se sirven las locales.
+    """
+    FRESHNESS_SECONDS = 15 * 60
+    INSERT_BATCH_SIZE = 1000
+    # Ventana guardada por intervalo intradiario (el gráfico usa 15m para 1D y 60m para 1W)
+    RETENTION_SECONDS = {"15m": 7 * 86400, "60m": 31 * 86400}
+
+    @staticmethod
+    def _download(ticker: str, interval: str, period: Optional[str] = None, start=None) -> pd.DataFrame:
+        ticker_obj = yf.Ticker(ticker)
+        with timed("yahoo"):
+            if start is not None:
+                return ticker_obj.history(start=start, interval=interval, auto_adjust=False)
+            return ticker_obj.history(period=period, interval=interval, auto_adjust=False)
+
+    @staticmethod
+    def _frame_to_rows(ticker: str, interval: str, hist: Optional[pd.DataFrame]) -> List[Dict]:
+        """DataFrame de yfinance -> filas PriceBar (descarta velas sin Close)."""
+        if hist is None or hist.empty or "Close" not in hist.columns:
+            return []
+        close = hist["Close"].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(close)
+        # asi8 es UTC para índices con timezone (y naive se interpreta como UTC, igual que Timestamp.timestamp())
+        ts = pd.DatetimeIndex(hist.index).as_unit("s").asi8[valid]
+
+        def column(name: str) -> np.ndarray:
+            if name in hist.columns:
+                return hist[name].to_numpy(dtype=np.float64)[valid]
+            return close[valid]
+
+        volume = hist["Volume"].to_numpy(dtype=np.float64)[valid] if "Volume" in hist.columns else np.full(len(ts), np.nan)
+        return [
+            {"ticker": ticker, "intervalo": interval, "ts": t, "open": o, "high": h, "low": l, "close": c,
+             "volume": None if np.isnan(v) else v}
+            for t, o, h, l, c, v in zip(
+                ts.tolist(), column("Open").tolist(), column("High").tolist(), column("Low").tolist(),
+                close[valid].tolist(), volume.tolist(),
+            )
+        ]
+
+    @staticmethod
+    def _has_split_after(hist: Optional[pd.DataFrame], last_ts: int) -> bool:
+        """La descarga trae un split posterior a la última vela guardada (Close cambia de base)."""
+        if hist is None or hist.empty or "Stock Splits" not in hist.columns:
+            return False
+        splits = np.nan_to_num(hist["Stock Splits"].to_numpy(dtype=np.float64))
+        ts = pd.DatetimeIndex(hist.index).as_unit("s").asi8
+        return bool(np.any((splits > 0) & (ts > last_ts)))
+
+    @staticmethod
+    def invalidate(session: Session, tickers: List[str]):
+        """Descarta velas y cobertura de `tickers` (todos los intervalos): la próxima consulta baja todo."""
+        claves = sorted({t.upper() for t in tickers})
+        if not claves:
+            return
+        session.execute(delete(PriceBar).where(PriceBar.ticker.in_(claves)))
+        session.execute(delete(PriceSeries).where(PriceSeries.ticker.in_(claves)))
+
+    @staticmethod
+    def _prune(session: Session, ticker: str, interval: str, meta: PriceSeries):
+        """Borra las velas intradiarias fuera de la ventana de retención y ajusta la cobertura."""
+        keep = HistoryStore.RETENTION_SECONDS.get(interval)
+        last_ts = HistoryStore._last_ts(session, ticker, interval)
+        if keep is None or last_ts is None:
+            return
+        cutoff = last_ts - keep
+        session.execute(
+            delete(PriceBar).where(PriceBar.ticker == ticker, PriceBar.intervalo == interval, PriceBar.ts < cutoff),
+            execution_options=NOT_AN_INPUT,
+        )
+        if meta.inicio is not None and meta.inicio < cutoff:
+            meta.inicio = cutoff
+
+    @staticmethod
+    def _store(session: Session, ticker: str, interval: str, rows: List[Dict]):
+        """Reemplaza las velas del rango descargado (la última vela del día puede estar incompleta)."""
+        if not rows:
+            return
+        first = min(r["ts"] for r in rows)
+        last = max(r["ts"] for r in rows)
+        session.execute(
+            delete(PriceBar).where(
+                PriceBar.ticker == ticker,
+                PriceBar.intervalo == interval,
+                PriceBar.ts >= first,
+                PriceBar.ts <= last,
+            ),
+            # El insert que sigue invalida la serie desde la primera vela
+            execution_options=NOT_AN_INPUT,
+        )
+        for i in range(0, len(rows), HistoryStore.INSERT_BATCH_SIZE):
+            session.execute(insert(PriceBar), rows[i:i + HistoryStore.INSERT_BATCH_SIZE])
+
+    @staticmethod
+    def _last_ts(session: Session, ticker: str, interval: str) -> Optional[int]:
+        return session.exec(
+            select(func.max(PriceBar.ts)).where(PriceBar.ticker == ticker, PriceBar.intervalo == interval)
+        ).one()
+
+    @staticmethod
+    def sync(session: Session, ticker: str, period: str, interval: str, now: Optional[datetime] = None):
+        """Trae de Yahoo lo que falte para cubrir `period` y guarda las velas."""
+        if period not in PERIOD_SECONDS:
+            raise ValueError(f"Período no soportado: {period}")
+        now = now or datetime.now()
+        span = PERIOD_SECONDS[period]
+        desde = None if span is None else int(now.timestamp()) - span
+
+        meta = session.get(PriceSeries, (ticker, interval))
+        covered = meta is not None and (
+            meta.completo or (desde is not None and meta.inicio is not None and meta.inicio <= desde)
+        )
+        last_ts = HistoryStore._last_ts(session, ticker, interval)
+
+        if covered and last_ts is not None:
+            if now - meta.actualizado < timedelta(seconds=HistoryStore.FRESHNESS_SECONDS):
+                return
+            # Sólo la cola: desde el día de la última vela guardada
+            start = datetime.fromtimestamp(last_ts, tz=timezone.utc).date()
+            hist = HistoryStore._download(ticker, interval, start=start)
+            if HistoryStore._has_split_after(hist, last_ts):
+                # Las velas guardadas quedaron en la base de ajuste anterior al split
+                HistoryStore.invalidate(session, [ticker])
+                meta, covered = None, False
+                hist = HistoryStore._download(ticker, interval, period=period)
+        else:
+            hist = HistoryStore._download(ticker, interval, period=period)
+
+        rows = HistoryStore._frame_to_rows(ticker, interval, hist)
+        if not rows and meta is None:
+            # Ticker sin datos: no registramos cobertura, se reintenta en la próxima consulta
+            return
+
+        HistoryStore._store(session, ticker, interval, rows)
+        if meta is None:
+            meta = PriceSeries(ticker=ticker, intervalo=interval)
+        if not covered:
+            meta.completo = meta.completo or span is None
+            if desde is not None:
+                meta.inicio = desde if meta.inicio is None else min(meta.inicio, desde)
+        HistoryStore._prune(session, ticker, interval, meta)
+        meta.actualizado = now
+        session.add(meta)
+        session.commit()
+
+    @staticmethod
+    def read(session: Session, ticker: str, period: str, interval: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Velas guardadas del rango como arrays (ts en Unix seconds, close)."""
+        last_ts = HistoryStore._last_ts(session, ticker, interval)
+        if last_ts is None:
+            return _EMPTY
+
+        query = select(PriceBar.ts, PriceBar.close).where(PriceBar.ticker == ticker, PriceBar.intervalo == interval)
+        span = PERIOD_SECONDS.get(period)
+        if period == "1d":
+            # Última rueda completa (como Yahoo), aunque hoy el mercado no haya abierto
+            query = query.where(PriceBar.ts >= last_ts - last_ts % 86400)
+        elif span is not None:
+            query = query.where(PriceBar.ts >= last_ts - span)
+        rows = session.exec(query.order_by(PriceBar.ts)).all()
+        if not rows:
+            return _EMPTY
+
+        ts = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        close = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        return ts, close
+
+    @staticmethod
+    def get_series(session: Session, ticker: str, period: str, interval: str, now: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Sincroniza la cola faltante (si corresponde) y devuelve la serie local."""
+        ticker = ticker.upper()
+        try:
+            HistoryStore.sync(session, ticker, period, interval, now)
+        except Exception as e:
+            session.rollback()
+            if HistoryStore._last_ts(session, ticker, interval) is None:
+                raise
+            print(f"WARNING: No se pudo actualizar el histórico de {ticker} ({e}). Se sirven velas locales.")
+        return HistoryStore.read(session, ticker, period, interval)
+
+    @staticmethod
+    def to_points(ts: np.ndarray, close: np.ndarray) -> List[Dict]:
+        """Serialización vectorizada al formato del gráfico: [{"time", "value"}]."""
+        # round() de Python (no np.round) para redondear igual que antes (half-even sobre el decimal exacto)
+        return [{"time": t, "value": round(v, 2)} for t, v in zip(ts.tolist(), close.tolist())]
@@ -1,112 +1,242 @@
+import codecs
+import io
 import json
-from sqlmodel import Session, select
-from models.models import Asset
+import math
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from sqlmodel import Session
+from sqlalchemy import insert
+from models.models import DEFAULT_ACCOUNT_ID, TradeHistory
+from services.market_service import MarketDataService
+from services.lot_engine import LotEngine
+from services.metrics import current_span, traced
+from services.position_engine import PositionEngine
+
+# Fecha base de los snapshots importados (quedan al inicio del historial)
+SNAPSHOT_DATE = datetime(2024, 1, 1)
+
+# Filas TradeHistory acumuladas antes de cada bulk insert
+IMPORT_BATCH_SIZE = 1000
+
+_WHITESPACE = re.compile(r"\s*")
+_FENCE = re.compile(r"```[A-Za-z]*")
+
+
+class _JsonArrayStream:
+    """
+    Parser incremental de un array JSON: lee el input por chunks y devuelve
+    un elemento por vez. La memoria queda acotada al chunk + el elemento actual.
+    Tolera el wrapper de markdown ```json ... ```.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, read):
+        self._read = read
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        chunk = self._read(self.CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        # Descartamos lo ya consumido para no acumular el archivo entero
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self, size: int = 1) -> str:
+        """Salta espacios y devuelve los próximos `size` caracteres (vacío si EOF)."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if len(self._buf) - self._pos >= size or self._eof:
+                return self._buf[self._pos:self._pos + size]
+            self._fill()
+
+    def _skip_fence(self):
+        if self._peek(3) == "```":
+            # Aseguramos tener el identificador de lenguaje completo en el buffer
+            while not self._eof and len(self._buf) - self._pos < 16:
+                self._fill()
+            self._pos = _FENCE.match(self._buf, self._pos).end()
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # Si el valor termina justo al final del buffer puede estar truncado (ej: números)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f"Error parseando JSON: {str(e)}")
+            self._fill()
+
+    def __iter__(self) -> Iterator:
+        self._skip_fence()
+        first = self._peek()
+        if not first:
+            raise ValueError("Error parseando JSON: contenido vacío")
+        if first != "[":
+            raise ValueError("El JSON debe ser una lista de objetos.")
+        self._pos += 1
+
+        if self._peek() == "]":
+            self._pos += 1
+        else:
+            while True:
+                yield self._decode_value()
+                sep = self._peek()
+                self._pos += 1
+                if sep == "]":
+                    break
+                if sep != ",":
+                    raise ValueError(f"Error parseando JSON: se esperaba ',' o ']' y llegó {sep!r}")
+
+        # Cierre opcional del bloque markdown
+        if self._peek(3) == "```":
+            self._pos += 3
+        if self._peek():
+            raise ValueError("Error parseando JSON: contenido extra después de la lista")
+
 
 class ImportService:
     @staticmethod
-    def parse_unstructured_text(text: str):
+    def iter_positions(source: Union[str, bytes, io.IOBase]) -> Iterator:
         """
-        Intenta parsear texto a JSON.
-        Esta función es un placeholder para futura integración con IA.
-        Por ahora, asume que el input es un JSON string válido.
+        Generador: devuelve las posiciones del snapshot de a una.
+        Acepta el string de ImportRequest.content o un archivo (texto o binario, ej: UploadFile.file).
         """
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        if isinstance(source, str):
+            read = io.StringIO(source).read
+        elif isinstance(source, io.TextIOBase):
+            read = source.read
+        else:
+            # Binario: decodificamos incrementalmente (tolera BOM)
+            decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+            def read(size: int) -> str:
+                chunk = source.read(size)
+                return decoder.decode(chunk or b"", final=not chunk)
+
+        return iter(_JsonArrayStream(read))
+
+    @staticmethod
+    def validate_row(idx: int, item) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        Valida una fila del snapshot.
+        Devuelve (fila TradeHistory lista para insertar, None) o (None, error).
+        """
+        if not isinstance(item, dict):
+            return None, {"fila": idx, "ticker": None, "error": "La fila debe ser un objeto JSON"}
+
+        # 1. Validar claves
+        ticker = item.get("Ticker")
+        cantidad = item.get("Cantidad_Total")
+        precio_promedio_float = item.get("Precio_Promedio")
+
+        if not ticker or cantidad is None or precio_promedio_float is None:
+            return None, {"fila": idx, "ticker": ticker, "error": "Faltan campos: Ticker, Cantidad_Total o Precio_Promedio"}
+
+        # Normalizar ticker
+        ticker_normalized = str(ticker).strip().upper()
+
+        # 2. Conversión de Tipos
         try:
-            # Limpieza básica por si viene con markdown blocks ```json ... ```
-            clean_text = text.strip()
-            if clean_text.startswith("```json"):
-                clean_text = clean_text[7:]
-            if clean_text.startswith("```"):
-                clean_text = clean_text[3:]
-            if clean_text.endswith("```"):
-                clean_text = clean_text[:-3]
-            
-            return json.loads(clean_text)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Error parseando JSON: {str(e)}")
+            cantidad_float = float(cantidad)
+            precio_promedio_float = float(precio_promedio_float)
+            # "Infinity" / "1e400" / "NaN" parsean como float pero no son montos válidos
+            if not (math.isfinite(cantidad_float) and math.isfinite(precio_promedio_float)):
+                raise ValueError
+            precio_promedio_cents = int(round(precio_promedio_float * 100))
+        except (TypeError, ValueError, OverflowError):
+            return None, {"fila": idx, "ticker": ticker_normalized, "error": "Cantidad_Total y Precio_Promedio deben ser numéricos"}
+
+        if cantidad_float < 0 or precio_promedio_cents < 0:
+            return None, {"fila": idx, "ticker": ticker_normalized, "error": "Cantidad_Total y Precio_Promedio no pueden ser negativos"}
+
+        # CRÍTICO: No tocamos Asset directamente.
+        # Creamos una transacción "BUY" histórica base (Costo Base Aproximado).
+        return {
+            "ticker": ticker_normalized,
+            "tipo": "BUY", # Tratamos el saldo inicial como una COMPRA
+            "cantidad": cantidad_float,
+            "precio": precio_promedio_cents,
+            "total": int(round(cantidad_float * precio_promedio_cents)),
+            "commission": 0,
+            "fecha": SNAPSHOT_DATE, # Fecha base fija para ordenar al inicio
+            "ganancia_realizada": 0,
+        }, None
 
     @staticmethod
-    def import_snapshot(session: Session, content: str):
+    @traced("import_snapshot")
+    def import_snapshot(session: Session, content: Union[str, bytes, io.IOBase], account_id: int = DEFAULT_ACCOUNT_ID):
         """
-        Procesa el JSON de snapshot y actualiza/crea los assets.
+        Procesa el JSON de snapshot y actualiza/crea los assets en lote.
         JSON Esperado:
         [
             { "Ticker": "ADBE", "Cantidad_Total": 0.03047, "Precio_Promedio": 370.8 },
             ...
         ]
+        Pipeline: parseo incremental -> validación por fila -> bulk inserts por bloques
+        -> replay de los tickers afectados en una pasada -> un commit -> una descarga de precios.
+        `content` puede ser el string del request o un archivo subido.
+        Las posiciones van a la cuenta `account_id`, marcadas con el momento de la importación
+        (importado_en): los splits/dividendos anteriores ya están en la cantidad y no se reaplican.
         """
-        data = ImportService.parse_unstructured_text(content)
-        
-        if not isinstance(data, list):
-            raise ValueError("El JSON debe ser una lista de objetos.")
+        importado_en = datetime.now()
+        processed = 0
+        errors: List[Dict] = []
+        tickers = set()
+        batch: List[Dict] = []
 
-        processed_count = 0
-        
-        
-        # Guardamos inicialmente para asegurar que el Asset tiene estado base en DB (aunque no es estrictamente necesario si usamos el objeto en memoria, pero el usuario pidió commit dentro del loop o flujo similar, aqui haremos upsert y luego precio)
-        # El usuario pidió: "Dentro del bucle... despues de session.add y session.commit... llama a MarketService"
-        # Para eficiencia, podemos mantener el session.add(asset) en el loop, y llamar al servicio al final, PERO el usuario fue especifico sobre "Inmediatamente despues". 
-        # Si hacemos commit por cada uno es lento. Mejor haremos un commit intermedio si es critico o usamos el objeto asset que ya está "attached" a la session.
-        # Vamos a seguir la instruccion de "Dentro del bucle" para asegurar que cada activo quede listo.
-        
-        from services.market_service import MarketDataService
-
-        from models.models import TradeHistory
-        from services.portfolio_service import PortfolioService
-        from datetime import datetime
-
-        for item in data:
-            # 1. Validar claves
-            ticker = item.get("Ticker")
-            cantidad = item.get("Cantidad_Total")
-            precio_promedio_float = item.get("Precio_Promedio")
-
-            if not ticker or cantidad is None or precio_promedio_float is None:
-                continue
-
-            # Normalizar ticker
-            ticker_normalized = str(ticker).strip().upper()
-
-            # 2. Conversión de Tipos
-            precio_promedio_cents = int(round(precio_promedio_float * 100))
-            cantidad_float = float(cantidad)
-            
-            # CRÍTICO: No tocamos Asset directamente.
-            # Creamos una transacción "BUY" histórica base.
-            
-            # Calcular total (Costo Base Aproximado)
-            total_cents = int(round(cantidad_float * precio_promedio_cents))
-
-            # Verificar si ya existe alguna historia para no duplicar en importaciones sucesivas?
-            # Por simplicidad del requerimiento "Event Replay", asumimos que es una importación
-            # o snapshot. Idealmente borraríamos historia previa si es un "Full Import".
-            # Pero agregaremos un flag o description para identificarlo.
-            
-            hist_entry = TradeHistory(
-                ticker=ticker_normalized,
-                tipo="BUY", # Tratamos el saldo inicial como una COMPRA
-                cantidad=cantidad_float,
-                precio=precio_promedio_cents,
-                total=total_cents,
-                commission=0,
-                fecha=datetime(2024, 1, 1), # Fecha base fija para ordenar al inicio
-                ganancia_realizada=0
-            )
-            
-            session.add(hist_entry)
-            session.commit() # Guardar historia
-            
-            # 3. TRIGGER EVENT REPLAY
-            PortfolioService.recalculate_asset_from_history(session, ticker_normalized)
-            
-            # 4. Actualizar Precio Mercado (Opcional, pero bueno para UX inmediata)
+        try:
+            for idx, item in enumerate(ImportService.iter_positions(content)):
+                row, error = ImportService.validate_row(idx, item)
+                if error:
+                    errors.append(error)
+                    continue
+
+                row["account_id"] = account_id
+                row["importado_en"] = importado_en
+                row["usar_caja_broker"] = False
+                batch.append(row)
+                tickers.add(row["ticker"])
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    session.execute(insert(TradeHistory), batch)
+                    processed += len(batch)
+                    batch = []
+
+            if batch:
+                session.execute(insert(TradeHistory), batch)
+                processed += len(batch)
+
+            # TRIGGER EVENT REPLAY (sólo tickers afectados, sin commits intermedios)
+            current_span().rows(processed)
+            assets = PositionEngine.rebuild(session, tickers, commit=False, account_id=account_id)
+            LotEngine.recompute(session, tickers, commit=False, account_id=account_id)
+            session.commit()
+        except Exception:
+            # JSON inválido a mitad de archivo: no dejamos importaciones parciales
+            session.rollback()
+            raise
+
+        # Actualizar Precio Mercado en un solo batch (Opcional, pero bueno para UX inmediata)
+        if assets:
             try:
-                # Buscamos el asset recién creado/actualizado por el Replay
-                asset = session.exec(select(Asset).where(Asset.ticker == ticker_normalized)).first()
-                if asset:
-                    MarketDataService.get_market_prices(session, [asset])
-            except Exception:
-                pass
-            
-            processed_count += 1
-        
-        return {"processed": processed_count, "message": "Importación completada exitosamente"}
+                MarketDataService.get_market_prices(session, list(assets.values()))
+            except Exception as e:
+                print(f"Error actualizando precios tras importación: {e}")
+
+        return {
+            "processed": processed,
+            "errors": errors,
+            "message": "Importación completada exitosamente" if not errors else f"Importación completada con {len(errors)} errores"
+        }
@@ -0,0 +1,210 @@
+from array import array
+from itertools import groupby
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import bindparam, update
+from sqlmodel import Session, select
+
+from models.models import DEFAULT_ACCOUNT_ID, BrokerSettings, TradeHistory
+from services.corporate_actions import CorporateActionService, interleave, rebase_imported
+from services.networth_history import NOT_AN_INPUT
+
+LOT_METHODS = ("FIFO", "LIFO", "AVERAGE")
+DEFAULT_LOT_METHOD = "AVERAGE"
+
+# Remanentes menores se consideran lote/posición cerrada (mismo umbral que apply_trade)
+EPSILON = 0.000001
+
+
+class LotBook:
+    """
+    Lotes abiertos de un ticker en dos arrays paralelos: cantidad y costo unitario
+    (CENTS por acción, con la comisión de compra prorrateada).
+    - FIFO consume desde `head` (los lotes consumidos se compactan de a bloques).
+    - LIFO consume desde el final.
+    - AVERAGE mantiene un único lote con el costo promedio (mismo resultado que apply_trade).
+    """
+    __slots__ = ("method", "qty", "cost", "head")
+
+    def __init__(self, method: str = DEFAULT_LOT_METHOD):
+        if method not in LOT_METHODS:
+            raise ValueError(f"Método de lotes inválido: {method}")
+        self.method = method
+        self.qty = array("d")
+        self.cost = array("d")
+        self.head = 0
+
+    def buy(self, qty: float, price_cents: float, comm_cents: float = 0.0):
+        if qty <= 0:
+            return
+        total = qty * price_cents + comm_cents
+        if self.method == "AVERAGE" and self.qty:
+            shares = self.qty[0] + qty
+            self.cost[0] = (self.qty[0] * self.cost[0] + total) / shares
+            self.qty[0] = shares
+        else:
+            self.qty.append(qty)
+            self.cost.append(total / qty)
+
+    def _consume(self, qty: float) -> float:
+        """Saca `qty` acciones de los lotes según el método y devuelve su costo (CENTS)."""
+        qtys, costs = self.qty, self.cost
+        remaining, consumed = qty, 0.0
+
+        if self.method == "LIFO":
+            while remaining > EPSILON and len(qtys) > self.head:
+                take = min(remaining, qtys[-1])
+                consumed += take * costs[-1]
+                remaining -= take
+                if qtys[-1] - take <= EPSILON:
+                    qtys.pop()
+                    costs.pop()
+                else:
+                    qtys[-1] -= take
+            return consumed
+
+        # FIFO (y AVERAGE, que tiene un único lote en head)
+        head, n = self.head, len(qtys)
+        while remaining > EPSILON and head < n:
+            take = min(remaining, qtys[head])
+            consumed += take * costs[head]
+            remaining -= take
+            if qtys[head] - take <= EPSILON:
+                head += 1
+            else:
+                qtys[head] -= take
+        if head == n:
+            del qtys[:], costs[:]
+            head = 0
+        elif head > 64 and 2 * head > n:
+            del qtys[:head], costs[:head]
+            head = 0
+        self.head = head
+        return consumed
+
+    def split(self, ratio: float):
+        """Split `ratio`:1 -> cada lote abierto tiene `ratio` veces más acciones al mismo costo total."""
+        if ratio <= 0:
+            return
+        for i in range(self.head, len(self.qty)):
+            self.qty[i] *= ratio
+            self.cost[i] /= ratio
+
+    def sell(self, qty: float, price_cents: float, comm_cents: float = 0.0) -> float:
+        """Vende `qty` y devuelve la ganancia realizada (CENTS, sin redondear): neto - costo de los lotes."""
+        if qty <= 0:
+            return 0.0
+        proceeds = qty * price_cents - comm_cents
+        return proceeds - self._consume(qty)
+
+    @property
+    def shares(self) -> float:
+        return sum(self.qty[self.head:])
+
+    @property
+    def cost_basis(self) -> float:
+        return sum(q * c for q, c in zip(self.qty[self.head:], self.cost[self.head:]))
+
+    def open_lots(self) -> List[Tuple[float, float]]:
+        """[(cantidad, costo unitario CENTS)] en orden de apertura."""
+        return list(zip(self.qty[self.head:], self.cost[self.head:]))
+
+
+class LotResult(NamedTuple):
+    book: LotBook
+    realized: Dict[int, int]  # trade_id de cada SELL -> ganancia realizada (CENTS)
+
+
+def replay_lots(rows: Iterable[Sequence], method: str = DEFAULT_LOT_METHOD) -> LotResult:
+    """
+    Reproduce filas (id, tipo, cantidad, precio, commission) de UN ticker, ya ordenadas por (fecha, id).
+    Un SPLIT (id None, cantidad = relación) reparte los lotes abiertos; los demás tipos
+    (DIVIDEND, DEPOSIT, ...) no afectan los lotes.
+    """
+    book = LotBook(method)
+    realized: Dict[int, int] = {}
+    buy, sell = book.buy, book.sell
+    for trade_id, tipo, qty, price_cents, comm_cents in rows:
+        if tipo == "BUY":
+            buy(qty or 0.0, price_cents, comm_cents or 0)
+        elif tipo == "SELL":
+            realized[trade_id] = int(round(sell(qty or 0.0, price_cents, comm_cents or 0)))
+        elif tipo == "SPLIT":
+            book.split(qty)
+    return LotResult(book, realized)
+
+
+class LotEngine:
+    """
+    Lotes abiertos y P&L realizado por ticker según el método elegido en el BrokerSettings
+    de la cuenta (FIFO / LIFO / AVERAGE). Recalcula el historial de una cuenta en una pasada:
+    una consulta ordenada por (ticker, fecha, id), los splits intercalados y un UPDATE por
+    lotes de ganancia_realizada.
+    """
+
+    @staticmethod
+    def get_method(session: Session, account_id: int = DEFAULT_ACCOUNT_ID) -> str:
+        settings = session.get(BrokerSettings, account_id)
+        return settings.lot_method if settings and settings.lot_method else DEFAULT_LOT_METHOD
+
+    @staticmethod
+    def _history_query(tickers: Optional[Sequence[str]] = None, account_id: int = DEFAULT_ACCOUNT_ID):
+        query = (
+            select(
+                TradeHistory.ticker,
+                TradeHistory.id,
+                TradeHistory.tipo,
+                TradeHistory.cantidad,
+                TradeHistory.precio,
+                TradeHistory.commission,
+                TradeHistory.fecha,
+                TradeHistory.importado_en,
+            )
+            .where(TradeHistory.account_id == account_id, TradeHistory.tipo.in_(("BUY", "SELL")))
+            .order_by(TradeHistory.ticker, TradeHistory.fecha.asc(), TradeHistory.id.asc())
+        )
+        if tickers is not None:
+            query = query.where(TradeHistory.ticker.in_(list(tickers)))
+        return query
+
+    @staticmethod
+    def replay(session: Session, tickers: Optional[Sequence[str]] = None, method: Optional[str] = None,
+               account_id: int = DEFAULT_ACCOUNT_ID) -> Dict[str, LotResult]:
+        """
+        Lotes y ganancias de `tickers` de la cuenta (todos si es None), sin escribir nada.
+        Los splits guardados se intercalan por fecha en la misma pasada.
+        """
+        method = method or LotEngine.get_method(session, account_id)
+        rows = session.execute(LotEngine._history_query(tickers, account_id)).all()
+        groups = [(ticker, list(group)) for ticker, group in groupby(rows, key=lambda row: row[0])]
+        splits = CorporateActionService.by_ticker(session, [ticker for ticker, _ in groups], tipos=("SPLIT",))
+        results = {}
+        for ticker, group in groups:
+            ticker_splits = splits.get(ticker.upper(), ())
+            actions = [(fecha, (ticker, None, "SPLIT", ratio, 0, 0, fecha, None)) for fecha, _, ratio in ticker_splits]
+            # Los saldos importados ya reflejan los splits hasta su importación
+            rows = interleave(rebase_imported(group, ticker_splits, 6, 3, 7), actions, fecha_at=6)
+            results[ticker] = replay_lots((row[1:6] for row in rows), method)
+        return results
+
+    @staticmethod
+    def recompute(session: Session, tickers: Optional[Sequence[str]] = None, method: Optional[str] = None, commit: bool = True,
+                  account_id: int = DEFAULT_ACCOUNT_ID) -> Dict[str, LotResult]:
+        """Recalcula y guarda ganancia_realizada de cada SELL de `tickers` de la cuenta (todos si es None)."""
+        results = LotEngine.replay(session, tickers, method, account_id)
+        params = [
+            {"trade_id": trade_id, "ganancia": ganancia}
+            for result in results.values()
+            for trade_id, ganancia in result.realized.items()
+        ]
+        if params:
+            # executemany sobre la PK, sin cargar objetos ORM
+            session.execute(
+                update(TradeHistory.__table__)
+                .where(TradeHistory.__table__.c.id == bindparam("trade_id"))
+                .values(ganancia_realizada=bindparam("ganancia")),
+                params,
+                execution_options=NOT_AN_INPUT,
+            )
+        if commit:
+            session.commit()
+        return results
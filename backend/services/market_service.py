@@ -1,110 +1,246 @@
+import math
 from datetime import datetime, timedelta
+import numpy as np
 import yfinance as yf
 import pandas as pd
+from sqlalchemy import bindparam, update
 from sqlmodel import Session
-from typing import List, Dict
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 from models.models import Asset
+from services.data_version import data_version
+from services.position_snapshot import PositionSnapshot
+from services.price_cache import PriceCache
+from services.metrics import current_span, timed, traced
+
+CACHE_DURATION_MINUTES = 15
+
+# Caché compartida por todos los requests del proceso (delante de Asset.cached_price)
+price_cache = PriceCache(ttl_seconds=CACHE_DURATION_MINUTES * 60)
+
+# Precio descargado -> todas las filas de Asset con ese ticker (executemany, sin cargar objetos)
+PRICE_UPDATE = (
+    update(Asset.__table__)
+    .where(Asset.__table__.c.ticker == bindparam("b_ticker"))
+    .values(cached_price=bindparam("b_cents"), last_updated=bindparam("b_now"))
+)
 
 class MarketDataService:
-    CACHE_DURATION_MINUTES = 15
+    CACHE_DURATION_MINUTES = CACHE_DURATION_MINUTES
+
+    @staticmethod
+    def download_prices(tickers: List[str]) -> Dict[str, float]:
+        """
+        Descarga en BATCH desde Yahoo Finance.
+        Devuelve {ticker: último precio válido en DÓLARES} (sólo los encontrados).
+        """
+        # threads=True acelera la descarga masiva
+        print(f"Descargando precios para: {tickers}")
+        # Use period="5d" to catch weekend/holiday gaps
+        with timed("yahoo"):
+            data = yf.download(tickers, period="5d", threads=True)['Close']
+
+        # Manejo de respuesta de yfinance (puede ser Series o DataFrame)
+        prices = {}
+        for ticker in tickers:
+            new_price_float = 0.0
+
+            # Extraer precio seguro
+            try:
+                # Logic to get the last valid price
+                if isinstance(data, pd.DataFrame):
+                    if ticker in data.columns:
+                        series = data[ticker]
+                        last_valid_idx = series.last_valid_index()
+                        if last_valid_idx is not None:
+                            new_price_float = float(series.loc[last_valid_idx])
+                elif isinstance(data, pd.Series):
+                    # If single ticker result, yfinance returns a Series with DateTime index.
+                    last_valid_idx = data.last_valid_index()
+                    if last_valid_idx is not None:
+                        new_price_float = float(data.loc[last_valid_idx])
+
+            except Exception as e:
+                print(f"Error extracting price for {ticker}: {e}")
+                new_price_float = 0.0 # Fallback
+
+            if new_price_float > 0:
+                prices[ticker] = new_price_float
+            else:
+                print(f"WARNING: No se encontró precio para {ticker}. Verifica si está bien escrito.")
+
+        return prices
 
     @staticmethod
-    def get_market_prices(session: Session, assets: List[Asset]) -> Dict[str, int]:
+    def _group(assets: List[Asset]) -> Dict[str, List[Asset]]:
+        """{TICKER: assets}: el mismo ticker en varias cuentas se descarga una sola vez."""
+        grouped: Dict[str, List[Asset]] = {}
+        for asset in assets:
+            grouped.setdefault(asset.ticker.upper(), []).append(asset)
+        return grouped
+
+    @staticmethod
+    def _split_snapshot(snapshot: PositionSnapshot, now: datetime, max_age: Optional[float]) -> Tuple[Dict[str, int], List[int]]:
+        """
+        Separa los precios servibles desde caché (memoria -> precio guardado < TTL) de los que
+        hay que descargar, por símbolo de la PositionSnapshot (sin objetos ORM).
+        Devuelve ({ticker: cents}, [índices de símbolo a descargar]).
+        """
+        ttl = timedelta(minutes=MarketDataService.CACHE_DURATION_MINUTES)
+        if max_age is not None:
+            ttl = min(ttl, timedelta(seconds=max_age))
+        ttl_seconds = ttl.total_seconds()
+        now_epoch = now.timestamp()
+        prices_map: Dict[str, int] = {}
+        stale: List[int] = []
+
+        for i in np.unique(snapshot.simbolo).tolist():
+            simbolo = snapshot.simbolos[i]
+            # Edad del precio guardado en DB (NaN si nunca se guardó: las comparaciones dan False)
+            age = float(now_epoch - snapshot.guardado_en[i])
+            # Un precio guardado más nuevo (lo descargó otro worker) gana sobre la memoria
+            cents = price_cache.get(simbolo, max_age=max_age, stored_age=None if math.isnan(age) else age)
+            if cents is None:
+                if not age < ttl_seconds:
+                    stale.append(i)
+                    continue
+                cents = int(snapshot.precio_guardado[i])
+                price_cache.put(simbolo, cents, age_seconds=age)
+            for ticker in snapshot.variantes[i]:
+                prices_map[ticker] = cents
+
+        return prices_map, stale
+
+    @staticmethod
+    def _apply_snapshot_fetched(snapshot: PositionSnapshot, stale: List[int], fetched: Dict[str, Optional[int]], now: datetime,
+                                prices_map: Dict[str, int]) -> List[Dict]:
+        """Completa el mapa con lo descargado (o el precio guardado si falló). Devuelve los parámetros de PRICE_UPDATE."""
+        params = []
+        for i in stale:
+            cents = fetched.get(snapshot.simbolos[i]) or 0
+            if cents > 0:
+                params.extend({"b_ticker": t, "b_cents": cents, "b_now": now} for t in snapshot.variantes[i])
+            else:
+                cents = int(snapshot.precio_guardado[i])
+            for ticker in snapshot.variantes[i]:
+                prices_map[ticker] = cents
+        return params
+
+    @staticmethod
+    @traced("get_market_prices")
+    def get_market_prices(session: Session, assets: Union[Sequence[Asset], PositionSnapshot], max_age: Optional[float] = None) -> Dict[str, int]:
         """
         Devuelve un diccionario {ticker: precio_actual_en_centavos}.
-        Usa caché si el dato en DB tiene menos de 15 minutos.
-        Si está viejo, descarga en batch desde Yahoo Finance y actualiza la DB.
+        Acepta Assets o la foto de posiciones; los Assets se pasan a una foto y se resuelven
+        con get_snapshot_prices (memoria -> precio guardado < 15 min -> Yahoo).
         """
+        if isinstance(assets, PositionSnapshot):
+            return MarketDataService.get_snapshot_prices(session, assets, max_age)
         if not assets:
             return {}
+        rows = [
+            (a.account_id, a.ticker, a.cantidad_total or 0.0, a.precio_promedio or 0, a.cached_price, a.last_updated)
+            for a in assets
+        ]
+        snapshot = PositionSnapshot.build(data_version.current(), rows, [], [])
+        return MarketDataService.get_snapshot_prices(session, snapshot, max_age)
+
+    @staticmethod
+    @traced("get_snapshot_prices")
+    def get_snapshot_prices(session: Session, snapshot: PositionSnapshot, max_age: Optional[float] = None) -> Dict[str, int]:
+        """
+        Devuelve {ticker: precio_actual_en_centavos} para las filas de la foto de posiciones.
+        Orden de búsqueda: caché en memoria -> precio guardado (< 15 min) -> Yahoo Finance (batch, single-flight).
+        `max_age` (segundos) permite exigir precios más recientes que el TTL por defecto.
+        Lo descargado se guarda con un UPDATE por lotes para todas las cuentas que tienen el ticker.
+        """
+        if not len(snapshot):
+            return {}
+        current_span().rows(len(snapshot))
 
         now = datetime.now()
-        prices_map = {} # Ticker -> Cents (int)
-        tickers_to_update = []
-        ticker_to_asset_map = {} # Map uppercase ticker to asset for easy lookup
+        prices_map, stale = MarketDataService._split_snapshot(snapshot, now, max_age)
+        if stale:
+            try:
+                fetched = price_cache.fetch_many([snapshot.simbolos[i] for i in stale], MarketDataService.download_prices)
+                params = MarketDataService._apply_snapshot_fetched(snapshot, stale, fetched, now, prices_map)
+                if params:
+                    session.execute(PRICE_UPDATE, params)
+                    session.commit()
+            except Exception as e:
+                print(f"Error actualizando precios: {e}")
+                MarketDataService._apply_snapshot_fetched(snapshot, stale, {}, now, prices_map)
 
-        # 1. Identificar qué tickers necesitan actualización
-        for asset in assets:
-            # Ensure asset ticker is treated as uppercase for processing
-            ticker_upper = asset.ticker.upper()
-            ticker_to_asset_map[ticker_upper] = asset
-            
-            needs_update = True
-            if asset.cached_price is not None and asset.last_updated is not None:
-                # Calcular edad del caché
-                age = now - asset.last_updated
-                if age < timedelta(minutes=MarketDataService.CACHE_DURATION_MINUTES):
-                    needs_update = False
-                    prices_map[asset.ticker] = asset.cached_price
-            
-            if needs_update:
-                tickers_to_update.append(ticker_upper)
-        
-        # 2. Descargar datos frescos en BATCH (solo para los necesarios)
-        if tickers_to_update:
+        return prices_map
+
+    @staticmethod
+    @traced("get_snapshot_prices_async")
+    async def get_snapshot_prices_async(session: AsyncSession, snapshot: PositionSnapshot, max_age: Optional[float] = None) -> Dict[str, int]:
+        """
+        Igual que get_snapshot_prices pero con AsyncSession: la descarga (bloqueante)
+        corre en el threadpool y el UPDATE de Asset no bloquea el event loop.
+        """
+        if not len(snapshot):
+            return {}
+
+        now = datetime.now()
+        prices_map, stale = MarketDataService._split_snapshot(snapshot, now, max_age)
+        if stale:
             try:
-                # threads=True acelera la descarga masiva
-                print(f"Descargando precios para: {tickers_to_update}")
-                # Use period="5d" to catch weekend/holiday gaps
-                data = yf.download(tickers_to_update, period="5d", threads=True)['Close']
-                
-                # Manejo de respuesta de yfinance (puede ser Series o DataFrame)
-                # Normalize data structure to handle single or multiple tickers uniformly if possible, 
-                # but yfinance is tricky.
-                
-                # 3. Actualizar DB y completar el mapa
-                for ticker in tickers_to_update:
-                    asset = ticker_to_asset_map.get(ticker)
-                    if not asset:
-                        continue
-
-                    new_price_float = 0.0
-                    
-                    # Extraer precio seguro
-                    try:
-                        # Logic to get the last valid price
-                        if isinstance(data, pd.DataFrame):
-                            if ticker in data.columns:
-                                series = data[ticker]
-                                last_valid_idx = series.last_valid_index()
-                                if last_valid_idx is not None:
-                                    new_price_float = float(series.loc[last_valid_idx])
-                        elif isinstance(data, pd.Series):
-                             # If single ticker result, yfinance returns Series named 'Close' or the ticker itself depending on version/context
-                             # Usually for multiple it's DF, for single it might be Series.
-                             # If we requested a list (even length 1), let's see. 
-                             # If it's a Series, check if it's time-series or ticker-series. 
-                             # 'Close' with period='5d' should be a Series with DateTime index if 1 ticker.
-                             last_valid_idx = data.last_valid_index()
-                             if last_valid_idx is not None:
-                                 new_price_float = float(data.loc[last_valid_idx])
-                                 
-                    except Exception as e:
-                        print(f"Error extracting price for {ticker}: {e}")
-                        new_price_float = 0.0 # Fallback
-                    
-                    # Validar precio > 0 para guardar
-                    if new_price_float > 0:
-                        # CONVERT TO CENTS (Strict Logic)
-                        new_price_cents = int(new_price_float * 100)
-                        
-                        asset.cached_price = new_price_cents
-                        asset.last_updated = now
-                        session.add(asset) # Marcar para UPDATE en DB
-                        prices_map[asset.ticker] = new_price_cents
-                    else:
-                        print(f"WARNING: No se encontró precio para {ticker}. Verifica si está bien escrito.")
-                        # Si falló la descarga, usamos el caché viejo si existe (or 0)
-                        prices_map[asset.ticker] = asset.cached_price or 0
-
-                session.commit() # Guardar cambios en lote
-                
+                fetched = await run_in_threadpool(
+                    price_cache.fetch_many, [snapshot.simbolos[i] for i in stale], MarketDataService.download_prices
+                )
+                params = MarketDataService._apply_snapshot_fetched(snapshot, stale, fetched, now, prices_map)
+                if params:
+                    await session.execute(PRICE_UPDATE, params)
+                    await session.commit()
             except Exception as e:
                 print(f"Error actualizando precios: {e}")
-                # En caso de error masivo, intentar usar caché viejo para todos los fallidos
-                for t in tickers_to_update:
-                    asset = ticker_to_asset_map.get(t)
-                    if asset:
-                        prices_map[asset.ticker] = asset.cached_price or 0
+                MarketDataService._apply_snapshot_fetched(snapshot, stale, {}, now, prices_map)
 
         return prices_map
+
+    @staticmethod
+    def refresh_prices(session: Session, assets: List[Asset]) -> Dict[str, int]:
+        """
+        Fuerza la descarga de precios (ignora la caché) y actualiza memoria + DB.
+        Devuelve sólo los tickers efectivamente actualizados.
+        Usado por el refresco en background; los errores de descarga se propagan.
+        """
+        if not assets:
+            return {}
+        prices_map = {}
+        refreshed = MarketDataService._refresh(session, MarketDataService._group(assets), datetime.now(), prices_map, force=True)
+        return {ticker: prices_map[ticker] for ticker in refreshed}
+
+    @staticmethod
+    def _apply_fetched(ticker_to_assets: Dict[str, List[Asset]], fetched: Dict[str, Optional[int]], now: datetime, prices_map: Dict[str, int]) -> List[Asset]:
+        """Vuelca los precios descargados en los Assets (de todas las cuentas) y en el mapa. Devuelve los Assets actualizados."""
+        updated = []
+        for ticker, holders in ticker_to_assets.items():
+            new_price_cents = fetched.get(ticker) or 0
+
+            # Validar precio > 0 para guardar
+            if new_price_cents > 0:
+                for asset in holders:
+                    asset.cached_price = new_price_cents
+                    asset.last_updated = now
+                prices_map[holders[0].ticker] = new_price_cents
+                updated.extend(holders)
+            else:
+                # Si falló la descarga, usamos el caché viejo si existe (or 0)
+                prices_map[holders[0].ticker] = max(a.cached_price or 0 for a in holders)
+        return updated
+
+    @staticmethod
+    def _refresh(session: Session, ticker_to_assets: Dict[str, List[Asset]], now: datetime, prices_map: Dict[str, int], force: bool = False) -> List[str]:
+        fetched = price_cache.fetch_many(list(ticker_to_assets), MarketDataService.download_prices, force=force)
+
+        # 3. Actualizar DB y completar el mapa
+        updated = MarketDataService._apply_fetched(ticker_to_assets, fetched, now, prices_map)
+        session.add_all(updated) # Marcar para UPDATE en DB
+        refreshed = list(dict.fromkeys(asset.ticker for asset in updated))
+
+        session.commit() # Guardar cambios en lote
+        return refreshed
@@ -0,0 +1,270 @@
+"""
+Métricas de rendimiento en formato de exposición de Prometheus (texto 0.0.4), sin dependencias.
+
+- Latencia por ruta: middleware de main.py -> http_request_duration_seconds.
+- Spans en funciones calientes (`with span("nombre") as s:`): duración total y desglose por
+  componente (db / yahoo / fx) y filas procesadas (`s.rows(n)`).
+- Tiempo de DB: eventos de cursor de SQLAlchemy (todas las engines); se suma a los spans activos.
+- Llamadas externas (`with timed("yahoo")`): duración y errores por servicio.
+
+Los spans son inclusivos: un span anidado también suma al que lo contiene.
+Se exponen en GET /metrics (routers/metrics.py).
+"""
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Buckets por defecto del cliente oficial de Prometheus (segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [conteo por bucket..., suma, cantidad]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(cumulative)}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(series[-1])}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {_number(series[-1])}"
+
+    def count(self, **labels: str) -> int:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return int(series[-1]) if series else 0
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(str(labels[n]) for n in self.labelnames), 0.0)
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterator[str]]] = []
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterator[str]]):
+        """Líneas calculadas al exponer (ej: contadores que ya llevan las cachés)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                lines.append(f"# collector {fn.__name__} falló: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP por ruta", ("method", "route", "status"))
+SPAN_SECONDS = metrics.histogram(
+    "span_duration_seconds", "Duración total de funciones instrumentadas", ("span",))
+SPAN_COMPONENT_SECONDS = metrics.histogram(
+    "span_component_seconds", "Tiempo dentro de un span por componente (db, yahoo, fx)", ("span", "component"))
+SPAN_ROWS = metrics.counter(
+    "span_rows_total", "Filas procesadas por funciones instrumentadas", ("span",))
+DB_QUERY_SECONDS = metrics.histogram(
+    "db_query_duration_seconds", "Duración de cada sentencia SQL",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+EXTERNAL_SECONDS = metrics.histogram(
+    "external_request_duration_seconds", "Llamadas a servicios externos (Yahoo, dolarapi)", ("service",))
+EXTERNAL_ERRORS = metrics.counter(
+    "external_request_errors_total", "Llamadas a servicios externos que fallaron", ("service",))
+
+
+class Span:
+    __slots__ = ("name", "components", "row_count")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.components: Dict[str, float] = {}
+        self.row_count = 0
+
+    def add(self, component: str, seconds: float):
+        self.components[component] = self.components.get(component, 0.0) + seconds
+
+    def rows(self, n: int):
+        self.row_count += n
+
+
+# Spans activos del request/hilo actual (los hilos del threadpool heredan el contexto)
+_active: ContextVar[Tuple[Span, ...]] = ContextVar("metrics_active_spans", default=())
+
+
+def _add_to_active(component: str, seconds: float):
+    for s in _active.get():
+        s.add(component, seconds)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    current = Span(name)
+    token = _active.set(_active.get() + (current,))
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        _active.reset(token)
+        SPAN_SECONDS.observe(time.perf_counter() - start, span=name)
+        for component, seconds in current.components.items():
+            SPAN_COMPONENT_SECONDS.observe(seconds, span=name, component=component)
+        if current.row_count:
+            SPAN_ROWS.inc(current.row_count, span=name)
+
+
+def current_span() -> Span:
+    """Span más interno activo (uno descartable si no hay ninguno)."""
+    active = _active.get()
+    return active[-1] if active else Span("")
+
+
+def traced(name: str):
+    """Decorador: la función entera (sync o async) corre dentro de `span(name)`."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def timed(service: str) -> Iterator[None]:
+    """Llamada a un servicio externo: histograma propio + componente `service` de los spans activos."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_ERRORS.inc(service=service)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        EXTERNAL_SECONDS.observe(elapsed, service=service)
+        _add_to_active(service, elapsed)
+
+
+# --- Tiempo de DB (todas las engines, incluida la sync de una AsyncEngine) ---
+_QUERY_START = "metrics_query_start"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_QUERY_START, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_QUERY_START)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    _add_to_active("db", elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # La sentencia falló: no queda un after_cursor_execute que consuma el inicio
+    if context.connection is not None:
+        starts = context.connection.info.get(_QUERY_START)
+        if starts:
+            starts.pop()
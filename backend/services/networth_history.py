@@ -0,0 +1,487 @@
+"""
+Patrimonio diario (net worth y P&L) materializado en NetWorthPoint.
+
+Cálculo vectorizado sobre una grilla días x tickers:
+    posiciones = carry + cumsum(deltas de cantidad por día)      (TradeHistory BUY/SELL)
+    precios    = cierres diarios cacheados (PriceBar 1d), con forward-fill;
+                 sin velas se usa el precio de los trades
+    valor      = sum(posiciones * precios) por día
+Los cierres de Yahoo vienen ajustados por splits: las posiciones se llevan a acciones de hoy
+(splits de CorporateAction, como en PositionEngine) y los precios de los trades a esa base.
+Las cajas salen de sumas acumuladas: billetera de Transaction y caja del broker de los
+flujos de TradeHistory (compras/retiros restan; ventas/dividendos/depósitos suman; los
+trades sin usar_caja_broker y los saldos importados no la mueven).
+
+Incremental por escritura: cada insert/update/delete de trades, movimientos, splits o velas diarias
+borra (en la misma transacción) los días guardados desde el primero que toca. Así la serie
+guardada es siempre un prefijo válido:
+- sync (refresco en background) materializa los días cerrados que faltan, desde el último guardado.
+- get_points sólo lee: suma a lo guardado los días abiertos calculados en memoria
+  (el estado inicial sale de agregados SQL, no de reproducir la historia).
+"""
+import threading
+import time as clock
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate, chain
+from operator import mul
+from typing import Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, delete, event, func, inspect, insert, literal, or_
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from models.models import Asset, CorporateAction, NetWorthPoint, PriceBar, TradeHistory, Transaction
+from services.cash_ledger import SIGNED_MONTO
+from services.corporate_actions import Action, CorporateActionService
+from services.data_version import data_version
+
+EPOCH = date(1970, 1, 1)
+EPOCH_DT = datetime(1970, 1, 1)
+POSITION_TYPES = ("BUY", "SELL")
+
+# Columnas de entrada de la serie por tabla: un UPDATE de objetos que no toca ninguna no invalida días
+INPUT_COLUMNS = {
+    TradeHistory.__tablename__: {"fecha", "ticker", "tipo", "cantidad", "precio", "total", "usar_caja_broker", "importado_en"},
+    CorporateAction.__tablename__: {"fecha", "ticker", "tipo", "valor"},
+    Transaction.__tablename__: {"fecha", "tipo", "monto", "moneda"},
+    PriceBar.__tablename__: {"ticker", "intervalo", "ts", "close"},
+}
+_INVALIDATED = "networth_invalidated"
+
+# execution_options de un UPDATE/DELETE en bloque sobre esas tablas que no cambia la serie
+# (ganancia_realizada de LotEngine, velas que HistoryStore reemplaza o poda)
+_INPUTS_OPTION = "networth_inputs"
+NOT_AN_INPUT = {_INPUTS_OPTION: False}
+
+# Cantidad firmada: las ventas restan acciones
+SIGNED_QTY = case(
+    (TradeHistory.tipo == "BUY", TradeHistory.cantidad),
+    (TradeHistory.tipo == "SELL", -TradeHistory.cantidad),
+    else_=literal(0.0),
+)
+# Caja del broker (CENTS): compras y retiros salen; ventas, dividendos y depósitos entran.
+# Los trades que no usaron la caja y los saldos importados no la mueven
+BROKER_FLOW = case(
+    (or_(TradeHistory.usar_caja_broker.is_(False), TradeHistory.importado_en.is_not(None)), literal(0)),
+    (TradeHistory.tipo.in_(("BUY", "WITHDRAW")), -TradeHistory.total),
+    else_=TradeHistory.total,
+)
+# Resultado de la inversión (CENTS): lo pagado en compras vs lo cobrado en ventas y dividendos
+INVEST_FLOW = case(
+    (TradeHistory.tipo == "BUY", -TradeHistory.total),
+    (TradeHistory.tipo.in_(("SELL", "DIVIDEND")), TradeHistory.total),
+    else_=literal(0),
+)
+
+
+def _day(value) -> date:
+    """func.date() devuelve str en SQLite y date en Postgres."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _start_of(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _epoch_seconds(day: date) -> int:
+    return (day - EPOCH).days * 86400
+
+
+def _split_scale(splits: Mapping[str, Sequence[Action]]) -> Callable[[str, datetime], float]:
+    """
+    escala(ticker, fecha) = splits con ex-date <= fecha / todos los splits del ticker.
+    Una cantidad de esa fecha en acciones de hoy es cantidad / escala; un precio, precio x escala.
+    """
+    tablas = {}
+    for ticker, actions in splits.items():
+        fechas = [fecha for fecha, _, _ in actions]
+        acumulado = [1.0, *accumulate((valor for _, _, valor in actions), mul)]
+        tablas[ticker] = (fechas, acumulado)
+
+    def escala(ticker: str, fecha: datetime) -> float:
+        tabla = tablas.get(ticker.upper())
+        if tabla is None:
+            return 1.0
+        fechas, acumulado = tabla
+        return acumulado[bisect_right(fechas, fecha)] / acumulado[-1]
+    return escala
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Forward-fill de NaN a lo largo de los días (eje 0), por columna."""
+    rows = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+class NetWorthTail:
+    """
+    Días abiertos (después del último guardado) calculados en memoria, por versión de los datos.
+    Se descarta al commitear una invalidación; la clave lleva la versión compartida entre workers.
+    """
+    TTL_SECONDS = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key: Optional[Hashable] = None
+        self._created = 0.0
+        self._points: List[NetWorthPoint] = []
+
+    def lookup(self, key: Hashable) -> Optional[List[NetWorthPoint]]:
+        with self._lock:
+            if self._key == key and clock.monotonic() - self._created < self.TTL_SECONDS:
+                return self._points
+            return None
+
+    def store(self, key: Hashable, points: List[NetWorthPoint]):
+        with self._lock:
+            self._key, self._created, self._points = key, clock.monotonic(), points
+
+    def clear(self):
+        with self._lock:
+            self._key, self._points = None, []
+
+
+networth_tail = NetWorthTail()
+
+
+class NetWorthHistory:
+
+    @staticmethod
+    def first_day(session: Session) -> Optional[date]:
+        """Primer día con actividad (trades o movimientos): dos MIN resueltos por los índices de fecha."""
+        days = [
+            _day(value)
+            for value in (
+                session.exec(select(func.min(TradeHistory.fecha))).one(),
+                session.exec(select(func.min(Transaction.fecha))).one(),
+            )
+            if value is not None
+        ]
+        return min(days) if days else None
+
+    @staticmethod
+    def _last_stored(session: Session) -> Optional[date]:
+        value = session.exec(select(func.max(NetWorthPoint.fecha))).one()
+        return _day(value) if value is not None else None
+
+    @staticmethod
+    def compute(session: Session, start: date, end: date) -> Dict[str, np.ndarray]:
+        """Serie diaria [start, end] (CENTS, float). El estado previo a `start` sale de agregados SQL."""
+        n_days = (end - start).days + 1
+        start_dt, end_dt = _start_of(start), _start_of(end + timedelta(days=1))
+        before = TradeHistory.fecha < start_dt
+
+        # 1. Estado al abrir `start`. Los saldos importados ya están en acciones de su importación
+        carry_rows = session.execute(
+            select(TradeHistory.ticker, TradeHistory.importado_en, func.sum(SIGNED_QTY))
+            .where(before, TradeHistory.tipo.in_(POSITION_TYPES))
+            .group_by(TradeHistory.ticker, TradeHistory.importado_en)
+        ).all()
+        broker0, invest0 = session.execute(
+            select(func.coalesce(func.sum(BROKER_FLOW), 0), func.coalesce(func.sum(INVEST_FLOW), 0)).where(before)
+        ).one()
+        wallet0 = dict(session.execute(
+            select(Transaction.moneda == "USD", func.sum(SIGNED_MONTO))
+            .where(Transaction.fecha < start_dt)
+            .group_by(Transaction.moneda == "USD")
+        ).all())
+
+        # 2. Trades del rango
+        trades = session.execute(
+            select(TradeHistory.fecha, TradeHistory.ticker, TradeHistory.tipo, SIGNED_QTY,
+                   TradeHistory.precio, BROKER_FLOW, INVEST_FLOW, TradeHistory.importado_en)
+            .where(TradeHistory.fecha >= start_dt, TradeHistory.fecha < end_dt)
+            .order_by(TradeHistory.fecha, TradeHistory.id)
+        ).all()
+        trade_day = np.array([(f.date() - start).days for f, *_ in trades], dtype=np.int64)
+
+        # 3. Splits: cantidades en acciones de hoy (la base de las velas)
+        splits = CorporateActionService.by_ticker(
+            session, {t for t, _, _ in carry_rows} | {t for _, t, tipo, *_ in trades if tipo in POSITION_TYPES}, tipos=("SPLIT",)
+        )
+        escala = _split_scale(splits)
+        carry_qty: Dict[str, float] = {}
+        # Con splits antes de `start` la suma de los trades cargados a mano va por día (cada uno en su base)
+        partidos = sorted({t for t, _, _ in carry_rows if splits.get(t.upper()) and splits[t.upper()][0][0] < start_dt})
+        for ticker, importado_en, qty in carry_rows:
+            if importado_en is None and ticker in partidos:
+                continue
+            carry_qty[ticker] = carry_qty.get(ticker, 0.0) + (qty or 0.0) / escala(ticker, importado_en or EPOCH_DT)
+        if partidos:
+            dia = func.date(TradeHistory.fecha)
+            for ticker, value, qty in session.execute(
+                select(TradeHistory.ticker, dia, func.sum(SIGNED_QTY))
+                .where(before, TradeHistory.tipo.in_(POSITION_TYPES), TradeHistory.importado_en.is_(None),
+                       TradeHistory.ticker.in_(partidos))
+                .group_by(TradeHistory.ticker, dia)
+            ):
+                carry_qty[ticker] = carry_qty.get(ticker, 0.0) + (qty or 0.0) / escala(ticker, _start_of(_day(value)))
+        carry_qty = {ticker: qty for ticker, qty in carry_qty.items() if qty > 1e-6}
+
+        tickers = sorted(set(carry_qty) | {t for _, t, tipo, *_ in trades if tipo in POSITION_TYPES})
+        col = {ticker: i for i, ticker in enumerate(tickers)}
+        n_tickers = len(tickers)
+
+        # 4. Posiciones: deltas por (día, ticker) -> cumsum
+        positions = np.zeros((n_days, n_tickers))
+        prices = np.full((n_days, n_tickers), np.nan)
+        if n_tickers:
+            positions[0] = [carry_qty.get(t, 0.0) for t in tickers]
+            mask = np.array([tipo in POSITION_TYPES for _, _, tipo, *_ in trades], dtype=bool)
+            if mask.any():
+                moves = [(t, q, p, escala(t, importado_en or f)) for f, t, tipo, q, p, _, _, importado_en in trades if tipo in POSITION_TYPES]
+                t_idx = np.array([col[t] for t, *_ in moves], dtype=np.int64)
+                np.add.at(positions, (trade_day[mask], t_idx), [q / e for _, q, _, e in moves])
+                # Precio de los trades: referencia cuando no hay velas
+                prices[trade_day[mask], t_idx] = [p * e for _, _, p, e in moves]
+            np.cumsum(positions, axis=0, out=positions)
+            np.maximum(positions, 0, out=positions)
+
+            # 5. Precios: último conocido antes de `start`, luego cierres diarios del rango
+            carry_price = NetWorthHistory._prices_before(session, tickers, start, escala)
+            first_row = prices[0]
+            for ticker, price in carry_price.items():
+                if np.isnan(first_row[col[ticker]]):
+                    first_row[col[ticker]] = price
+
+            start_ts, end_ts = _epoch_seconds(start), _epoch_seconds(end + timedelta(days=1))
+            bars = session.execute(
+                select(PriceBar.ticker, PriceBar.ts, PriceBar.close)
+                .where(PriceBar.intervalo == "1d", PriceBar.ticker.in_(tickers),
+                       PriceBar.ts >= start_ts, PriceBar.ts < end_ts)
+            ).all()
+            if bars:
+                b_day = np.array([(ts - start_ts) // 86400 for _, ts, _ in bars], dtype=np.int64)
+                b_col = np.array([col[t] for t, _, _ in bars], dtype=np.int64)
+                prices[b_day, b_col] = np.array([c for _, _, c in bars], dtype=float) * 100  # DÓLARES -> CENTS
+
+            if end == date.today():
+                # Hoy: el precio de mercado cacheado, si está fresco
+                for ticker, cached, updated in session.execute(
+                    select(Asset.ticker, Asset.cached_price, Asset.last_updated).where(Asset.ticker.in_(tickers))
+                ):
+                    if cached and updated and updated.date() == end:
+                        prices[-1, col[ticker]] = cached
+
+            prices = _ffill(prices)
+
+        value = np.nansum(positions * prices, axis=1) if n_tickers else np.zeros(n_days)
+
+        # 6. Cajas: flujos diarios acumulados
+        def cumulative(days: np.ndarray, weights, initial) -> np.ndarray:
+            flows = np.bincount(days, weights=np.asarray(weights, dtype=float), minlength=n_days) if len(days) else np.zeros(n_days)
+            return float(initial or 0) + np.cumsum(flows)
+
+        broker = cumulative(trade_day, [b for *_, b, _, _ in trades], broker0)
+        invested = cumulative(trade_day, [i for *_, i, _ in trades], invest0)
+
+        movimientos = session.execute(
+            select(Transaction.fecha, Transaction.moneda == "USD", SIGNED_MONTO)
+            .where(Transaction.fecha >= start_dt, Transaction.fecha < end_dt)
+        ).all()
+        m_day = np.array([(f.date() - start).days for f, _, _ in movimientos], dtype=np.int64)
+        is_usd = np.array([bool(u) for _, u, _ in movimientos], dtype=bool)
+        montos = np.array([m for _, _, m in movimientos], dtype=float)
+        wallet_usd = cumulative(m_day[is_usd], montos[is_usd], wallet0.get(True))
+        wallet_uyu = cumulative(m_day[~is_usd], montos[~is_usd], wallet0.get(False))
+
+        return {
+            "valor_portafolio": value,
+            "caja_broker": broker,
+            "billetera_usd": wallet_usd,
+            "billetera_uyu": wallet_uyu,
+            "pnl": value + invested,
+        }
+
+    @staticmethod
+    def _prices_before(session: Session, tickers: List[str], start: date,
+                       escala: Callable[[str, datetime], float] = lambda ticker, fecha: 1.0) -> Dict[str, float]:
+        """
+        Último precio (CENTS, base de las velas) de cada ticker antes de `start`:
+        cierre diario o, si no hay velas, el último trade llevado a esa base con `escala`.
+        """
+        prices: Dict[str, float] = {}
+
+        last_trade = (
+            select(TradeHistory.ticker, func.max(TradeHistory.fecha).label("fecha"))
+            .where(TradeHistory.fecha < _start_of(start), TradeHistory.ticker.in_(tickers),
+                   TradeHistory.tipo.in_(POSITION_TYPES))
+            .group_by(TradeHistory.ticker)
+            .subquery()
+        )
+        for ticker, precio, fecha, importado_en in session.execute(
+            select(TradeHistory.ticker, TradeHistory.precio, TradeHistory.fecha, TradeHistory.importado_en)
+            .join(last_trade, and_(TradeHistory.ticker == last_trade.c.ticker, TradeHistory.fecha == last_trade.c.fecha))
+            .where(TradeHistory.tipo.in_(POSITION_TYPES))
+        ):
+            prices[ticker] = float(precio) * escala(ticker, importado_en or fecha)
+
+        last_bar = (
+            select(PriceBar.ticker, func.max(PriceBar.ts).label("ts"))
+            .where(PriceBar.intervalo == "1d", PriceBar.ticker.in_(tickers), PriceBar.ts < _epoch_seconds(start))
+            .group_by(PriceBar.ticker)
+            .subquery()
+        )
+        for ticker, close in session.execute(
+            select(PriceBar.ticker, PriceBar.close)
+            .join(last_bar, and_(PriceBar.ticker == last_bar.c.ticker, PriceBar.ts == last_bar.c.ts))
+            .where(PriceBar.intervalo == "1d")
+        ):
+            prices[ticker] = close * 100
+
+        return prices
+
+    @staticmethod
+    def _to_points(start: date, series: Dict[str, np.ndarray]) -> List[Dict]:
+        n_days = len(series["valor_portafolio"])
+        return [
+            {"fecha": start + timedelta(days=i), **{name: int(round(values[i])) for name, values in series.items()}}
+            for i in range(n_days)
+        ]
+
+    @staticmethod
+    def invalidate(session: Session, desde: date):
+        """Descarta los días guardados desde `desde` (se vuelven a calcular)."""
+        session.execute(delete(NetWorthPoint).where(NetWorthPoint.fecha >= desde))
+
+    @staticmethod
+    def sync(session: Session, today: Optional[date] = None) -> Optional[date]:
+        """
+        Materializa los días cerrados (anteriores a `today`) que faltan después del último guardado.
+        Devuelve el primer día agregado (None si no había nada que agregar).
+        """
+        today = today or date.today()
+        last = NetWorthHistory._last_stored(session)
+        start = last + timedelta(days=1) if last else NetWorthHistory.first_day(session)
+        end = today - timedelta(days=1)
+        if start is None or start > end:
+            return None
+
+        rows = NetWorthHistory._to_points(start, NetWorthHistory.compute(session, start, end))
+        session.execute(insert(NetWorthPoint), rows)
+        session.commit()
+        return start
+
+    @staticmethod
+    def open_points(session: Session, today: Optional[date] = None) -> List[NetWorthPoint]:
+        """Días posteriores al último guardado hasta `today` inclusive, calculados en memoria (sin escribir)."""
+        today = today or date.today()
+        last = NetWorthHistory._last_stored(session)
+        start = last + timedelta(days=1) if last else NetWorthHistory.first_day(session)
+        if start is None or start > today:
+            return []
+
+        key = (data_version.refresh(session), start, today)
+        points = networth_tail.lookup(key)
+        if points is None:
+            rows = NetWorthHistory._to_points(start, NetWorthHistory.compute(session, start, today))
+            points = [NetWorthPoint(**row) for row in rows]
+            networth_tail.store(key, points)
+        return points
+
+    @staticmethod
+    def get_points(session: Session, desde: Optional[date] = None, hasta: Optional[date] = None,
+                   today: Optional[date] = None) -> List[NetWorthPoint]:
+        """Serie guardada + días abiertos. Sólo lee: materializar es trabajo de sync."""
+        query = select(NetWorthPoint).order_by(NetWorthPoint.fecha)
+        if desde:
+            query = query.where(NetWorthPoint.fecha >= desde)
+        if hasta:
+            query = query.where(NetWorthPoint.fecha <= hasta)
+        stored = session.exec(query).all()
+        abiertos = [
+            p for p in NetWorthHistory.open_points(session, today)
+            if (desde is None or p.fecha >= desde) and (hasta is None or p.fecha <= hasta)
+        ]
+        return [*stored, *abiertos]
+
+
+# --- Invalidación por escritura (mismos hooks de sesión que data_version) ---
+
+def _earliest(table: str, rows: Iterable[Mapping]) -> Optional[date]:
+    """Primer día que tocan `rows` (columnas -> valor). EPOCH (todo) si alguna no trae su fecha."""
+    earliest = None
+    for row in rows:
+        if table == PriceBar.__tablename__:
+            if row.get("intervalo") != "1d":
+                continue  # Las velas intradiarias no entran en la serie
+            day = EPOCH + timedelta(days=int(row["ts"]) // 86400) if row.get("ts") is not None else EPOCH
+        else:
+            day = _day(row["fecha"]) if row.get("fecha") is not None else EPOCH
+        earliest = day if earliest is None else min(earliest, day)
+    return earliest
+
+
+def _discard_from(session: OrmSession, desde: Optional[date]):
+    if desde is None:
+        return
+    # Core sobre la conexión de la sesión: misma transacción que la escritura, sin pasar por el ORM
+    table = NetWorthPoint.__table__
+    session.connection().execute(delete(table).where(table.c.fecha >= desde))
+    session.info[_INVALIDATED] = True
+
+
+def _object_rows(obj, table: str, dirty: bool) -> List[Dict]:
+    """Valores (actuales y, si cambiaron, anteriores) de fecha/ts/intervalo de un objeto."""
+    keys = ("ticker", "intervalo", "ts") if table == PriceBar.__tablename__ else ("fecha",)
+    current = {key: getattr(obj, key) for key in keys}
+    if not dirty:
+        return [current]
+    state = inspect(obj)
+    if not any(state.attrs[name].history.has_changes() for name in INPUT_COLUMNS[table]):
+        return []
+    previous = dict(current)
+    for key in keys:
+        deleted = state.attrs[key].history.deleted
+        if deleted:
+            previous[key] = deleted[0]
+    return [current, previous]
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _invalidate_flushed(session, flush_context):
+    rows: Dict[str, List[Dict]] = {}
+    for obj, dirty in chain(((o, False) for o in session.new), ((o, False) for o in session.deleted),
+                            ((o, True) for o in session.dirty)):
+        table = getattr(obj, "__tablename__", None)
+        if table in INPUT_COLUMNS:
+            rows.setdefault(table, []).extend(_object_rows(obj, table, dirty))
+    days = [day for table, table_rows in rows.items() if (day := _earliest(table, table_rows)) is not None]
+    _discard_from(session, min(days) if days else None)
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _invalidate_bulk(orm_execute_state):
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is None or table.name not in INPUT_COLUMNS:
+        return
+    if orm_execute_state.is_insert:
+        params = orm_execute_state.parameters
+        rows = params if isinstance(params, list) else [params] if params else []
+        desde = _earliest(table.name, rows) if rows else EPOCH
+    elif orm_execute_state.is_update or orm_execute_state.is_delete:
+        # Sin la fecha de cada fila afectada: todo, salvo que quien escribe declare lo contrario
+        if not orm_execute_state.execution_options.get(_INPUTS_OPTION, True):
+            return
+        desde = EPOCH
+    else:
+        return
+    _discard_from(orm_execute_state.session, desde)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _clear_tail_on_commit(session):
+    if session.info.pop(_INVALIDATED, False):
+        networth_tail.clear()
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_flag_on_rollback(session):
+    session.info.pop(_INVALIDATED, None)
@@ -1,14 +1,28 @@
-from datetime import datetime
-from typing import List, Optional, Dict
+from datetime import datetime, timezone
+from typing import Callable, List, Mapping, Optional, Dict, Sequence, TypeVar
+from sqlalchemy import Integer, case, cast, func, update
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlmodel import Session, select
-from sqlalchemy import func, case
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 import math
+import numpy as np
+import random
+import time
 from fastapi import HTTPException
 
 # Models
-from models.models import Asset, Transaction, BrokerCash, TradeHistory
+from models.models import DEFAULT_ACCOUNT_ID, Asset, Transaction, BrokerCash, TradeHistory
 # Services
 from services.market_service import MarketDataService
+from services.cash_ledger import CashLedger
+from services.fx_service import fx_service
+from services.position_engine import PositionEngine
+from services.corporate_actions import CorporateActionService
+from services.lot_engine import LotEngine
+from services.metrics import current_span, traced
+from services.position_snapshot import position_snapshot
+from services.valuation import valuar_posiciones
 
 # Utils
 def safe_float(val):
@@ -27,59 +41,96 @@ def to_dollars(val_cents: int) -> float:
     """Convierte CENTAVOS (int) a DÓLARES (float) para UI."""
     return safe_float(val_cents) / 100.0
 
+def naive_utc(fecha: Optional[datetime]) -> Optional[datetime]:
+    """Fechas con zona horaria -> UTC sin tzinfo (el historial guarda datetimes naive y se comparan entre sí)."""
+    if fecha is None or fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone(timezone.utc).replace(tzinfo=None)
+
+T = TypeVar("T")
+
+# Reintentos de una operación de trading ante conflictos de concurrencia (ver run_with_retry)
+TRADE_MAX_RETRIES = 5
+TRADE_RETRY_BACKOFF_SECONDS = 0.05
+
 class PortfolioService:
     
     @staticmethod
     def get_dolar_price() -> float:
         """
-        Obtiene la cotización. Si falla o es nula, DEVUELVE 1.0 para NO ROMPER EL DASHBOARD.
-        El dashboard asumirá paridad 1:1 o usará el valor anterior si existiera persistencia, 
-        pero aquí garantizamos que no retorne 0 ni lance excepción.
+        Cotización de venta USD/UYU desde la caché de FxRateService.
+        Nunca bloquea por dolarapi salvo en el primer request del proceso; si la API
+        está caída se usa el último valor bueno (o el backup), nunca 1.0.
         """
-        try:
-            import requests
-            # Timeout corto para no bloquear la UI si la API externa está lenta
-            resp = requests.get("https://uy.dolarapi.com/v1/cotizaciones/usd", timeout=2)
-            val = float(resp.json().get('venta', 0))
-            if val > 0:
-                return val
-            return 1.0 # Fallback safe
-        except Exception:
-            # Log error internally if needed
-            return 1.0 # Fallback safe para que la UI muestre datos en USD
+        return fx_service.get_quote()["venta"]
 
     @staticmethod
-    def get_dashboard_summary(session: Session) -> Dict:
-        # 1. Cotización Dólar (Safe Fallback implementado)
-        dolar_val = PortfolioService.get_dolar_price()
+    @traced("get_dashboard_summary")
+    def get_dashboard_summary(session: Session, account_id: Optional[int] = None) -> Dict:
+        """
+        Resumen de una cuenta o de todas (account_id None) en una sola pasada sobre la foto
+        columnar de posiciones (cajas, nombres y Assets sin cargar objetos ORM) y una única
+        descarga de precios para todos los tickers (un ticker en varias cuentas se pide una vez).
+        La billetera personal no es de ninguna cuenta: se incluye siempre.
+        """
+        # 1. Cotización Dólar (caché + refresh en background)
+        dolar = fx_service.get_quote()
 
-        # 2. Efectivo Billetera (Cash Flow) - CENTS stored in DB
-        # Transaction.monto is now INTEGER (cents).
-        
-        statement = select(
-            func.sum(
-                case(
-                    (Transaction.moneda == 'USD', 
-                     case((Transaction.tipo == 'gasto', -Transaction.monto), else_=Transaction.monto)
-                    ), 
-                    else_=0
-                )
-            ).label("total_usd_cents"),
-            func.sum(
-                case(
-                    (Transaction.moneda != 'USD', 
-                     case((Transaction.tipo == 'gasto', -Transaction.monto), else_=Transaction.monto)
-                    ), 
-                    else_=0
-                )
-            ).label("total_uyu_cents")
+        # 2. Efectivo Billetera (Cash Flow) - CENTS
+        # Saldos materializados por moneda (CashLedger): no agrega toda la tabla Transaction
+        balances = CashLedger.get_balances(session)
+
+        # 3. Efectivo Broker por cuenta e Inversiones (Stocks): foto vigente (se rearma tras cada escritura)
+        snapshot = position_snapshot.get(session).cuenta(account_id)
+        current_span().rows(len(snapshot))
+
+        # Prices are now cached in CENTS
+        prices_map_cents = MarketDataService.get_market_prices(session, snapshot)
+
+        return PortfolioService.build_dashboard_summary(
+            dolar, balances, snapshot.broker_cash, snapshot.tickers, snapshot.cantidades, snapshot.promedios,
+            prices_map_cents, snapshot.account_ids, snapshot.nombres
         )
 
-        result = session.exec(statement).one()
-        
-        # Totales en centavos
-        wallet_usd_cents = result[0] if result[0] is not None else 0
-        wallet_uyu_cents = result[1] if result[1] is not None else 0
+    @staticmethod
+    @traced("get_dashboard_summary")
+    async def get_dashboard_summary_async(session: AsyncSession, account_id: Optional[int] = None) -> Dict:
+        """Misma consulta que get_dashboard_summary con AsyncSession (modo DB_ASYNC)."""
+        # La cotización sólo bloquea en frío: igual la sacamos del event loop
+        dolar = await run_in_threadpool(fx_service.get_quote)
+        balances = await session.run_sync(CashLedger.get_balances)
+        snapshot = (await position_snapshot.get_async(session)).cuenta(account_id)
+        prices_map_cents = await MarketDataService.get_snapshot_prices_async(session, snapshot)
+
+        return PortfolioService.build_dashboard_summary(
+            dolar, balances, snapshot.broker_cash, snapshot.tickers, snapshot.cantidades, snapshot.promedios,
+            prices_map_cents, snapshot.account_ids, snapshot.nombres
+        )
+
+    @staticmethod
+    def build_dashboard_summary(
+        dolar: Dict,
+        balances: Dict[str, int],
+        broker_cash: Mapping[int, int],
+        tickers: Sequence[str],
+        cantidades: Sequence[float],
+        promedios_cents: Sequence[int],
+        prices_map_cents: Dict[str, int],
+        account_ids: Sequence[int] = (),
+        nombres: Optional[Mapping[int, str]] = None,
+    ) -> Dict:
+        """
+        Arma la respuesta del dashboard a partir de los datos ya leídos (sin I/O).
+        `broker_cash` es {cuenta: CENTS} y `account_ids` la cuenta de cada posición:
+        los totales suman todas y `cuentas` trae el desglose.
+        """
+        dolar_val = dolar["venta"]
+        nombres = nombres or {}
+        broker_cash_cents = sum(broker_cash.values())
+
+        # Totales en centavos (todo lo que no es USD se trata como pesos)
+        wallet_usd_cents = balances.get("USD", 0)
+        wallet_uyu_cents = sum(saldo for moneda, saldo in balances.items() if moneda != "USD")
         
         # Convertir billetera unificada a Dólares (Float)
         # wallet_uyu_cents / 100 -> Pesos
@@ -88,35 +139,23 @@ class PortfolioService:
         
         wallet_usd_total_dollars = to_dollars(wallet_usd_cents) + wallet_uyu_in_usd
         
-        # 3. Efectivo Broker (Buying Power) - CENTS stored in DB
-        broker_cash_obj = session.get(BrokerCash, 1)
-        broker_cash_cents = broker_cash_obj.saldo_usd if broker_cash_obj else 0
         broker_cash_dollars = to_dollars(broker_cash_cents)
 
-        # 4. Inversiones (Stocks)
-        activos = session.exec(select(Asset)).all()
-        investments_total_cents = 0.0 # Float temporal acumulando (Cantidad * PrecioCents)
-        investments_performance_cents = 0.0
-        
-        # Prices are now cached in CENTS
-        prices_map_cents = MarketDataService.get_market_prices(session, activos)
-        
-        for asset in activos:
-            price_cents = prices_map_cents.get(asset.ticker, 0)
-            
-            # Cantidad es float (ej: 10.5 acciones)
-            cantidad = safe_float(asset.cantidad_total)
-            # Precio Promedio es int (cents)
-            precio_promedio_cents = asset.precio_promedio
-
-            # Val Mercado = 10.5 * 10050 cents = 105525.0
-            val_mercado_cents = cantidad * price_cents
-            
-            # Costo Base = 10.5 * 9000 cents = 94500.0
-            costo_base_cents = cantidad * precio_promedio_cents
-            
-            investments_total_cents += val_mercado_cents
-            investments_performance_cents += (val_mercado_cents - costo_base_cents)
+        # Valuación vectorizada: Val Mercado = Cantidad * Precio, Costo Base = Cantidad * Promedio (CENTS)
+        valuacion = valuar_posiciones(
+            cantidades,
+            promedios_cents,
+            [prices_map_cents.get(ticker, 0) for ticker in tickers],
+        )
+        investments_total_cents = valuacion.valor_total
+        investments_performance_cents = valuacion.ganancia_total
+
+        # Desglose por cuenta sobre los mismos vectores (sin otra pasada por las posiciones)
+        account_ids = np.asarray(account_ids, dtype=np.int64)
+        cuentas = np.union1d(np.fromiter(broker_cash, dtype=np.int64, count=len(broker_cash)), account_ids)
+        posicion_cuenta = np.searchsorted(cuentas, account_ids)
+        valor_por_cuenta = np.bincount(posicion_cuenta, weights=valuacion.valor_mercado, minlength=len(cuentas))
+        ganancia_por_cuenta = np.bincount(posicion_cuenta, weights=valuacion.ganancia, minlength=len(cuentas))
 
         # 5. TOTALES UNIFICADOS (EN DOLLARS PARA RETURN)
         
@@ -134,6 +173,7 @@ class PortfolioService:
         # FORMAT OUTPUT (Rounding)
         return {
             "net_worth": round(net_worth_dollars, 2),
+            "dolar": {"venta": dolar_val, "stale": dolar["stale"], "edad_segundos": dolar["edad_segundos"]},
             "performance": {
                 "value": round(performance_total_dollars, 2),
                 "percentage": round(perc, 2),
@@ -148,22 +188,79 @@ class PortfolioService:
                 {"name": "Acciones", "value": round(investments_total_dollars, 2), "color": "#3b82f6"},
                 {"name": "Billetera", "value": round(wallet_usd_total_dollars, 2), "color": "#10b981"},
                 {"name": "Broker", "value": round(broker_cash_dollars, 2), "color": "#6366f1"}
-            ]
+            ],
+            "cuentas": [
+                {
+                    "id": cuenta,
+                    "nombre": nombres.get(cuenta, f"Cuenta {cuenta}"),
+                    "acciones": round(to_dollars(valor), 2),
+                    "caja_broker": round(to_dollars(broker_cash.get(cuenta, 0)), 2),
+                    "ganancia": round(to_dollars(ganancia), 2),
+                }
+                for cuenta, valor, ganancia in zip(cuentas.tolist(), valor_por_cuenta.tolist(), ganancia_por_cuenta.tolist())
+            ],
         }
 
     @staticmethod
-    def get_or_create_broker_cash(session: Session) -> BrokerCash:
-        cash = session.get(BrokerCash, 1)
+    def get_or_create_broker_cash(session: Session, account_id: int = DEFAULT_ACCOUNT_ID) -> BrokerCash:
+        cash = session.get(BrokerCash, account_id)
         if not cash:
             # Saldo inicial 0 cents
-            cash = BrokerCash(id=1, saldo_usd=0)
+            cash = BrokerCash(id=account_id, saldo_usd=0)
             session.add(cash)
             session.commit()
             session.refresh(cash)
         return cash
 
     @staticmethod
-    def execute_buy(session: Session, ticker: str, cantidad: float, precio: float, usar_caja_broker: bool, applied_fee: float = 0.0, fecha: Optional[datetime] = None):
+    def run_with_retry(session: Session, operation: Callable[[], T]) -> T:
+        """
+        Ejecuta `operation` (que termina en commit) reintentando ante conflictos de concurrencia:
+        "database is locked" en SQLite, deadlock / serialization failure en Postgres o el alta
+        simultánea del mismo ticker (IntegrityError). Cada intento arranca de una transacción limpia.
+        Los HTTPException (validaciones) no se reintentan.
+        """
+        for attempt in range(TRADE_MAX_RETRIES):
+            try:
+                return operation()
+            except (OperationalError, IntegrityError):
+                session.rollback()
+                if attempt == TRADE_MAX_RETRIES - 1:
+                    raise
+                time.sleep(TRADE_RETRY_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def debit_broker_cash(session: Session, cents: int, account_id: int = DEFAULT_ACCOUNT_ID) -> Optional[int]:
+        """
+        Descuenta `cents` de la caja del broker sólo si alcanza, en un único UPDATE condicional
+        (la DB hace la resta y toma el lock de la fila). Devuelve el nuevo saldo o None si no alcanza.
+        La fila debe existir (get_or_create_broker_cash).
+        """
+        return session.execute(
+            update(BrokerCash)
+            .where(BrokerCash.id == account_id, BrokerCash.saldo_usd >= cents)
+            .values(saldo_usd=BrokerCash.saldo_usd - cents)
+            .returning(BrokerCash.saldo_usd)
+        ).scalar()
+
+    @staticmethod
+    def credit_broker_cash(session: Session, cents: int, account_id: int = DEFAULT_ACCOUNT_ID) -> int:
+        """Suma `cents` a la caja del broker (UPDATE atómico). Devuelve el nuevo saldo."""
+        return session.execute(
+            update(BrokerCash)
+            .where(BrokerCash.id == account_id)
+            .values(saldo_usd=BrokerCash.saldo_usd + cents)
+            .returning(BrokerCash.saldo_usd)
+        ).scalar_one()
+
+    @staticmethod
+    def apply_buy(session: Session, ticker: str, cantidad: float, precio: float, usar_caja_broker: bool, applied_fee: float = 0.0, fecha: Optional[datetime] = None,
+                  account_id: int = DEFAULT_ACCOUNT_ID) -> Dict:
+        """
+        Compra sin commit ni reintentos (base de execute_buy y execute_batch).
+        Si usar_caja_broker, la fila de BrokerCash debe existir.
+        """
+        fecha = naive_utc(fecha)
         # Convertir INPUTS a CENTS
         precio_cents = to_cents(precio)
         fee_cents = to_cents(applied_fee)
@@ -173,105 +270,117 @@ class PortfolioService:
         # Costo Base Operación (cents) = 10.5 * 10050 = 105525.0
         costo_bruto_cents = cantidad * precio_cents
         total_costo_cents = int(round(costo_bruto_cents + fee_cents)) # Final integer cents to deduct
-        
-        # 1. Verificar Caja
-        if usar_caja_broker:
-            cash = PortfolioService.get_or_create_broker_cash(session)
-            if cash.saldo_usd < total_costo_cents:
-                # Mostrar error amigable en Dólares
-                saldo_dollars = to_dollars(cash.saldo_usd)
-                costo_dollars = to_dollars(total_costo_cents)
-                raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Requerido: ${costo_dollars:.2f}, Disponible: ${saldo_dollars:.2f}")
-            
-            cash.saldo_usd -= total_costo_cents
-            session.add(cash)
+
+        # 1. Debitar Caja: verificación y resta en el mismo UPDATE (dos compras simultáneas
+        # no pueden gastar el mismo saldo)
+        if usar_caja_broker and PortfolioService.debit_broker_cash(session, total_costo_cents, account_id) is None:
+            saldo_cents = session.exec(select(BrokerCash.saldo_usd).where(BrokerCash.id == account_id)).one()
+            # Mostrar error amigable en Dólares
+            saldo_dollars = to_dollars(saldo_cents)
+            costo_dollars = to_dollars(total_costo_cents)
+            raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Requerido: ${costo_dollars:.2f}, Disponible: ${saldo_dollars:.2f}")
 
         # 2. Actualizar o Crear Activo
-        asset = session.exec(select(Asset).where(Asset.ticker == ticker)).first()
-        
-        if not asset:
-            asset = Asset(
+        # Promedio Ponderado calculado por la DB sobre los valores vigentes de la fila:
+        # nuevo promedio = (cantidad * promedio + costo total con comisión) / nueva cantidad
+        # (la comisión forma parte del costo de adquisición: break even real)
+        nueva_cantidad = Asset.cantidad_total + cantidad
+        nuevo_promedio = session.execute(
+            update(Asset)
+            .where(Asset.account_id == account_id, Asset.ticker == ticker)
+            .values(
+                cantidad_total=nueva_cantidad,
+                precio_promedio=case(
+                    (nueva_cantidad > 0, cast(func.round(
+                        (Asset.cantidad_total * Asset.precio_promedio + total_costo_cents) / nueva_cantidad
+                    ), Integer)),
+                    else_=0,
+                ),
+            )
+            .returning(Asset.precio_promedio)
+        ).scalar()
+
+        if nuevo_promedio is None:
+            # Si otro request crea el mismo ticker a la vez, el flush falla por unicidad y se reintenta
+            session.add(Asset(
+                account_id=account_id,
                 ticker=ticker,
                 cantidad_total=cantidad,
                 precio_promedio=precio_cents, # STORE AS CENTS
-            )
-        else:
-            # Recalcular Promedio Ponderado
-            # Costo anterior (total cents val)
-            costo_anterior_cents = asset.cantidad_total * asset.precio_promedio # Float result
-            
-            # Nuevo costo total implícito (sin contar fees usualmente para el promedio, o si? 
-            # Estándar fiscal: precio + comision es tu base de costo.
-            # Según user prompt, "commission" es un campo aparte, pero "monto" es lo que pagas.
-            # Vamos a sumar la comisión al costo base del activo para reflejar el costo real de adquisición (Break Even adecuado).
-            
-            nuevo_costo_total_cents = costo_anterior_cents + total_costo_cents 
-            nueva_cantidad = asset.cantidad_total + cantidad
-            
-            asset.cantidad_total = nueva_cantidad
-            
-            # Nuevo promedio = Total Costo Cents / Nueva Cantidad
-            if nueva_cantidad > 0:
-                asset.precio_promedio = int(round(nuevo_costo_total_cents / nueva_cantidad))
-            else:
-                asset.precio_promedio = 0
-
-        session.add(asset)
+            ))
+            session.flush()
+            nuevo_promedio = precio_cents
 
         # 3. Guardar en Historial (Input values stored as CENTS)
         hist = TradeHistory(
+            account_id=account_id,
             ticker=ticker,
             tipo="BUY",
             cantidad=cantidad,
             precio=precio_cents,
             total=total_costo_cents,
             commission=fee_cents,
+            usar_caja_broker=usar_caja_broker,
             fecha=fecha or datetime.now()
         )
         session.add(hist)
-        session.commit()
-        
-        return {"mensaje": "Compra exitosa", "nuevo_promedio": to_dollars(asset.precio_promedio)}
+        if fecha is not None:
+            # Trade con fecha pasada: los checkpoints posteriores quedan obsoletos
+            # y cambian los lotes (y la ganancia) de las ventas posteriores
+            PositionEngine.invalidate(session, ticker, fecha, account_id)
+            if CorporateActionService.exists_since(session, ticker, fecha):
+                # Cruza un split o dividendo: la compra ya no suma `cantidad` tal cual
+                session.flush()
+                nuevo_promedio = PositionEngine.replay(session, ticker, desde=fecha, account_id=account_id, commit=False).precio_promedio
+            LotEngine.recompute(session, [ticker], commit=False, account_id=account_id)
+
+        return {"mensaje": "Compra exitosa", "nuevo_promedio": to_dollars(nuevo_promedio)}
 
     @staticmethod
-    def execute_sell(session: Session, ticker: str, cantidad: float, precio: float, usar_caja_broker: bool, applied_fee: float = 0.0, fecha: Optional[datetime] = None):
+    def apply_sell(session: Session, ticker: str, cantidad: float, precio: float, usar_caja_broker: bool, applied_fee: float = 0.0, fecha: Optional[datetime] = None,
+                   account_id: int = DEFAULT_ACCOUNT_ID) -> Dict:
+        """Venta sin commit ni reintentos (base de execute_sell y execute_batch)."""
+        fecha = naive_utc(fecha)
         # Convert Inputs
         precio_cents = to_cents(precio)
         fee_cents = to_cents(applied_fee)
-        
-        # 1. Verificar si tenemos la acción
-        asset = session.exec(select(Asset).where(Asset.ticker == ticker)).first()
-        if not asset or asset.cantidad_total < cantidad:
-            raise HTTPException(status_code=400, detail="No tienes suficientes acciones para vender")
 
         # Cálculos Venta
         total_venta_bruta_cents = cantidad * precio_cents # Float
         # Net proceeds = Bruto - Fee
         total_venta_neta_cents = int(round(total_venta_bruta_cents - fee_cents))
-        
+
+        # 1. Descontar las acciones sólo si alcanzan (UPDATE condicional: dos ventas
+        # simultáneas no pueden vender las mismas acciones)
+        row = session.execute(
+            update(Asset)
+            .where(Asset.account_id == account_id, Asset.ticker == ticker, Asset.cantidad_total >= cantidad)
+            .values(cantidad_total=Asset.cantidad_total - cantidad)
+            .returning(Asset.cantidad_total, Asset.precio_promedio)
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=400, detail="No tienes suficientes acciones para vender")
+        restante, promedio_cents = row
+
         # 2. Calcular Ganancia Realizada (FIFO o Promedio? Usamos Promedio según modelo simplificado)
         # Costo de la parte vendida
-        costo_proporcional_cents = cantidad * asset.precio_promedio
+        costo_proporcional_cents = cantidad * promedio_cents
         # Ganancia = Net Proceeds - Cost Basis
         ganancia_cents = int(round(total_venta_neta_cents - costo_proporcional_cents))
 
-        # 3. Actualizar Activo
-        asset.cantidad_total -= cantidad
-        if asset.cantidad_total <= 0.00001:
-            asset.cantidad_total = 0
-            asset.precio_promedio = 0 
-        
-        session.add(asset)
+        # 3. Posición cerrada (la fila ya está bloqueada por el UPDATE anterior)
+        if restante <= 0.00001:
+            session.execute(
+                update(Asset).where(Asset.account_id == account_id, Asset.ticker == ticker).values(cantidad_total=0, precio_promedio=0)
+            )
 
-        # 4. Actualizar Caja Broker
+        # 4. Actualizar Caja Broker: sumamos lo neto (lo que realmente entró al bolsillo)
         if usar_caja_broker:
-            cash = PortfolioService.get_or_create_broker_cash(session)
-            # Sumamos lo neto (lo que realmente entró al bolsillo)
-            cash.saldo_usd += total_venta_neta_cents
-            session.add(cash)
+            PortfolioService.credit_broker_cash(session, total_venta_neta_cents, account_id)
 
         # 5. Guardar Historial
         hist = TradeHistory(
+            account_id=account_id,
             ticker=ticker,
             tipo="SELL",
             cantidad=cantidad,
@@ -279,77 +388,102 @@ class PortfolioService:
             total=total_venta_neta_cents,
             ganancia_realizada=ganancia_cents,
             commission=fee_cents,
+            usar_caja_broker=usar_caja_broker,
             fecha=fecha or datetime.now()
         )
         session.add(hist)
-        session.commit()
-        
+        if fecha is not None:
+            PositionEngine.invalidate(session, ticker, fecha, account_id)
+            if CorporateActionService.exists_since(session, ticker, fecha):
+                session.flush()
+                PositionEngine.replay(session, ticker, desde=fecha, account_id=account_id, commit=False)
+        if fecha is not None or LotEngine.get_method(session, account_id) != "AVERAGE":
+            # FIFO/LIFO (o venta con fecha pasada): la ganancia sale de los lotes abiertos a esa fecha
+            session.flush()
+            ganancia_cents = LotEngine.recompute(session, [ticker], commit=False, account_id=account_id)[ticker].realized[hist.id]
+
         return {"mensaje": "Venta exitosa", "ganancia_realizada": to_dollars(ganancia_cents)}
 
     @staticmethod
-    def recalculate_asset_from_history(session: Session, ticker: str):
+    def execute_buy(session: Session, ticker: str, cantidad: float, precio: float, usar_caja_broker: bool, applied_fee: float = 0.0, fecha: Optional[datetime] = None,
+                    account_id: int = DEFAULT_ACCOUNT_ID):
+        def run():
+            if usar_caja_broker:
+                # Antes de tocar nada: si la crea, get_or_create_broker_cash hace commit
+                PortfolioService.get_or_create_broker_cash(session, account_id)
+            resultado = PortfolioService.apply_buy(session, ticker, cantidad, precio, usar_caja_broker, applied_fee, fecha, account_id)
+            session.commit()
+            return resultado
+
+        return PortfolioService.run_with_retry(session, run)
+
+    @staticmethod
+    def execute_sell(session: Session, ticker: str, cantidad: float, precio: float, usar_caja_broker: bool, applied_fee: float = 0.0, fecha: Optional[datetime] = None,
+                     account_id: int = DEFAULT_ACCOUNT_ID):
+        def run():
+            if usar_caja_broker:
+                PortfolioService.get_or_create_broker_cash(session, account_id)
+            resultado = PortfolioService.apply_sell(session, ticker, cantidad, precio, usar_caja_broker, applied_fee, fecha, account_id)
+            session.commit()
+            return resultado
+
+        return PortfolioService.run_with_retry(session, run)
+
+    @staticmethod
+    def execute_batch(session: Session, trades: List[Dict]) -> List[Dict]:
+        """
+        Aplica una lista de trades (dicts con tipo BUY/SELL + los argumentos de execute_buy/execute_sell)
+        en una sola transacción, en orden de fecha (los sin fecha van al final, como "ahora").
+        La caja y las posiciones se verifican contra el saldo acumulado de los trades anteriores del lote.
+        Todo o nada: si un trade falla se revierte el lote entero (HTTPException 400 indicando cuál).
+        Cada trade puede ser de otra cuenta (`account_id`, por defecto la 1).
+        Devuelve un resultado por trade, en el orden recibido.
         """
-        Reinicia el estado del Asset a 0 y reproduce todo el historial cronológicamente.
+        ahora = datetime.now()
+        # Un lote puede mezclar fechas con y sin zona horaria: se ordena por la fecha normalizada
+        fechas = [naive_utc(t.get("fecha")) or ahora for t in trades]
+        orden = sorted(range(len(trades)), key=fechas.__getitem__)
+
+        def run():
+            for account_id in sorted({t.get("account_id", DEFAULT_ACCOUNT_ID) for t in trades if t.get("usar_caja_broker", True)}):
+                PortfolioService.get_or_create_broker_cash(session, account_id)
+
+            resultados: List[Optional[Dict]] = [None] * len(trades)
+            for i in orden:
+                trade = trades[i]
+                tipo = trade["tipo"]
+                apply = PortfolioService.apply_buy if tipo == "BUY" else PortfolioService.apply_sell
+                try:
+                    resultado = apply(
+                        session,
+                        ticker=trade["ticker"],
+                        cantidad=trade["cantidad"],
+                        precio=trade["precio"],
+                        usar_caja_broker=trade.get("usar_caja_broker", True),
+                        applied_fee=trade.get("applied_fee", 0.0),
+                        fecha=trade.get("fecha"),
+                        account_id=trade.get("account_id", DEFAULT_ACCOUNT_ID),
+                    )
+                except HTTPException as e:
+                    session.rollback()
+                    raise HTTPException(status_code=e.status_code, detail=f"Trade #{i} ({tipo} {trade['ticker']}): {e.detail}")
+                resultados[i] = {"indice": i, "tipo": tipo, "ticker": trade["ticker"], **resultado}
+            session.commit()
+            return resultados
+
+        return PortfolioService.run_with_retry(session, run)
+
+    @staticmethod
+    @traced("recalculate_asset_from_history")
+    def recalculate_asset_from_history(session: Session, ticker: str, desde: Optional[datetime] = None, account_id: int = DEFAULT_ACCOUNT_ID):
+        """
+        Reinicia el estado del Asset y reproduce el historial cronológicamente.
         Regla de Oro: Vender NO cambia el precio promedio.
+        Si se indica `desde` (fecha del trade editado), sólo se reproduce a partir
+        del checkpoint más cercano anterior a esa fecha.
+        También recalcula la ganancia realizada de las ventas del ticker (LotEngine).
         """
-        # 1. Fetch chronological history
-        history = session.exec(
-            select(TradeHistory)
-            .where(TradeHistory.ticker == ticker)
-            .order_by(TradeHistory.fecha.asc())
-        ).all()
-
-        current_shares = 0.0
-        # Tracks total invested cost for the *current* shares only.
-        # This is effectively (Shares * AvgPrice). Kept as float for precision.
-        current_total_cost_basis = 0.0 
-        
-        for trade in history:
-            qty = safe_float(trade.cantidad)
-            price_cents = trade.precio
-            comm_cents = trade.commission
-            
-            if trade.tipo == "BUY":
-                # Costo de esta compra = (qty * price) + comm
-                cost_this_trade = (qty * price_cents) + comm_cents
-                
-                current_shares += qty
-                current_total_cost_basis += cost_this_trade
-                
-            elif trade.tipo == "SELL":
-                # Si vendemos, reducimos shares y costo base PROPORCIONALMENTE.
-                # El precio promedio NO cambia.
-                if current_shares > 0:
-                    # Calculate Avg Price before reducing
-                    current_avg_price = current_total_cost_basis / current_shares
-                    
-                    # Reduce shares
-                    current_shares -= qty
-                    
-                    if current_shares <= 0.000001:
-                        current_shares = 0
-                        current_total_cost_basis = 0
-                    else:
-                        # New Cost Basis = Remaining Shares * Same Avg Price
-                        # This ensures Avg Price stays constant.
-                        current_total_cost_basis = current_shares * current_avg_price
-                else:
-                    current_shares = 0
-                    current_total_cost_basis = 0
-
-        # Update Asset
-        asset = session.exec(select(Asset).where(Asset.ticker == ticker)).first()
-        if not asset:
-            asset = Asset(ticker=ticker, cantidad_total=0, precio_promedio=0)
-            
-        asset.cantidad_total = current_shares
-        
-        if current_shares > 0:
-            asset.precio_promedio = int(round(current_total_cost_basis / current_shares))
-        else:
-            asset.precio_promedio = 0
-            
-        session.add(asset)
-        session.commit()
-        session.refresh(asset)
+        asset = PositionEngine.replay(session, ticker, desde=desde, account_id=account_id)
+        # Editar/borrar un trade cambia los lotes de las ventas posteriores
+        LotEngine.recompute(session, [ticker], account_id=account_id)
         return asset
@@ -0,0 +1,287 @@
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlmodel import Session, select
+from sqlalchemy import delete, insert, tuple_
+
+from models.models import DEFAULT_ACCOUNT_ID, Asset, PositionCheckpoint, TradeHistory
+from services.corporate_actions import Action, CorporateActionService, interleave, rebase_imported
+
+# Dividendo de CorporateAction en el replay (el DIVIDEND de TradeHistory es el cobrado)
+EX_DIVIDEND = "EX_DIVIDEND"
+
+# Columnas del historial que reproduce el replay (después de ticker en rebuild)
+REPLAY_COLUMNS = (
+    TradeHistory.id,
+    TradeHistory.fecha,
+    TradeHistory.tipo,
+    TradeHistory.cantidad,
+    TradeHistory.precio,
+    TradeHistory.commission,
+    TradeHistory.total,
+    TradeHistory.importado_en,
+)
+
+
+def apply_trade(shares: float, cost_basis: float, tipo: str, qty: float, price_cents: int, comm_cents: int) -> Tuple[float, float]:
+    """
+    Aplica un trade al estado (acciones, costo base en CENTS) y devuelve el nuevo estado.
+    Regla de Oro: Vender NO cambia el precio promedio.
+    """
+    qty = float(qty or 0.0)
+
+    if tipo == "BUY":
+        # Costo de esta compra = (qty * price) + comm
+        return shares + qty, cost_basis + (qty * price_cents) + (comm_cents or 0)
+
+    if tipo == "SPLIT":
+        # `qty` es la relación del split: más acciones, mismo costo base (baja el promedio)
+        return shares * qty, cost_basis
+
+    if tipo == "SELL":
+        # Si vendemos, reducimos shares y costo base PROPORCIONALMENTE.
+        if shares <= 0:
+            return 0.0, 0.0
+
+        avg_price = cost_basis / shares
+        shares -= qty
+        if shares <= 0.000001:
+            return 0.0, 0.0
+        # New Cost Basis = Remaining Shares * Same Avg Price
+        return shares, shares * avg_price
+
+    # DIVIDEND / DEPOSIT / WITHDRAW no afectan la posición
+    return shares, cost_basis
+
+
+class PositionState(NamedTuple):
+    """Estado del replay de un ticker: acciones, costo base y dividendos (CENTS, float)."""
+    shares: float = 0.0
+    cost_basis: float = 0.0
+    dividendos: float = 0.0            # Registrados (TradeHistory DIVIDEND)
+    dividendos_estimados: float = 0.0  # Acciones corporativas: dividendo por acción x acciones al ex-date
+
+
+def action_rows(actions: Sequence[Action], prefix: tuple = ()) -> List[Tuple[datetime, tuple]]:
+    """Acciones corporativas como filas del replay (id None), con el formato de REPLAY_COLUMNS."""
+    rows = []
+    for fecha, tipo, valor in actions:
+        if tipo == "SPLIT":
+            rows.append((fecha, prefix + (None, fecha, "SPLIT", valor, 0, 0, 0, None)))
+        else:
+            rows.append((fecha, prefix + (None, fecha, EX_DIVIDEND, 0.0, valor * 100.0, 0, 0, None)))
+    return rows
+
+
+def _chunks(items: List[str], size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _set_asset_state(asset: Asset, state: PositionState):
+    asset.cantidad_total = state.shares
+    if state.shares > 0:
+        asset.precio_promedio = int(round(state.cost_basis / state.shares))
+    else:
+        asset.precio_promedio = 0
+    # Si la cuenta registra los dividendos cobrados se usan esos; si no, la estimación
+    asset.dividendos = int(round(state.dividendos or state.dividendos_estimados))
+
+
+class PositionEngine:
+    """
+    Replay del historial con checkpoints periódicos por (cuenta, ticker).
+    Editar un trade sólo reproduce desde el último checkpoint anterior a su fecha.
+    Las acciones corporativas (CorporateAction) se intercalan por fecha en la misma pasada:
+    un split multiplica las acciones, un dividendo suma dividendo x acciones al ex-date.
+    Un saldo importado (TradeHistory.importado_en) ya refleja las acciones anteriores a su importación:
+    no recibe esos splits (rebase_imported) ni cuenta para esos dividendos; los trades cargados a mano sí.
+    """
+    CHECKPOINT_INTERVAL = 500
+
+    @staticmethod
+    def _replay_rows(ticker: str, rows: Iterable, state: PositionState = PositionState(), account_id: int = DEFAULT_ACCOUNT_ID):
+        """
+        Reproduce filas REPLAY_COLUMNS ya ordenadas, con las acciones corporativas intercaladas (id None).
+        Devuelve (estado, checkpoints_nuevos); los checkpoints sólo caen en trades, y no mientras haya
+        saldos importados con importación posterior a la fila (su parte no está en PositionState).
+        """
+        shares, cost_basis, dividendos, estimados = state
+        new_checkpoints = []
+        interval = PositionEngine.CHECKPOINT_INTERVAL
+        i = 0
+        pending: List[list] = []  # [importado_en, acciones] de saldos importados todavía no alcanzados
+        for trade_id, fecha, tipo, qty, price_cents, comm_cents, total, importado_en in rows:
+            if pending:
+                pending = [p for p in pending if p[0] >= fecha]
+            if tipo == "DIVIDEND":
+                dividendos += total or 0
+            elif tipo == EX_DIVIDEND:
+                # Los saldos importados después del ex-date ya lo reflejan
+                estimados += max(shares - sum(p[1] for p in pending), 0.0) * price_cents
+            else:
+                before = shares
+                shares, cost_basis = apply_trade(shares, cost_basis, tipo, qty, price_cents, comm_cents)
+                if pending and tipo in ("SPLIT", "SELL") and before > 0:
+                    for p in pending:
+                        p[1] *= shares / before  # Proporcional, como el costo base
+                if importado_en is not None and importado_en >= fecha and tipo == "BUY":
+                    pending.append([importado_en, float(qty or 0.0)])
+            if trade_id is None:
+                continue
+            i += 1
+            if i % interval == 0 and not pending:
+                new_checkpoints.append({
+                    "account_id": account_id,
+                    "ticker": ticker,
+                    "trade_id": trade_id,
+                    "fecha": fecha,
+                    "cantidad": shares,
+                    "costo_base": cost_basis,
+                    "dividendos": dividendos,
+                    "dividendos_estimados": estimados,
+                })
+        return PositionState(shares, cost_basis, dividendos, estimados), new_checkpoints
+
+    # --- Consultas (también las audita tests/test_query_plans.py) ---
+    @staticmethod
+    def checkpoint_query(ticker: str, desde: datetime, account_id: int = DEFAULT_ACCOUNT_ID):
+        """Checkpoint más reciente estrictamente anterior a `desde`."""
+        return (
+            select(PositionCheckpoint)
+            .where(PositionCheckpoint.account_id == account_id, PositionCheckpoint.ticker == ticker)
+            .where(PositionCheckpoint.fecha < desde)
+            .order_by(PositionCheckpoint.fecha.desc(), PositionCheckpoint.trade_id.desc())
+            .limit(1)
+        )
+
+    @staticmethod
+    def tail_query(ticker: str, account_id: int = DEFAULT_ACCOUNT_ID, after: Optional[Tuple[datetime, int]] = None):
+        """Historial de un ticker en orden de replay; con `after` = (fecha, id), sólo lo posterior."""
+        query = (
+            select(*REPLAY_COLUMNS)
+            .where(TradeHistory.account_id == account_id, TradeHistory.ticker == ticker)
+            .order_by(TradeHistory.fecha.asc(), TradeHistory.id.asc())
+        )
+        if after is not None:
+            # Comparación por fila (fecha, id): el índice (account_id, ticker, fecha, id) la resuelve como rango
+            query = query.where(tuple_(TradeHistory.fecha, TradeHistory.id) > tuple_(*after))
+        return query
+
+    @staticmethod
+    def rebuild_query(tickers: List[str], account_id: int = DEFAULT_ACCOUNT_ID):
+        """Historial de varios tickers de la cuenta, agrupable por ticker."""
+        return (
+            select(TradeHistory.ticker, *REPLAY_COLUMNS)
+            .where(TradeHistory.account_id == account_id, TradeHistory.ticker.in_(tickers))
+            .order_by(TradeHistory.ticker, TradeHistory.fecha.asc(), TradeHistory.id.asc())
+        )
+
+    @staticmethod
+    def invalidate(session: Session, ticker: str, desde: datetime, account_id: int = DEFAULT_ACCOUNT_ID):
+        """Descarta los checkpoints que quedaron después de un trade insertado en `desde`."""
+        session.execute(
+            delete(PositionCheckpoint)
+            .where(PositionCheckpoint.account_id == account_id, PositionCheckpoint.ticker == ticker)
+            .where(PositionCheckpoint.fecha > desde)
+        )
+
+    @staticmethod
+    def replay(session: Session, ticker: str, desde: Optional[datetime] = None, account_id: int = DEFAULT_ACCOUNT_ID,
+               commit: bool = True) -> Asset:
+        """
+        Recalcula el Asset de `ticker` en la cuenta `account_id`.
+        Sin `desde` reproduce todo el historial (y reconstruye los checkpoints);
+        con `desde` arranca del checkpoint más reciente estrictamente anterior a esa fecha
+        (y sólo aplica las acciones corporativas posteriores a ese checkpoint).
+        """
+        checkpoint = None
+        if desde is not None:
+            checkpoint = session.exec(PositionEngine.checkpoint_query(ticker, desde, account_id)).first()
+
+        # 1. Invalidar checkpoints posteriores al punto de partida
+        stale = delete(PositionCheckpoint).where(PositionCheckpoint.account_id == account_id, PositionCheckpoint.ticker == ticker)
+        tail = PositionEngine.tail_query(ticker, account_id, (checkpoint.fecha, checkpoint.trade_id) if checkpoint else None)
+
+        if checkpoint:
+            stale = stale.where(
+                tuple_(PositionCheckpoint.fecha, PositionCheckpoint.trade_id) > tuple_(checkpoint.fecha, checkpoint.trade_id)
+            )
+            state = PositionState(checkpoint.cantidad, checkpoint.costo_base, checkpoint.dividendos, checkpoint.dividendos_estimados)
+        else:
+            state = PositionState()
+
+        session.execute(stale)
+
+        # 2. Reproducir sólo la cola (tuplas planas, sin cargar objetos ORM), con las acciones
+        # corporativas posteriores al checkpoint intercaladas
+        # (un checkpoint nunca queda antes de un saldo importado pendiente: sus splits están en `actions`)
+        actions = CorporateActionService.by_ticker(session, [ticker], desde=checkpoint.fecha if checkpoint else None)
+        ticker_actions = actions.get(ticker.upper(), ())
+        state, new_checkpoints = PositionEngine._replay_rows(
+            ticker,
+            interleave(rebase_imported(session.execute(tail), ticker_actions, 1, 3, 7), action_rows(ticker_actions), fecha_at=1),
+            state,
+            account_id,
+        )
+        if new_checkpoints:
+            session.execute(insert(PositionCheckpoint), new_checkpoints)
+
+        # 3. Update Asset
+        asset = session.exec(select(Asset).where(Asset.account_id == account_id, Asset.ticker == ticker)).first()
+        if not asset:
+            asset = Asset(account_id=account_id, ticker=ticker, cantidad_total=0, precio_promedio=0)
+        _set_asset_state(asset, state)
+
+        session.add(asset)
+        if commit:
+            session.commit()
+            session.refresh(asset)
+        else:
+            session.flush()
+        return asset
+
+    @staticmethod
+    def rebuild(session: Session, tickers: Iterable[str], commit: bool = True, account_id: int = DEFAULT_ACCOUNT_ID) -> Dict[str, Asset]:
+        """
+        Replay completo de varios tickers de una cuenta en una sola pasada:
+        una consulta para todo el historial, un flush de Assets y checkpoints, un commit.
+        """
+        tickers = sorted(set(tickers))
+        if not tickers:
+            return {}
+
+        assets: Dict[str, Asset] = {}
+        for chunk in _chunks(tickers):
+            session.execute(delete(PositionCheckpoint).where(
+                PositionCheckpoint.account_id == account_id, PositionCheckpoint.ticker.in_(chunk)
+            ))
+            for asset in session.exec(select(Asset).where(Asset.account_id == account_id, Asset.ticker.in_(chunk))):
+                assets[asset.ticker] = asset
+
+        new_checkpoints = []
+        states = {ticker: PositionState() for ticker in tickers}
+        for chunk in _chunks(tickers):
+            actions = CorporateActionService.by_ticker(session, chunk)
+            rows = session.execute(PositionEngine.rebuild_query(chunk, account_id))
+            for ticker, group in groupby(rows, key=lambda row: row[0]):
+                ticker_actions = actions.get(ticker.upper(), ())
+                merged = interleave(rebase_imported(group, ticker_actions, 2, 4, 8), action_rows(ticker_actions, (ticker,)), fecha_at=2)
+                states[ticker], checkpoints = PositionEngine._replay_rows(
+                    ticker, (row[1:] for row in merged), account_id=account_id
+                )
+                new_checkpoints.extend(checkpoints)
+
+        if new_checkpoints:
+            session.execute(insert(PositionCheckpoint), new_checkpoints)
+
+        for ticker, state in states.items():
+            asset = assets.get(ticker)
+            if not asset:
+                asset = assets[ticker] = Asset(account_id=account_id, ticker=ticker, cantidad_total=0, precio_promedio=0)
+            _set_asset_state(asset, state)
+        session.add_all(assets.values())
+
+        if commit:
+            session.commit()
+        return assets
@@ -0,0 +1,220 @@
+import math
+import threading
+import time
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+import numpy as np
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models.models import Account, Asset, BrokerCash
+from services.data_version import data_version
+
+# Columnas de Asset que usan las lecturas, en el orden del índice (account_id, ticker)
+POSITION_COLUMNS = (
+    Asset.account_id,
+    Asset.ticker,
+    Asset.cantidad_total,
+    Asset.precio_promedio,
+    Asset.cached_price,
+    Asset.last_updated,
+)
+
+
+def _frozen(values, dtype) -> np.ndarray:
+    array = np.asarray(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+@dataclass(frozen=True)
+class PositionSnapshot:
+    """
+    Foto inmutable de las posiciones en columnas (una fila por Asset, ordenadas por cuenta y ticker).
+    Los precios guardados van por símbolo (TICKER en mayúsculas): el mismo ticker en varias
+    cuentas comparte precio y se descarga una vez. Las vistas por cuenta son slices (sin copiar).
+    """
+    version: int
+    creada: float                       # monotonic
+    account_ids: np.ndarray             # int64
+    tickers: Tuple[str, ...]
+    cantidades: np.ndarray              # float64
+    promedios: np.ndarray               # int64, CENTS
+    simbolo: np.ndarray                 # int64: índice en `simbolos` de cada fila
+    simbolos: Tuple[str, ...]           # TICKER únicos
+    variantes: Tuple[Tuple[str, ...], ...]  # tickers tal como están guardados, por símbolo
+    precio_guardado: np.ndarray         # int64, CENTS por símbolo (el guardado más reciente, 0 = ninguno)
+    guardado_en: np.ndarray             # float64, epoch del precio guardado (NaN = nunca)
+    broker_cash: Mapping[int, int]      # {cuenta: CENTS}
+    nombres: Mapping[int, str]          # {cuenta: nombre}
+
+    @staticmethod
+    def build(version: int, rows: List[tuple], cash_rows: List[tuple], name_rows: List[tuple]) -> "PositionSnapshot":
+        """Arma la foto a partir de las filas de POSITION_COLUMNS, (id, saldo) de BrokerCash y (id, nombre) de Account."""
+        indice: Dict[str, int] = {}
+        variantes: List[List[str]] = []
+        precio_guardado: List[int] = []
+        guardado_en: List[float] = []
+        simbolo = []
+        for _, ticker, _, _, cached, updated in rows:
+            clave = ticker.upper()
+            i = indice.get(clave)
+            if i is None:
+                i = indice[clave] = len(variantes)
+                variantes.append([])
+                precio_guardado.append(0)
+                guardado_en.append(math.nan)
+            if ticker not in variantes[i]:
+                variantes[i].append(ticker)
+            # El precio guardado más reciente entre las cuentas que tienen el ticker
+            if cached is not None and updated is not None:
+                epoch = updated.timestamp()
+                if math.isnan(guardado_en[i]) or epoch > guardado_en[i]:
+                    precio_guardado[i], guardado_en[i] = cached, epoch
+            simbolo.append(i)
+
+        columnas = list(zip(*rows)) or [()] * len(POSITION_COLUMNS)
+        return PositionSnapshot(
+            version=version,
+            creada=time.monotonic(),
+            account_ids=_frozen(columnas[0], np.int64),
+            tickers=tuple(columnas[1]),
+            cantidades=_frozen(columnas[2], np.float64),
+            promedios=_frozen(columnas[3], np.int64),
+            simbolo=_frozen(simbolo, np.int64),
+            simbolos=tuple(indice),
+            variantes=tuple(tuple(v) for v in variantes),
+            precio_guardado=_frozen(precio_guardado, np.int64),
+            guardado_en=_frozen(guardado_en, np.float64),
+            broker_cash=MappingProxyType(dict(cash_rows)),
+            nombres=MappingProxyType(dict(name_rows)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def cuenta(self, account_id: Optional[int]) -> "PositionSnapshot":
+        """Vista de una cuenta (None: todas). Las filas están ordenadas por cuenta: es un slice."""
+        if account_id is None:
+            return self
+        desde, hasta = np.searchsorted(self.account_ids, [account_id, account_id + 1]).tolist()
+        saldo = self.broker_cash.get(account_id)
+        return replace(
+            self,
+            account_ids=self.account_ids[desde:hasta],
+            tickers=self.tickers[desde:hasta],
+            cantidades=self.cantidades[desde:hasta],
+            promedios=self.promedios[desde:hasta],
+            simbolo=self.simbolo[desde:hasta],
+            broker_cash=MappingProxyType({} if saldo is None else {account_id: saldo}),
+        )
+
+    def abiertas(self) -> "PositionSnapshot":
+        """Sólo las posiciones con cantidad > 0."""
+        mask = self.cantidades > 0
+        if mask.all():
+            return self
+        return replace(
+            self,
+            account_ids=self.account_ids[mask],
+            tickers=tuple(t for t, abierta in zip(self.tickers, mask.tolist()) if abierta),
+            cantidades=self.cantidades[mask],
+            promedios=self.promedios[mask],
+            simbolo=self.simbolo[mask],
+        )
+
+
+class PositionSnapshotStore:
+    """
+    Foto vigente de las posiciones para las rutas de lectura (dashboard, portfolio, caja).
+    Se reemplaza entera (swap de una referencia) cuando cambia `data_version`, es decir,
+    después del commit de cualquier escritura (de este worker o de otro: get lee antes la
+    versión compartida de la DB), así las lecturas no cargan objetos ORM.
+    El TTL refresca los precios guardados aunque nadie escriba.
+    """
+    TTL_SECONDS = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._current: Optional[PositionSnapshot] = None
+        self.hits = 0
+        self.builds = 0
+
+    @staticmethod
+    def queries():
+        return (
+            select(*POSITION_COLUMNS).order_by(Asset.account_id, Asset.ticker),
+            select(BrokerCash.id, BrokerCash.saldo_usd),
+            select(Account.id, Account.nombre),
+        )
+
+    def _valid(self, version: int) -> Optional[PositionSnapshot]:
+        snapshot = self._current
+        if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.creada < self.TTL_SECONDS:
+            return snapshot
+        return None
+
+    def lookup(self) -> Optional[PositionSnapshot]:
+        """Foto vigente para la versión actual (o None). No consulta la DB."""
+        with self._lock:
+            snapshot = self._valid(data_version.current())
+            if snapshot is not None:
+                self.hits += 1
+            return snapshot
+
+    def store(self, snapshot: PositionSnapshot) -> PositionSnapshot:
+        """Publica una foto armada con los datos de `snapshot.version` (tomada antes de consultar)."""
+        with self._lock:
+            self.builds += 1
+            # Nunca se reemplaza por una foto de una versión anterior
+            if self._current is None or snapshot.version >= self._current.version:
+                self._current = snapshot
+        return snapshot
+
+    def get(self, session: Session) -> PositionSnapshot:
+        data_version.refresh(session)
+        snapshot = self.lookup()
+        if snapshot is not None:
+            return snapshot
+
+        with self._build_lock:
+            # Versión tomada ANTES de consultar: una escritura durante la carga fuerza otra
+            version = data_version.current()
+            with self._lock:
+                snapshot = self._valid(version)
+            if snapshot is not None:
+                return snapshot
+            rows, cash_rows, name_rows = (session.execute(query).all() for query in self.queries())
+            return self.store(PositionSnapshot.build(version, rows, cash_rows, name_rows))
+
+    async def get_async(self, session: AsyncSession) -> PositionSnapshot:
+        """Igual que get con AsyncSession (sin single-flight: no bloquea el event loop)."""
+        await data_version.refresh_async(session)
+        snapshot = self.lookup()
+        if snapshot is not None:
+            return snapshot
+        version = data_version.current()
+        rows, cash_rows, name_rows = [(await session.execute(query)).all() for query in self.queries()]
+        return self.store(PositionSnapshot.build(version, rows, cash_rows, name_rows))
+
+    def clear(self):
+        with self._lock:
+            self._current = None
+            self.hits = self.builds = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            snapshot = self._current
+            return {
+                "version": snapshot.version if snapshot is not None else None,
+                "posiciones": len(snapshot) if snapshot is not None else 0,
+                "simbolos": len(snapshot.simbolos) if snapshot is not None else 0,
+                "data_version": data_version.current(),
+                "hits": self.hits,
+                "builds": self.builds,
+                "ttl_seconds": self.TTL_SECONDS,
+            }
+
+
+position_snapshot = PositionSnapshotStore()
@@ -0,0 +1,144 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class _Flight:
+    """Descarga en curso para un ticker: los demás callers esperan su resultado."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.price: Optional[int] = None  # CENTS
+
+
+class PriceCache:
+    """
+    Caché en memoria (por proceso) de precios en CENTS, delante de Asset.cached_price.
+    - TTL: las entradas vencidas se descartan al leerlas o en el barrido periódico.
+    - Single-flight: si varios requests piden el mismo ticker vencido, sólo uno
+      descarga y el resto espera ese resultado.
+    - Con varios workers, otro proceso puede haber guardado en la DB un precio más nuevo:
+      get(..., stored_age=...) da miss en ese caso y quien llama siembra el de la DB.
+    """
+    FLIGHT_TIMEOUT_SECONDS = 30
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[int, float]] = {}  # ticker -> (cents, monotonic de la descarga)
+        self._inflight: Dict[str, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0   # Descargas reales al upstream
+        self.coalesced = 0   # Tickers servidos por una descarga ajena en curso
+
+    def _fresh(self, ticker: str, now: float, max_age: Optional[float], stored_age: Optional[float] = None) -> Optional[int]:
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        cents, fetched_at = entry
+        age = now - fetched_at
+        if age >= self.ttl_seconds:
+            del self._entries[ticker]
+            return None
+        if max_age is not None and age >= max_age:
+            return None
+        if stored_age is not None and stored_age < age:
+            return None
+        return cents
+
+    def get(self, ticker: str, max_age: Optional[float] = None, stored_age: Optional[float] = None) -> Optional[int]:
+        """`stored_age`: edad (segundos) del precio guardado en la DB; si es más nuevo que la entrada, miss."""
+        with self._lock:
+            cents = self._fresh(ticker, time.monotonic(), max_age, stored_age)
+            if cents is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return cents
+
+    def put(self, ticker: str, cents: int, age_seconds: float = 0.0):
+        """Guarda un precio. `age_seconds` permite sembrar la caché con datos de la DB."""
+        if not cents or cents <= 0 or age_seconds >= self.ttl_seconds:
+            return
+        with self._lock:
+            self._entries[ticker] = (cents, time.monotonic() - age_seconds)
+
+    def fetch_many(self, tickers: Iterable[str], fetcher: Callable[[List[str]], Dict[str, float]], force: bool = False) -> Dict[str, Optional[int]]:
+        """
+        Descarga (vía `fetcher`) los tickers pedidos, compartiendo las descargas en curso.
+        Con `force` se descarga aunque haya una entrada vigente (refresco anticipado).
+        `fetcher` recibe una lista de tickers y devuelve {ticker: precio en DÓLARES}.
+        Devuelve {ticker: precio en CENTS o None si no se pudo obtener}.
+        """
+        owned: List[str] = []
+        waiting: Dict[str, _Flight] = {}
+        results: Dict[str, Optional[int]] = {}
+        with self._lock:
+            now = time.monotonic()
+            for ticker in dict.fromkeys(tickers):
+                # Otra descarga pudo terminar entre el miss y este punto
+                cents = None if force else self._fresh(ticker, now, None)
+                if cents is not None:
+                    results[ticker] = cents
+                    self.coalesced += 1
+                    continue
+                flight = self._inflight.get(ticker)
+                if flight is not None:
+                    waiting[ticker] = flight
+                    self.coalesced += 1
+                else:
+                    self._inflight[ticker] = _Flight()
+                    owned.append(ticker)
+            if owned:
+                self.refreshes += 1
+
+        if owned:
+            fetched: Dict[str, float] = {}
+            try:
+                fetched = fetcher(owned) or {}
+            finally:
+                # Publicamos siempre (aunque falle) para no dejar a nadie esperando
+                with self._lock:
+                    now = time.monotonic()
+                    for ticker in owned:
+                        price = fetched.get(ticker)
+                        # CONVERT TO CENTS (Strict Logic)
+                        cents = int(price * 100) if price and price > 0 else None
+                        if cents:
+                            self._entries[ticker] = (cents, now)
+                        flight = self._inflight.pop(ticker)
+                        flight.price = cents
+                        flight.done.set()
+                        results[ticker] = cents
+
+        for ticker, flight in waiting.items():
+            flight.done.wait(self.FLIGHT_TIMEOUT_SECONDS)
+            results[ticker] = flight.price
+
+        self.prune()
+        return results
+
+    def prune(self):
+        """Barrido de entradas vencidas (evita que crezca con tickers que ya no se consultan)."""
+        with self._lock:
+            limit = time.monotonic() - self.ttl_seconds
+            for ticker in [t for t, (_, fetched_at) in self._entries.items() if fetched_at <= limit]:
+                del self._entries[ticker]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.refreshes = self.coalesced = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "coalesced": self.coalesced,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -0,0 +1,173 @@
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+from typing import Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+from sqlmodel import Session, select
+
+from database import engine
+from models.models import Asset
+from services.market_service import MarketDataService
+from services.corporate_actions import CorporateActionService
+from services.networth_history import NetWorthHistory
+
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = dtime(9, 30)
+MARKET_CLOSE = dtime(16, 0)
+
+
+def is_market_open(now: datetime) -> bool:
+    """NYSE/NASDAQ: lunes a viernes 9:30-16:00 ET (feriados no contemplados)."""
+    local = now.astimezone(MARKET_TZ)
+    return local.weekday() < 5 and MARKET_OPEN <= local.time() < MARKET_CLOSE
+
+
+def last_market_close(now: datetime) -> datetime:
+    """Último cierre (16:00 ET de un día hábil) anterior o igual a `now`."""
+    local = now.astimezone(MARKET_TZ)
+    day = local.date()
+    while True:
+        close = datetime.combine(day, MARKET_CLOSE, tzinfo=MARKET_TZ)
+        if day.weekday() < 5 and close <= local:
+            return close
+        day -= timedelta(days=1)
+
+
+class PriceRefresher:
+    """
+    Refresca en background los precios de los tickers en cartera (cantidad_total > 0)
+    antes de que venza su TTL, para que los requests sólo lean la caché.
+    - Con mercado abierto: refresca los precios con edad >= REFRESH_AHEAD * TTL.
+    - Con mercado cerrado: sólo los que no tienen el precio del último cierre.
+    - Ante errores espera INTERVAL * 2^fallos (tope MAX_BACKOFF_SECONDS).
+    - Después de los precios sincroniza splits/dividendos de esos tickers (una vez por día
+      por ticker, ver CorporateActionService) y guarda los días cerrados del patrimonio
+      (NetWorthHistory.sync); un fallo ahí no frena el refresco de precios.
+    """
+    INTERVAL_SECONDS = 60
+    REFRESH_AHEAD = 0.8
+    BATCH_SIZE = 50
+    MAX_BACKOFF_SECONDS = 15 * 60
+
+    def __init__(self, session_factory: Callable[[], Session]):
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.last_run: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_refreshed = 0
+        self.last_failed: List[str] = []
+        self.last_error: Optional[str] = None
+        self.next_run: Optional[datetime] = None
+
+    # --- Ciclo de vida ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="price-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        delay = 0.0
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.next_delay()
+            with self._lock:
+                self.next_run = datetime.now() + timedelta(seconds=delay)
+
+    def next_delay(self) -> float:
+        if self.consecutive_failures == 0:
+            return self.INTERVAL_SECONDS
+        return min(self.INTERVAL_SECONDS * (2 ** self.consecutive_failures), self.MAX_BACKOFF_SECONDS)
+
+    # --- Trabajo ---
+    def due_assets(self, assets: List[Asset], now: datetime) -> List[Asset]:
+        """Assets cuyo precio hay que refrescar en este ciclo."""
+        if is_market_open(now):
+            ttl = timedelta(minutes=MarketDataService.CACHE_DURATION_MINUTES)
+            threshold = now.astimezone().replace(tzinfo=None) - ttl * self.REFRESH_AHEAD
+        else:
+            # last_updated se guarda en hora local naive (datetime.now())
+            threshold = last_market_close(now).astimezone().replace(tzinfo=None)
+        return [
+            a for a in assets
+            if a.cached_price is None or a.last_updated is None or a.last_updated <= threshold
+        ]
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict:
+        now = now or datetime.now().astimezone()
+        started = time.perf_counter()
+        refreshed = 0
+        failed: List[str] = []
+        error: Optional[str] = None
+
+        try:
+            with self._session_factory() as session:
+                held = session.exec(select(Asset).where(Asset.cantidad_total > 0)).all()
+                due = self.due_assets(held, now)
+                for i in range(0, len(due), self.BATCH_SIZE):
+                    batch = due[i:i + self.BATCH_SIZE]
+                    tickers = [a.ticker for a in batch]
+                    prices = MarketDataService.refresh_prices(session, batch)
+                    for ticker in tickers:
+                        if prices.get(ticker):
+                            refreshed += 1
+                        else:
+                            failed.append(ticker)
+                self.sync_corporate_actions(session, [a.ticker for a in held])
+                self.sync_networth(session)
+        except Exception as e:
+            error = str(e)
+            print(f"Error en refresco de precios en background: {e}")
+
+        with self._lock:
+            self.consecutive_failures = self.consecutive_failures + 1 if error else 0
+            self.last_run = now
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.last_refreshed = refreshed
+            self.last_failed = failed
+            self.last_error = error
+        return self.status()
+
+    @staticmethod
+    def sync_corporate_actions(session: Session, tickers: List[str]):
+        try:
+            CorporateActionService.sync(session, tickers)
+        except Exception as e:
+            session.rollback()
+            print(f"Error sincronizando acciones corporativas: {e}")
+
+    @staticmethod
+    def sync_networth(session: Session):
+        try:
+            NetWorthHistory.sync(session)
+        except Exception as e:
+            session.rollback()
+            print(f"Error guardando el patrimonio diario: {e}")
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "market_open": is_market_open(datetime.now().astimezone()),
+                "last_run": self.last_run.isoformat() if self.last_run else None,
+                "last_duration_ms": self.last_duration_ms,
+                "last_refreshed": self.last_refreshed,
+                "last_failed": self.last_failed,
+                "last_error": self.last_error,
+                "consecutive_failures": self.consecutive_failures,
+                "next_run": self.next_run.isoformat() if self.next_run else None,
+            }
+
+
+# Instancia del proceso (arrancada desde el startup de main.py)
+price_refresher = PriceRefresher(lambda: Session(engine))
@@ -0,0 +1,95 @@
+import base64
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlmodel import Session, select
+from models.models import TradeHistory
+
+# Columnas del historial tal como las ve el frontend (montos ya en DÓLARES, convertidos en SQL)
+HISTORY_COLUMNS = (
+    TradeHistory.id,
+    TradeHistory.account_id,
+    TradeHistory.ticker,
+    TradeHistory.tipo,
+    TradeHistory.cantidad,
+    (TradeHistory.precio / 100.0).label("precio"),
+    (TradeHistory.total / 100.0).label("total"),
+    TradeHistory.fecha,
+    (TradeHistory.ganancia_realizada / 100.0).label("ganancia_realizada"),
+    (TradeHistory.commission / 100.0).label("commission"),
+)
+
+
+class TradeHistoryService:
+    """
+    Lectura paginada del historial por cursor (keyset) sobre (fecha, id) descendente,
+    de todas las cuentas o de una (índice (account_id, fecha, id)).
+    Cada página es una query acotada que arranca donde terminó la anterior,
+    así el costo no depende de cuántas filas haya antes.
+    """
+    DEFAULT_PAGE_SIZE = 500
+    MAX_PAGE_SIZE = 5000
+
+    @staticmethod
+    def encode_cursor(fecha: datetime, trade_id: int) -> str:
+        raw = f"{fecha.isoformat()}|{trade_id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        """Lanza ValueError si el cursor no es válido."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            fecha, trade_id = raw.rsplit("|", 1)
+            return datetime.fromisoformat(fecha), int(trade_id)
+        except Exception:
+            raise ValueError("Cursor inválido")
+
+    @staticmethod
+    def page_query(cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, account_id: Optional[int] = None):
+        """SELECT de una página (limit + 1 filas, para saber si hay siguiente)."""
+        query = select(*HISTORY_COLUMNS)
+        if account_id is not None:
+            query = query.where(TradeHistory.account_id == account_id)
+        if cursor:
+            fecha, trade_id = TradeHistoryService.decode_cursor(cursor)
+            # Comparación por fila: búsqueda por rango en el índice (fecha, id)
+            query = query.where(tuple_(TradeHistory.fecha, TradeHistory.id) < tuple_(fecha, trade_id))
+        return query.order_by(TradeHistory.fecha.desc(), TradeHistory.id.desc()).limit(limit + 1)
+
+    @staticmethod
+    def ticker_query(ticker: str, account_id: int):
+        """Todos los trades de un ticker de la cuenta, del más nuevo al más viejo."""
+        return (
+            select(TradeHistory)
+            .where(TradeHistory.account_id == account_id, TradeHistory.ticker == ticker)
+            .order_by(TradeHistory.fecha.desc(), TradeHistory.id.desc())
+        )
+
+    @staticmethod
+    def page_result(result, limit: int) -> Tuple[List[Dict], Optional[str]]:
+        """Filas de page_query -> (filas como dict, cursor de la página siguiente o None)."""
+        rows = [dict(r._mapping) for r in result]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = TradeHistoryService.encode_cursor(last["fecha"], last["id"])
+        return rows, next_cursor
+
+    @staticmethod
+    def get_page(session: Session, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                 account_id: Optional[int] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Devuelve (filas, cursor de la página siguiente o None si no hay más)."""
+        result = session.exec(TradeHistoryService.page_query(cursor, limit, account_id))
+        return TradeHistoryService.page_result(result, limit)
+
+    @staticmethod
+    def iter_rows(session: Session, cursor: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                  account_id: Optional[int] = None) -> Iterator[Dict]:
+        """Recorre todo el historial (desde `cursor`) página por página, con memoria constante."""
+        while True:
+            rows, cursor = TradeHistoryService.get_page(session, cursor, page_size, account_id)
+            yield from rows
+            if cursor is None:
+                return
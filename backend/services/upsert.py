@@ -0,0 +1,15 @@
+from typing import Dict, List
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+
+# INSERT con ON CONFLICT por dialecto (los dos motores soportados)
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def upsert(dialect: str, table: Table, values: Dict, index_elements: List[str], set_: Dict):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE SET set_ en una sola sentencia:
+    la fila se crea o se actualiza sin leerla antes (dos requests a la vez no chocan).
+    En `set_`, las columnas de `table` son los valores ya guardados.
+    """
+    return _INSERTS[dialect](table).values(**values).on_conflict_do_update(index_elements=index_elements, set_=set_)
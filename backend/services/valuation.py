@@ -0,0 +1,55 @@
+from typing import NamedTuple, Sequence
+import numpy as np
+
+
+class Valuacion(NamedTuple):
+    """Resultado columnar de valuar N posiciones (montos en CENTS, float)."""
+    valor_mercado: np.ndarray
+    costo_base: np.ndarray
+    ganancia: np.ndarray
+    rendimiento_porc: np.ndarray
+    valor_total: float
+    costo_total: float
+    ganancia_total: float
+    rendimiento_total_porc: float
+
+
+def _column(values: Sequence[float]) -> np.ndarray:
+    # NaN/inf (datos sucios) se tratan como 0, igual que safe_float
+    return np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def valuar_posiciones(cantidades: Sequence[float], promedios_cents: Sequence[float], precios_cents: Sequence[float]) -> Valuacion:
+    """
+    Kernel vectorizado de valuación: una pasada sobre arrays columnares.
+    - valor_mercado = cantidad * precio
+    - costo_base = cantidad * precio_promedio
+    - ganancia = valor_mercado - costo_base
+    - rendimiento_porc = ganancia / costo_base * 100 (0 si no hay costo)
+    """
+    cantidad = _column(cantidades)
+    promedio = _column(promedios_cents)
+    precio = _column(precios_cents)
+
+    valor_mercado = cantidad * precio
+    costo_base = cantidad * promedio
+    ganancia = valor_mercado - costo_base
+
+    rendimiento = np.zeros_like(ganancia)
+    np.divide(ganancia * 100.0, costo_base, out=rendimiento, where=costo_base > 0)
+
+    valor_total = float(valor_mercado.sum())
+    costo_total = float(costo_base.sum())
+    ganancia_total = valor_total - costo_total
+    rendimiento_total = (ganancia_total / costo_total * 100) if costo_total > 0 else 0.0
+
+    return Valuacion(
+        valor_mercado=valor_mercado,
+        costo_base=costo_base,
+        ganancia=ganancia,
+        rendimiento_porc=rendimiento,
+        valor_total=valor_total,
+        costo_total=costo_total,
+        ganancia_total=ganancia_total,
+        rendimiento_total_porc=rendimiento_total,
+    )
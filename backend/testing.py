@@ -0,0 +1,60 @@
+"""
+Piezas compartidas por los tests (tests/conftest.py) y los benchmarks (benchmarks/):
+la base SQLite en memoria y el stub local de uy.dolarapi.com.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine
+
+
+def memory_engine():
+    """
+    Engine SQLite en memoria con las tablas creadas.
+    StaticPool es vital para que la memoria no se limpie entre conexiones (una sola conexión compartida).
+    """
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+class DolarApiStub:
+    """Servidor HTTP local que imita uy.dolarapi.com (nunca se sale a internet)."""
+
+    def __init__(self):
+        self.reset()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.payload).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/cotizaciones/usd"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        self.status = 200
+        self.delay = 0.0
+        self.requests = 0
+        self.payload = {"moneda": "USD", "compra": 38.5, "venta": 40.0, "fechaActualizacion": "2024-01-01T12:00:00Z"}
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,18 +1,66 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
-from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel
 from database import get_session
 from main import app
+from services.market_service import price_cache
+from services.fx_service import fx_service
+from services.dashboard_cache import dashboard_cache
+from services.position_snapshot import position_snapshot
+from services.corporate_actions import CorporateActionService
+from services.networth_history import networth_tail
+from testing import DolarApiStub, memory_engine
 
-# 1. Configuración de Base de Datos en Memoria para Tests
-# StaticPool es vital para que la memoria no se limpie entre conexiones en el mismo test
-sqlite_url = "sqlite:///:memory:"
-engine = create_engine(
-    sqlite_url, 
-    connect_args={"check_same_thread": False}, 
-    poolclass=StaticPool
-)
+# 1. Configuración de Base de Datos en Memoria para Tests (compartida con los benchmarks)
+engine = memory_engine()
+
+@pytest.fixture(autouse=True)
+def reset_price_cache():
+    """La caché de precios es global al proceso: cada test arranca vacío."""
+    price_cache.clear()
+    yield
+    price_cache.clear()
+
+@pytest.fixture(autouse=True)
+def reset_dashboard_cache():
+    """El resumen cacheado del dashboard también es global al proceso."""
+    dashboard_cache.clear()
+    yield
+    dashboard_cache.clear()
+
+@pytest.fixture(autouse=True)
+def reset_position_snapshot():
+    """La foto de posiciones es global al proceso (cada test usa una DB distinta)."""
+    position_snapshot.clear()
+    yield
+    position_snapshot.clear()
+
+@pytest.fixture(autouse=True)
+def reset_networth_tail():
+    """Los días abiertos del patrimonio se cachean en memoria por proceso."""
+    networth_tail.clear()
+    yield
+    networth_tail.clear()
+
+@pytest.fixture(autouse=True)
+def no_corporate_action_downloads(monkeypatch):
+    """Splits y dividendos: sin descargas de Yahoo salvo que el test las simule."""
+    monkeypatch.setattr(CorporateActionService, "download", staticmethod(lambda tickers, start=None: None))
+
+@pytest.fixture(scope="session")
+def dolar_stub():
+    stub = DolarApiStub()
+    yield stub
+    stub.shutdown()
+
+@pytest.fixture(autouse=True)
+def reset_fx_service(dolar_stub, monkeypatch):
+    """Cada test arranca sin cotización cacheada y apuntando al stub local."""
+    dolar_stub.reset()
+    fx_service.clear()
+    monkeypatch.setattr(fx_service, "url", dolar_stub.url)
+    yield
+    fx_service.clear()
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -0,0 +1,129 @@
+from unittest.mock import patch
+import pandas as pd
+from sqlalchemy import create_engine, event, inspect, text
+from sqlmodel import Session, SQLModel, select
+from migrations import run_migrations
+from models.models import Asset, TradeHistory
+from services.account_service import AccountService
+
+
+def crear_cuenta(client, nombre):
+    response = client.post("/api/accounts/", json={"nombre": nombre, "broker": "IBKR"})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def fondear(client, monto, account_id):
+    response = client.post("/api/broker/fund", json={"monto_enviado": monto, "monto_recibido": monto, "tipo": "DEPOSIT", "account_id": account_id})
+    assert response.status_code == 200
+
+
+def test_same_ticker_in_two_accounts_is_independent(client, session):
+    otra = crear_cuenta(client, "Secundaria")
+    assert client.post("/api/accounts/", json={"nombre": "Secundaria"}).status_code == 400
+
+    fondear(client, 1000, 1)
+    fondear(client, 500, otra)
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 2, "precio": 100, "account_id": 1})
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 1, "precio": 100, "account_id": otra})
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 1, "precio": 200, "account_id": otra})
+
+    assets = {a.account_id: a for a in session.exec(select(Asset).where(Asset.ticker == "AAPL"))}
+    assert (assets[1].cantidad_total, assets[1].precio_promedio) == (2, 10000)
+    assert (assets[otra].cantidad_total, assets[otra].precio_promedio) == (2, 15000)
+
+    assert client.get("/api/broker/cash", params={"account_id": 1}).json()["saldo_usd"] == 800
+    assert client.get("/api/broker/cash", params={"account_id": otra}).json()["saldo_usd"] == 200
+    assert client.get("/api/broker/cash", params={"account_id": 99}).status_code == 404
+
+    # Método de lotes por cuenta: FIFO en la secundaria no toca la principal
+    client.post("/api/settings/", params={"account_id": otra},
+                json={"default_fee_integer": 0, "default_fee_fractional": 0, "lot_method": "FIFO"})
+    client.post("/api/trade/sell", json={"ticker": "AAPL", "cantidad": 1, "precio": 300, "account_id": otra})
+    client.post("/api/trade/sell", json={"ticker": "AAPL", "cantidad": 1, "precio": 300, "account_id": 1})
+    assert client.get("/api/settings/").json()["lot_method"] == "AVERAGE"
+
+    ventas = {
+        t.account_id: t.ganancia_realizada
+        for t in session.exec(select(TradeHistory).where(TradeHistory.tipo == "SELL"))
+    }
+    assert ventas == {1: 20000, otra: 20000}  # FIFO vende el lote de 100, AVERAGE promedia 100
+    historial = client.get("/api/trading/history/AAPL", params={"account_id": otra}).json()
+    assert [h["tipo"] for h in historial] == ["SELL", "BUY", "BUY"]
+
+    cuentas = {c["nombre"]: c for c in client.get("/api/accounts/").json()}
+    assert cuentas["Secundaria"]["lot_method"] == "FIFO"
+    assert cuentas["Principal"]["saldo_broker"] == 1100
+
+
+def test_default_account_is_created_without_explicit_id(session):
+    # En Postgres un id explícito no avanza la secuencia: la próxima cuenta chocaría con la 1
+    inserts = []
+    engine = session.get_bind()
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO account"):
+            inserts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capturar)
+    try:
+        assert AccountService.get_or_create_default(session).id == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", capturar)
+    assert len(inserts) == 1 and "id" not in inserts[0].split("(")[1].split(")")[0].split(", ")
+
+
+def test_dashboard_aggregates_accounts_with_one_price_fetch(client):
+    otra = crear_cuenta(client, "Secundaria")
+    fondear(client, 1000, 1)
+    fondear(client, 1000, otra)
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 2, "precio": 100, "account_id": 1})
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 3, "precio": 100, "account_id": otra})
+
+    close = pd.DataFrame({"AAPL": [150.0]}, index=pd.date_range("2024-01-01", periods=1))
+    with patch("services.market_service.yf.download", return_value={"Close": close}) as mock_download:
+        todas = client.get("/api/dashboard").json()
+        una = client.get("/api/dashboard", params={"account_id": otra}).json()
+
+    # El ticker compartido se descarga una vez; la segunda vista sale de la caché de precios
+    assert mock_download.call_count == 1
+    assert mock_download.call_args[0][0] == ["AAPL"]
+
+    assert todas["assets"][0]["amount"] == 750.0
+    assert todas["assets"][2]["amount"] == 1500.0
+    assert [(c["nombre"], c["acciones"], c["caja_broker"], c["ganancia"]) for c in todas["cuentas"]] == [
+        ("Principal", 300.0, 800.0, 100.0),
+        ("Secundaria", 450.0, 700.0, 150.0),
+    ]
+    assert una["assets"][0]["amount"] == 450.0
+    assert [c["id"] for c in una["cuentas"]] == [otra]
+
+    portafolio = client.get("/api/portfolio", params={"account_id": 1}).json()
+    assert [(p["Cuenta"], p["Cantidad_Total"]) for p in portafolio["posiciones"]] == [(1, 2)]
+
+
+def test_migration_moves_legacy_data_to_default_account(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    # Esquema previo a multi-cuenta: ticker único en asset, sin account_id
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE asset (id INTEGER PRIMARY KEY, ticker VARCHAR NOT NULL, cantidad_total FLOAT NOT NULL, "
+            "precio_promedio INTEGER NOT NULL, cached_price INTEGER, last_updated DATETIME)"
+        ))
+        conn.execute(text("CREATE UNIQUE INDEX ix_asset_ticker ON asset (ticker)"))
+        conn.execute(text("INSERT INTO asset (ticker, cantidad_total, precio_promedio) VALUES ('AAPL', 1, 10000)"))
+
+    SQLModel.metadata.create_all(engine)
+    applied = run_migrations(engine)
+
+    assert {"account_default", "asset_account_id", "asset_drop_ticker_unique", "ix_asset_account_ticker"} <= set(applied)
+    assert "ix_asset_ticker" not in {ix["name"] for ix in inspect(engine).get_indexes("asset")}
+    with Session(engine) as session:
+        session.add(Asset(account_id=2, ticker="AAPL", cantidad_total=1, precio_promedio=12000))
+        session.commit()
+        assert [(a.account_id, a.ticker) for a in session.exec(select(Asset).order_by(Asset.account_id))] == [
+            (1, "AAPL"), (2, "AAPL"),
+        ]
+        nombre = session.execute(text("SELECT nombre FROM account WHERE id = 1")).scalar()
+    assert nombre == "Principal"
+    assert run_migrations(engine) == []
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_session, to_async_url
+from models.models import Asset, BrokerCash, TradeHistory, Transaction
+from routers import async_api
+
+
+@pytest.fixture(name="async_db")
+def async_db_fixture(tmp_path):
+    """DB en archivo: el engine sync siembra los datos y el async los lee."""
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    sync_engine = create_engine(url)
+    SQLModel.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(to_async_url(url))
+    yield sync_engine, async_engine
+    sync_engine.dispose()
+
+
+@pytest.fixture(name="async_client")
+def async_client_fixture(async_db):
+    _, async_engine = async_db
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(async_api.router)
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    with TestClient(app) as client:
+        yield client
+
+
+def seed(sync_engine):
+    with Session(sync_engine) as session:
+        session.add(Asset(ticker="AAPL", cantidad_total=10.0, precio_promedio=15000,
+                          cached_price=20000, last_updated=datetime.now()))
+        session.add(Asset(ticker="MSFT", cantidad_total=2.0, precio_promedio=30000,
+                          cached_price=None, last_updated=None))
+        session.add(BrokerCash(id=1, saldo_usd=50000))
+        session.add(Transaction(tipo="ingreso", monto=100000, moneda="USD", categoria="Sueldo"))
+        for i in range(7):
+            session.add(TradeHistory(ticker="AAPL", tipo="BUY", cantidad=1.0, precio=15000, total=15000,
+                                     fecha=datetime(2024, 1, 1) + timedelta(days=i)))
+        session.commit()
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:///financial.db") == "sqlite+aiosqlite:///financial.db"
+    assert to_async_url("postgresql://u:p@db:5432/fin") == "postgresql+asyncpg://u:p@db:5432/fin"
+    assert to_async_url("postgresql+psycopg2://u:p@db/fin") == "postgresql+asyncpg://u:p@db/fin"
+
+
+def test_async_dashboard_and_portfolio(async_client, async_db):
+    sync_engine, _ = async_db
+    seed(sync_engine)
+
+    # MSFT no tiene precio: se descarga (en el threadpool) y se persiste con la sesión async
+    with patch("services.market_service.MarketDataService.download_prices", return_value={"MSFT": 400.0}) as download:
+        dashboard = async_client.get("/api/dashboard")
+        portfolio = async_client.get("/api/portfolio").json()
+
+    assert download.call_count == 1
+    assert dashboard.status_code == 200
+    assert "etag" in dashboard.headers
+    # 10 * 200 + 2 * 400 + 1000 (billetera) + 500 (broker)
+    assert dashboard.json()["net_worth"] == 4300.0
+    assert {p["Ticker"]: p["Precio_Actual"] for p in portfolio["posiciones"]} == {"AAPL": 200.0, "MSFT": 400.0}
+
+    with Session(sync_engine) as session:
+        msft = session.get(Asset, 2)
+        assert msft.cached_price == 40000
+        assert msft.last_updated is not None
+
+    assert async_client.get("/api/dashboard", headers={"If-None-Match": dashboard.headers["etag"]}).status_code == 304
+
+
+def test_async_trade_history_pages(async_client, async_db):
+    sync_engine, _ = async_db
+    seed(sync_engine)
+
+    first = async_client.get("/api/trade/history?limit=5")
+    second = async_client.get(f"/api/trade/history?limit=5&cursor={first.headers['x-next-cursor']}")
+    ndjson = async_client.get("/api/trade/history?format=ndjson&limit=3")
+
+    assert len(first.json()) == 5
+    assert len(second.json()) == 2
+    assert "x-next-cursor" not in second.headers
+    assert first.json()[0]["precio"] == 150.0
+    assert len(ndjson.text.splitlines()) == 7
+    # Sin cursor ni limit: todo el historial, sin cursor de página siguiente
+    full = async_client.get("/api/trade/history")
+    assert len(full.json()) == 7
+    assert "x-next-cursor" not in full.headers
+    assert async_client.get("/api/trade/history?cursor=nope").status_code == 400
@@ -0,0 +1,33 @@
+from sqlmodel import select
+from benchmarks.suite import compare
+from benchmarks.synthetic import generate, make_trades
+from models.models import Asset, CashBalance
+
+
+def test_generator_is_seeded_and_never_oversells(session):
+    rows = make_trades(assets=10, trades=2000, seed=7)
+
+    assert rows == make_trades(assets=10, trades=2000, seed=7)
+    assert rows != make_trades(assets=10, trades=2000, seed=8)
+    shares = {}
+    for r in rows:
+        if r["tipo"] in ("BUY", "SELL"):
+            shares[r["ticker"]] = shares.get(r["ticker"], 0.0) + (r["cantidad"] if r["tipo"] == "BUY" else -r["cantidad"])
+            assert shares[r["ticker"]] > -1e-9
+
+    counts = generate(session, assets=10, trades=2000, transactions=300, seed=7)
+
+    assets = session.exec(select(Asset)).all()
+    assert counts["assets"] == len(assets)
+    assert all(a.cached_price > 0 for a in assets)
+    assert session.exec(select(CashBalance)).all()
+
+
+def test_compare_flags_regressions_by_median():
+    def result(medians):
+        return {"meta": {}, "sizes": {"small": {"scenarios": {k: {"median": v} for k, v in medians.items()}}}}
+
+    rows = compare(result({"dashboard": 0.010, "portfolio": 0.020, "import": 0.5}),
+                   result({"dashboard": 0.015, "portfolio": 0.010, "import": 0.52, "nuevo": 1.0}))
+
+    assert {r["scenario"]: r["estado"] for r in rows} == {"dashboard": "REGRESIÓN", "portfolio": "MEJORA", "import": "="}
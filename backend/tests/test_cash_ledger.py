@@ -0,0 +1,84 @@
+from unittest.mock import patch
+from sqlalchemy import event
+from sqlmodel import select
+from models.models import BrokerCash, CashBalance, Transaction
+from services.cash_ledger import CashLedger
+
+
+def balances(session):
+    session.expire_all()
+    return {b.moneda: b.saldo for b in session.exec(select(CashBalance))}
+
+
+def test_movimientos_update_balances_incrementally(client, session):
+    client.post("/api/movimientos/", json={"tipo": "ingreso", "monto": 1000.0, "moneda": "USD", "categoria": "Sueldo"})
+    client.post("/api/movimientos/", json={"tipo": "gasto", "monto": 250.5, "moneda": "USD", "categoria": "Super"})
+    client.post("/api/movimientos/", json={"tipo": "ingreso", "monto": 4000.0, "moneda": "UYU", "categoria": "Venta"})
+
+    assert balances(session) == {"USD": 74950, "UYU": 400000}
+    assert CashLedger.compute(session) == {"USD": 74950, "UYU": 400000}
+
+
+def test_fund_broker_deposit_records_expenses(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=0))
+    session.commit()
+    client.post("/api/movimientos/", json={"tipo": "ingreso", "monto": 2000.0, "moneda": "USD", "categoria": "Sueldo"})
+
+    response = client.post("/api/broker/fund", json={"monto_enviado": 1010.0, "monto_recibido": 1000.0, "tipo": "DEPOSIT"})
+
+    assert response.status_code == 200
+    # 2000 - 1000 (transferencia) - 10 (comisión)
+    assert balances(session) == {"USD": 99000}
+
+
+def test_existing_transactions_build_ledger_lazily(session):
+    session.add(Transaction(tipo="ingreso", monto=100000, moneda="USD", categoria="Sueldo"))
+    session.add(Transaction(tipo="gasto", monto=30000, moneda="USD", categoria="Alquiler"))
+    session.commit()
+    assert balances(session) == {}
+
+    # Alta sobre una DB sin ledger: se construye completo (incluyendo el alta)
+    CashLedger.record(session, Transaction(tipo="gasto", monto=5000, moneda="USD", categoria="Cine"))
+    session.commit()
+
+    assert balances(session) == {"USD": 65000}
+    assert CashLedger.get_balances(session) == {"USD": 65000}
+
+
+def test_reconcile_reports_and_fixes_drift(session):
+    CashLedger.record(session, Transaction(tipo="ingreso", monto=100000, moneda="USD", categoria="Sueldo"))
+    session.commit()
+    assert CashLedger.reconcile(session) == {}
+
+    # Alta por fuera del ledger (p.ej. script de migración)
+    session.add(Transaction(tipo="ingreso", monto=2500, moneda="UYU", categoria="Regalo"))
+    session.add(Transaction(tipo="gasto", monto=1000, moneda="USD", categoria="Cine"))
+    session.commit()
+
+    drift = CashLedger.reconcile(session)
+
+    assert drift == {
+        "USD": {"ledger": 100000, "recalculado": 99000, "diferencia": -1000},
+        "UYU": {"ledger": 0, "recalculado": 2500, "diferencia": 2500},
+    }
+    assert balances(session) == {"USD": 99000, "UYU": 2500}
+    assert CashLedger.reconcile(session) == {}
+
+
+def test_dashboard_reads_ledger_not_transactions(client, session, dolar_stub):
+    client.post("/api/movimientos/", json={"tipo": "ingreso", "monto": 1000.0, "moneda": "USD", "categoria": "Sueldo"})
+    client.post("/api/movimientos/", json={"tipo": "ingreso", "monto": 4000.0, "moneda": "UYU", "categoria": "Venta"})
+
+    statements = []
+    engine = session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with patch("services.portfolio_service.MarketDataService.get_snapshot_prices", return_value={}):
+            data = client.get("/api/dashboard").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # 1000 USD + 4000 UYU / 40 (venta del stub)
+    assert data["net_worth"] == 1100.0
+    assert not any('FROM "transaction"' in s for s in statements)
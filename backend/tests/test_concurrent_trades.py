@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, SQLModel, create_engine, func, select
+from models.models import Asset, BrokerCash, TradeHistory
+from services.portfolio_service import PortfolioService
+
+THREADS = 8
+OPS_PER_THREAD = 25
+
+
+@pytest.fixture(name="file_engine")
+def file_engine_fixture(tmp_path):
+    """DB en archivo: cada hilo abre su propia conexión (la DB en memoria de conftest es una sola)."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'trades.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def run_parallel(engine, operation, calls):
+    def worker(args):
+        with Session(engine) as session:
+            try:
+                return operation(session, *args)
+            except HTTPException as e:
+                return e
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(worker, calls))
+
+
+def test_parallel_buys_and_sells_keep_exact_balances(file_engine):
+    with Session(file_engine) as session:
+        session.add(BrokerCash(id=1, saldo_usd=10_000_000))
+        session.add(Asset(ticker="AAPL", cantidad_total=100.0, precio_promedio=10000))
+        session.commit()
+
+    total = THREADS * OPS_PER_THREAD
+    # Mitad compras de 1 acción a $100 + $1 de comisión, mitad ventas de 1 acción a $120 - $1
+    calls = [("BUY" if i % 2 == 0 else "SELL",) for i in range(total)]
+
+    def operation(session, tipo):
+        if tipo == "BUY":
+            return PortfolioService.execute_buy(session, "AAPL", 1.0, 100.0, True, applied_fee=1.0)
+        return PortfolioService.execute_sell(session, "AAPL", 1.0, 120.0, True, applied_fee=1.0)
+
+    results = run_parallel(file_engine, operation, calls)
+
+    assert all(isinstance(r, dict) for r in results)
+    with Session(file_engine) as session:
+        cash = session.get(BrokerCash, 1)
+        asset = session.exec(select(Asset).where(Asset.ticker == "AAPL")).one()
+        trades = session.exec(select(func.count()).select_from(TradeHistory)).one()
+
+    compras = ventas = total // 2
+    assert cash.saldo_usd == 10_000_000 - compras * 10100 + ventas * 11900
+    assert asset.cantidad_total == 100.0
+    assert trades == total
+
+
+def test_parallel_buys_cannot_overspend(file_engine):
+    with Session(file_engine) as session:
+        session.add(BrokerCash(id=1, saldo_usd=50_000))  # Alcanza para 5 compras de $100
+        session.commit()
+
+    def operation(session, ticker):
+        return PortfolioService.execute_buy(session, ticker, 1.0, 100.0, True)
+
+    # Tickers nuevos repetidos: varios hilos crean la misma fila de Asset a la vez
+    results = run_parallel(file_engine, operation, [(f"T{i % 3}",) for i in range(40)])
+
+    ok = [r for r in results if isinstance(r, dict)]
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(ok) == 5
+    assert len(rejected) == 35
+    assert all(r.status_code == 400 for r in rejected)
+    with Session(file_engine) as session:
+        assert session.get(BrokerCash, 1).saldo_usd == 0
+        assert sum(session.exec(select(Asset.cantidad_total)).all()) == 5.0
+        assert len(session.exec(select(Asset.ticker)).all()) <= 3
+
+
+def test_parallel_sells_cannot_oversell(file_engine):
+    with Session(file_engine) as session:
+        session.add(Asset(ticker="MSFT", cantidad_total=10.0, precio_promedio=30000))
+        session.commit()
+
+    def operation(session, _):
+        return PortfolioService.execute_sell(session, "MSFT", 1.0, 310.0, False)
+
+    results = run_parallel(file_engine, operation, [(i,) for i in range(30)])
+
+    ok = [r for r in results if isinstance(r, dict)]
+    assert len(ok) == 10
+    assert all(r["ganancia_realizada"] == 10.0 for r in ok)
+    with Session(file_engine) as session:
+        msft = session.exec(select(Asset).where(Asset.ticker == "MSFT")).one()
+        assert msft.cantidad_total == 0
+        assert msft.precio_promedio == 0
@@ -0,0 +1,185 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, update
+from sqlmodel import Session, SQLModel, create_engine, select
+from migrations import run_migrations
+from models.models import Asset, BrokerCash, BrokerSettings, CorporateAction, PositionCheckpoint, TradeHistory
+from services.corporate_actions import CorporateActionService
+from services.import_service import SNAPSHOT_DATE, ImportService
+from services.lot_engine import LotEngine
+from services.position_engine import PositionEngine
+
+
+def yahoo_frame(ticker, eventos):
+    """Imita yf.download(actions=True) de varios tickers: columnas (campo, ticker), 0 = sin evento."""
+    fechas = pd.date_range("2024-01-01", "2024-06-28", freq="B")
+    data = {("Close", ticker): np.full(len(fechas), 100.0)}
+    for campo in ("Dividends", "Stock Splits"):
+        data[(campo, ticker)] = np.zeros(len(fechas))
+    frame = pd.DataFrame(data, index=fechas)
+    for fecha, campo, valor in eventos:
+        frame.loc[pd.Timestamp(fecha), (campo, ticker)] = valor
+    return frame
+
+
+SPLIT_Y_DIVIDENDO = [("2024-03-01", "Stock Splits", 2.0), ("2024-04-01", "Dividends", 0.5)]
+
+
+def seed(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=10_000_000))
+    session.add(BrokerSettings(id=1, lot_method="FIFO"))
+    session.commit()
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 10, "precio": 100.0, "fecha": "2024-01-02T10:00:00"})
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 10, "precio": 200.0, "fecha": "2024-02-01T10:00:00"})
+
+
+def test_sync_applies_split_and_dividend_to_position_and_lots(client, session):
+    seed(client, session)
+
+    with patch.object(CorporateActionService, "download", return_value=yahoo_frame("AAPL", SPLIT_Y_DIVIDENDO)) as download:
+        desde = CorporateActionService.sync(session, ["AAPL"], now=datetime(2024, 7, 1))
+    download.assert_called_once_with(["AAPL"], None)
+    assert desde == {"AAPL": datetime(2024, 3, 1)}
+
+    asset = session.exec(select(Asset).where(Asset.ticker == "AAPL")).one()
+    session.refresh(asset)
+    # Split 2:1 -> el doble de acciones, mismo costo total
+    assert asset.cantidad_total == 40.0
+    assert asset.precio_promedio == 7500
+    # Sin dividendos registrados: 40 acciones x 50 centavos al ex-date
+    assert asset.dividendos == 2000
+    assert LotEngine.replay(session, ["AAPL"])["AAPL"].book.open_lots() == [(20.0, 5000.0), (20.0, 10000.0)]
+
+    # La venta FIFO consume los lotes ya partidos
+    venta = client.post("/api/trade/sell", json={"ticker": "AAPL", "cantidad": 25, "precio": 150.0})
+    assert venta.json()["ganancia_realizada"] == 25 * 150 - (20 * 50 + 5 * 100)
+
+    # Dentro de la ventana de frescura no se vuelve a consultar Yahoo
+    with patch.object(CorporateActionService, "download") as download:
+        assert CorporateActionService.sync(session, ["aapl"], now=datetime(2024, 7, 1, 12)) == {}
+    download.assert_not_called()
+
+    acciones = client.get("/api/market/corporate-actions/aapl").json()
+    assert acciones == [{"fecha": "2024-03-01", "tipo": "SPLIT", "valor": 2.0}, {"fecha": "2024-04-01", "tipo": "DIVIDEND", "valor": 0.5}]
+
+
+def test_stale_sync_fetches_tail_and_skips_known_actions(client, session):
+    seed(client, session)
+    with patch.object(CorporateActionService, "download", return_value=yahoo_frame("AAPL", SPLIT_Y_DIVIDENDO)):
+        CorporateActionService.sync(session, ["AAPL"], now=datetime(2024, 5, 1))
+
+    # Un día después: sólo la cola, y el split ya guardado no se reaplica
+    with patch.object(CorporateActionService, "download", return_value=yahoo_frame("AAPL", SPLIT_Y_DIVIDENDO)) as download:
+        assert CorporateActionService.sync(session, ["AAPL"], now=datetime(2024, 5, 2, 1)) == {}
+    download.assert_called_once_with(["AAPL"], datetime(2024, 5, 1).date() - timedelta(days=CorporateActionService.OVERLAP_DAYS))
+    assert len(session.exec(select(CorporateAction)).all()) == 2
+
+
+def test_backdated_trade_across_a_split_is_replayed(client, session):
+    seed(client, session)
+    with patch.object(CorporateActionService, "download", return_value=yahoo_frame("AAPL", SPLIT_Y_DIVIDENDO)):
+        CorporateActionService.sync(session, ["AAPL"], now=datetime(2024, 7, 1))
+
+    respuesta = client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 5, "precio": 100.0, "fecha": "2024-01-15T10:00:00"})
+
+    asset = session.exec(select(Asset).where(Asset.ticker == "AAPL")).one()
+    session.refresh(asset)
+    assert asset.cantidad_total == 50.0
+    assert respuesta.json()["nuevo_promedio"] == 70.0
+    assert asset.dividendos == 50 * 50
+
+
+def test_recorded_dividends_win_and_incremental_replay_matches_rebuild(session, monkeypatch):
+    monkeypatch.setattr(PositionEngine, "CHECKPOINT_INTERVAL", 2)
+    base = datetime(2024, 1, 2, 10)
+    for i in range(8):
+        session.add(TradeHistory(ticker="KO", tipo="BUY", cantidad=1.0, precio=6000, total=6000, fecha=base + timedelta(days=10 * i)))
+    session.add(TradeHistory(ticker="KO", tipo="DIVIDEND", cantidad=0.0, precio=0, total=1234, fecha=datetime(2024, 4, 1, 12)))
+    session.commit()
+    PositionEngine.rebuild(session, ["KO"])
+
+    session.add(CorporateAction(ticker="KO", tipo="SPLIT", fecha=datetime(2024, 2, 5), valor=3.0))
+    session.add(CorporateAction(ticker="KO", tipo="DIVIDEND", fecha=datetime(2024, 3, 1), valor=0.46))
+    session.commit()
+    CorporateActionService.reapply(session, {"KO": datetime(2024, 2, 5)})
+
+    incremental = session.exec(select(Asset).where(Asset.ticker == "KO")).one()
+    session.refresh(incremental)
+    estado = (incremental.cantidad_total, incremental.precio_promedio, incremental.dividendos)
+    # Hubo checkpoints anteriores al split que se reutilizaron
+    assert session.exec(select(PositionCheckpoint).where(PositionCheckpoint.fecha < datetime(2024, 2, 5))).first() is not None
+
+    rebuilt = PositionEngine.rebuild(session, ["KO"])["KO"]
+    # 4 compras antes del split (x3) + 4 después; el cobrado registrado reemplaza la estimación
+    assert estado == (rebuilt.cantidad_total, rebuilt.precio_promedio, rebuilt.dividendos) == (16.0, 3000, 1234)
+
+
+def test_imported_snapshot_is_not_split_again(session):
+    # El saldo importado hoy ya refleja el split 10:1 de NVDA de 2024-06-10
+    ImportService.import_snapshot(session, json.dumps([{"Ticker": "NVDA", "Cantidad_Total": 10, "Precio_Promedio": 120.0}]))
+
+    with patch.object(CorporateActionService, "download", return_value=yahoo_frame("NVDA", [("2024-06-10", "Stock Splits", 10.0)])):
+        assert CorporateActionService.sync(session, ["NVDA"], now=datetime(2024, 7, 1)) == {"NVDA": datetime(2024, 6, 10)}
+
+    asset = session.exec(select(Asset).where(Asset.ticker == "NVDA")).one()
+    session.refresh(asset)
+    assert (asset.cantidad_total, asset.precio_promedio) == (10.0, 12000)
+    assert LotEngine.replay(session, ["NVDA"])["NVDA"].book.open_lots() == [(10.0, 12000.0)]
+
+    # Un saldo importado antes del split sí lo recibe
+    session.execute(update(TradeHistory).values(importado_en=datetime(2024, 5, 1)))
+    session.commit()
+    rebuilt = PositionEngine.rebuild(session, ["NVDA"])["NVDA"]
+    assert (rebuilt.cantidad_total, rebuilt.precio_promedio) == (100.0, 1200)
+    assert LotEngine.replay(session, ["NVDA"])["NVDA"].book.open_lots() == [(100.0, 1200.0)]
+
+
+def test_reimport_keeps_actions_of_manual_trades(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=10_000_000))
+    session.add(BrokerSettings(id=1, lot_method="FIFO"))
+    session.commit()
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 10, "precio": 100.0, "fecha": "2024-01-02T10:00:00"})
+    with patch.object(CorporateActionService, "download", return_value=yahoo_frame("AAPL", SPLIT_Y_DIVIDENDO)):
+        CorporateActionService.sync(session, ["AAPL"], now=datetime(2024, 7, 1))
+
+    # Saldo importado después del split: 5 acciones que ya lo reflejan
+    ImportService.import_snapshot(session, json.dumps([{"Ticker": "AAPL", "Cantidad_Total": 5, "Precio_Promedio": 50.0}]))
+
+    asset = session.exec(select(Asset).where(Asset.ticker == "AAPL")).one()
+    session.refresh(asset)
+    # La compra manual sigue partida (20) y el saldo importado no se vuelve a partir (5)
+    assert (asset.cantidad_total, asset.precio_promedio) == (25.0, 5000)
+    # El dividendo estimado sólo cuenta las acciones de la compra manual
+    assert asset.dividendos == 20 * 50
+    assert LotEngine.replay(session, ["AAPL"])["AAPL"].book.open_lots() == [(5.0, 5000.0), (20.0, 5000.0)]
+
+    replayed = PositionEngine.replay(session, "AAPL")
+    assert (replayed.cantidad_total, replayed.precio_promedio, replayed.dividendos) == (25.0, 5000, 1000)
+
+
+def test_migration_marks_previously_imported_snapshots(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE tradehistory (id INTEGER PRIMARY KEY, ticker VARCHAR NOT NULL, tipo VARCHAR NOT NULL, "
+            "cantidad FLOAT NOT NULL, precio INTEGER NOT NULL, total INTEGER NOT NULL, fecha DATETIME NOT NULL, "
+            "ganancia_realizada INTEGER, commission INTEGER NOT NULL)"
+        ))
+        # Saldo importado (SNAPSHOT_DATE, ganancia 0) y una compra cargada a mano ese mismo día
+        conn.execute(text(
+            "INSERT INTO tradehistory (ticker, tipo, cantidad, precio, total, fecha, ganancia_realizada, commission) VALUES "
+            "('NVDA', 'BUY', 10, 12000, 120000, :fecha, 0, 0), ('AAPL', 'BUY', 1, 15000, 15000, :fecha, NULL, 0)"
+        ), {"fecha": SNAPSHOT_DATE.isoformat(" ", "microseconds")})
+
+    SQLModel.metadata.create_all(engine)
+    assert "tradehistory_mark_imported_snapshots" in run_migrations(engine)
+
+    with Session(engine) as session:
+        marcados = {t: (i, c) for t, i, c in session.execute(
+            select(TradeHistory.ticker, TradeHistory.importado_en, TradeHistory.usar_caja_broker)
+        )}
+    assert marcados["NVDA"][0] is not None and marcados["NVDA"][1] is False
+    assert marcados["AAPL"][0] is None and marcados["AAPL"][1] is True
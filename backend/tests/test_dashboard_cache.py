@@ -0,0 +1,96 @@
+from unittest.mock import patch
+from sqlalchemy import update
+from sqlmodel import Session
+from models.models import Asset, BrokerCash, DataVersionCounter
+from services.data_version import data_version
+from services.fx_service import fx_service
+
+
+def test_dashboard_served_from_cache_until_write(client, session):
+    session.add(Asset(ticker="AAPL", cantidad_total=10.0, precio_promedio=15000))
+    session.add(BrokerCash(id=1, saldo_usd=50000))
+    session.commit()
+    # Cotización ya cargada (la primera descarga cambia la versión a mitad del cálculo)
+    fx_service.refresh()
+
+    with patch("services.portfolio_service.MarketDataService.get_snapshot_prices", return_value={"AAPL": 20000}) as mock_prices:
+        first = client.get("/api/dashboard")
+        second = client.get("/api/dashboard")
+
+        assert mock_prices.call_count == 1
+        assert first.json() == second.json()
+        assert first.headers["etag"] == second.headers["etag"]
+
+        # Una escritura (movimiento de caja) invalida el resumen
+        client.post("/api/movimientos/", json={"tipo": "ingreso", "monto": 100.0, "moneda": "USD", "categoria": "Sueldo"})
+        third = client.get("/api/dashboard")
+
+    assert mock_prices.call_count == 2
+    assert third.json()["net_worth"] == first.json()["net_worth"] + 100.0
+    assert third.headers["etag"] != first.headers["etag"]
+
+
+def test_write_from_another_worker_invalidates(client, session):
+    session.add(Asset(ticker="AAPL", cantidad_total=10.0, precio_promedio=15000))
+    session.commit()
+    fx_service.refresh()
+
+    with patch("services.portfolio_service.MarketDataService.get_snapshot_prices", return_value={"AAPL": 20000}) as mock_prices:
+        client.get("/api/dashboard")
+        client.get("/api/dashboard")
+        assert mock_prices.call_count == 1
+
+        # Otro worker commitea una escritura: en este proceso sólo se ve la fila compartida
+        version = data_version.current()
+        with Session(session.get_bind()) as other:
+            other.execute(update(DataVersionCounter).values(version=DataVersionCounter.version + 1))
+            other.commit()
+        assert data_version.current() == version
+
+        client.get("/api/dashboard")
+
+    assert mock_prices.call_count == 2
+    assert data_version.current() > version
+
+
+def test_if_none_match_returns_304(client):
+    first = client.get("/api/dashboard")
+    etag = first.headers["etag"]
+
+    response = client.get("/api/dashboard", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.get("/api/dashboard", headers={"If-None-Match": '"otro"'}).status_code == 200
+
+
+def test_trade_and_settings_writes_bump_version(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=100000))
+    session.commit()
+
+    version = data_version.current()
+    client.post("/api/settings/", json={"default_fee_integer": 1.0, "default_fee_fractional": 0.5})
+    assert data_version.current() > version
+
+    version = data_version.current()
+    with patch("services.portfolio_service.MarketDataService.get_snapshot_prices", return_value={}):
+        client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 1, "precio": 100.0})
+    assert data_version.current() > version
+
+    # Lecturas puras no cambian la versión
+    version = data_version.current()
+    client.get("/api/trade/history")
+    assert data_version.current() == version
+
+
+def test_fx_change_bumps_version(dolar_stub):
+    fx_service.refresh()
+    version = data_version.current()
+
+    fx_service.refresh()  # Misma cotización: nada que invalidar
+    assert data_version.current() == version
+
+    dolar_stub.payload = {**dolar_stub.payload, "venta": 42.0}
+    fx_service.refresh()
+    assert data_version.current() == version + 1
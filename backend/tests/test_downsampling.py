@@ -0,0 +1,51 @@
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pandas as pd
+from services.downsampling import lttb
+
+
+def test_lttb_returns_requested_points_keeping_edges():
+    x = np.arange(10_000, dtype=np.int64)
+    y = np.sin(x / 200.0)
+
+    keep = lttb(x, y, 300)
+
+    assert len(keep) == 300
+    assert keep[0] == 0 and keep[-1] == 9_999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_preserves_spikes():
+    x = np.arange(5_000)
+    y = np.zeros(5_000)
+    y[1234] = 50.0
+    y[3821] = -40.0
+
+    keep = lttb(x, y, 50)
+
+    assert 1234 in keep
+    assert 3821 in keep
+
+
+def test_lttb_short_series_passthrough():
+    x = np.arange(10)
+    assert lttb(x, x * 2.0, 100).tolist() == list(range(10))
+    assert lttb(x, x * 2.0, 10).tolist() == list(range(10))
+
+
+@patch("services.history_store.yf.Ticker")
+def test_history_points_param(mock_ticker, client):
+    dates = pd.bdate_range(end="2024-06-03", periods=2_000, tz="America/New_York")
+    closes = 100 + np.cumsum(np.random.default_rng(7).normal(0, 1, len(dates)))
+    mock_ticker.return_value = MagicMock(**{"history.return_value": pd.DataFrame({"Close": closes}, index=dates)})
+
+    full = client.get("/api/market/history/AAPL?range=max").json()["data"]
+    reduced = client.get("/api/market/history/AAPL?range=max&points=200").json()["data"]
+
+    assert len(full) == 2_000
+    assert len(reduced) == 200
+    assert reduced[0] == full[0] and reduced[-1] == full[-1]
+    # Los puntos elegidos son velas reales, no interpolaciones
+    assert all(p in full for p in reduced[::20])
+
+    assert client.get("/api/market/history/AAPL?points=1").status_code == 422
@@ -0,0 +1,96 @@
+import threading
+import time
+from models.models import Transaction
+from services.fx_service import FxRateService, fx_service
+
+
+def wait_for_background_refresh(stub, expected_requests, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if stub.requests >= expected_requests and not fx_service._refreshing:
+            return
+        time.sleep(0.01)
+
+
+def test_dolar_endpoint_uses_cached_quote(client, dolar_stub):
+    first = client.get("/api/dolar-uy").json()
+    second = client.get("/api/dolar-uy").json()
+
+    assert first["venta"] == 40.0
+    assert first["fuente"] == "DolarApi.com"
+    assert second["stale"] is False
+    assert dolar_stub.requests == 1 # El segundo request sale de la caché
+
+
+def test_dashboard_converts_uyu_with_cached_quote(client, session, dolar_stub):
+    session.add(Transaction(tipo="ingreso", monto=400000, moneda="UYU", categoria="Sueldo")) # $4000 UYU
+    session.commit()
+
+    data = client.get("/api/dashboard").json()
+
+    assert data["net_worth"] == 100.0 # 4000 / 40
+    assert data["dolar"]["venta"] == 40.0
+
+
+def test_upstream_down_serves_stale_value(client, dolar_stub, monkeypatch):
+    assert fx_service.get_quote()["venta"] == 40.0
+
+    # La cotización vence y dolarapi empieza a fallar
+    monkeypatch.setattr(FxRateService, "TTL_SECONDS", 0)
+    dolar_stub.status = 500
+    client.get("/api/dolar-uy")
+    wait_for_background_refresh(dolar_stub, 2)
+
+    quote = client.get("/api/dolar-uy").json()
+    assert quote["venta"] == 40.0 # Último valor bueno, no 1.0
+    assert quote["stale"] is True
+    assert quote["edad_segundos"] is not None
+
+
+def test_dashboard_does_not_wait_for_slow_upstream(client, dolar_stub, monkeypatch):
+    fx_service.get_quote()
+    monkeypatch.setattr(FxRateService, "TTL_SECONDS", 0)
+    dolar_stub.delay = 1.0
+
+    start = time.perf_counter()
+    response = client.get("/api/dashboard")
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    assert elapsed < 0.5 # El refresh corre en background
+    wait_for_background_refresh(dolar_stub, 2, timeout=3.0)
+
+
+def test_cold_start_failure_uses_backup_and_cools_down(dolar_stub):
+    dolar_stub.status = 503
+
+    first = fx_service.get_quote()
+    second = fx_service.get_quote()
+
+    assert first["venta"] == FxRateService.FALLBACK["venta"]
+    assert first["stale"] is True
+    assert second["venta"] == FxRateService.FALLBACK["venta"]
+    wait_for_background_refresh(dolar_stub, 2)
+    # Un solo intento bloqueante; el resto va en background
+    assert dolar_stub.requests <= 2
+
+
+def test_clear_discards_in_flight_background_refresh(dolar_stub, monkeypatch):
+    fx_service.get_quote()
+    monkeypatch.setattr(FxRateService, "TTL_SECONDS", 0)
+    dolar_stub.delay = 0.3
+    dolar_stub.payload = {**dolar_stub.payload, "venta": 45.0}
+    fx_service.get_quote()
+    thread = fx_service._thread
+
+    # Sin esperar: el fetch lanzado antes del clear no debe escribir al terminar
+    fx_service.clear(timeout=0)
+    assert fx_service._refreshing is False
+    thread.join()
+    assert fx_service._quote is None
+
+    fx_service.refresh_async()
+    fx_service.clear()
+    # clear() espera al refresh en curso: no queda ningún hilo vivo
+    assert fx_service._thread is None
+    assert not any(t.name == "fx-refresh" and t.is_alive() for t in threading.enumerate())
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+import pandas as pd
+from sqlmodel import select
+from models.models import PriceBar, PriceSeries
+from services.history_store import HistoryStore
+
+NOW = datetime(2024, 6, 3, 12, 0)
+
+
+def make_bars(start: str, rows: int, base: float = 100.0) -> pd.DataFrame:
+    dates = pd.date_range(start=start, periods=rows, freq="D", tz="America/New_York")
+    closes = [base + i for i in range(rows)]
+    return pd.DataFrame(
+        {"Open": closes, "High": closes, "Low": closes, "Close": closes, "Volume": [1000.0] * rows},
+        index=dates,
+    )
+
+
+def mock_yahoo(mock_ticker, *frames):
+    instance = MagicMock()
+    instance.history.side_effect = list(frames)
+    mock_ticker.return_value = instance
+    return instance
+
+
+@patch("services.history_store.yf.Ticker")
+def test_second_load_is_served_locally(mock_ticker, session):
+    yahoo = mock_yahoo(mock_ticker, make_bars("2024-05-01", 30))
+
+    ts1, close1 = HistoryStore.get_series(session, "aapl", "max", "1d", now=NOW)
+    ts2, close2 = HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW + timedelta(minutes=5))
+
+    assert yahoo.history.call_count == 1
+    yahoo.history.assert_called_with(period="max", interval="1d", auto_adjust=False)
+    assert len(ts1) == 30
+    assert ts2.tolist() == ts1.tolist()
+    assert close2.tolist() == close1.tolist()
+
+    meta = session.get(PriceSeries, ("AAPL", "1d"))
+    assert meta.completo is True
+
+
+@patch("services.history_store.yf.Ticker")
+def test_stale_series_fetches_only_tail(mock_ticker, session):
+    first = make_bars("2024-05-01", 30)           # 1/5 .. 30/5
+    tail = make_bars("2024-05-30", 3, base=500.0)  # 30/5 (corregida), 31/5, 1/6
+    yahoo = mock_yahoo(mock_ticker, first, tail)
+
+    HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW)
+    ts, close = HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW + timedelta(hours=1))
+
+    assert yahoo.history.call_count == 2
+    _, kwargs = yahoo.history.call_args
+    assert "period" not in kwargs
+    # Pide desde el día (UTC) de la última vela guardada
+    assert str(kwargs["start"]) == "2024-05-30"
+
+    # La vela solapada se reemplaza, no se duplica
+    assert len(ts) == 32
+    assert len(set(ts.tolist())) == 32
+    assert close[-3:].tolist() == [500.0, 501.0, 502.0]
+    assert len(session.exec(select(PriceBar)).all()) == 32
+
+
+@patch("services.history_store.yf.Ticker")
+def test_longer_period_triggers_full_download(mock_ticker, session):
+    yahoo = mock_yahoo(mock_ticker, make_bars("2024-05-01", 30), make_bars("2020-01-01", 1600))
+
+    HistoryStore.get_series(session, "AAPL", "1mo", "1d", now=NOW)
+    ts, _ = HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW + timedelta(minutes=1))
+
+    assert yahoo.history.call_args_list[1].kwargs == {"period": "max", "interval": "1d", "auto_adjust": False}
+    # Se agregan los años previos; las velas de mayo posteriores a la descarga se conservan
+    assert ts[0] == int(pd.Timestamp("2020-01-01", tz="America/New_York").timestamp())
+    assert len(set(ts.tolist())) == len(ts) == 1612
+
+    # "max" cubre cualquier período diario: 1y se sirve de lo guardado
+    ts_1y, _ = HistoryStore.get_series(session, "AAPL", "1y", "1d", now=NOW + timedelta(minutes=2))
+    assert yahoo.history.call_count == 2
+    assert 360 <= len(ts_1y) <= 367
+
+
+@patch("services.history_store.yf.Ticker")
+def test_yahoo_failure_serves_stored_bars(mock_ticker, session):
+    yahoo = mock_yahoo(mock_ticker, make_bars("2024-05-01", 30), RuntimeError("Yahoo caído"))
+
+    HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW)
+    ts, _ = HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW + timedelta(hours=1))
+
+    assert yahoo.history.call_count == 2
+    assert len(ts) == 30
+
+
+@patch("services.history_store.yf.Ticker")
+def test_history_endpoint_serializes_stored_series(mock_ticker, client):
+    mock_yahoo(mock_ticker, make_bars("2024-05-01", 3, base=10.005))
+
+    response = client.get("/api/market/history/AAPL?range=max")
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [p["value"] for p in data] == [round(10.005, 2), round(11.005, 2), round(12.005, 2)]
+    assert data[0]["time"] == int(pd.Timestamp("2024-05-01", tz="America/New_York").timestamp())
+
+
+@patch("services.history_store.yf.Ticker")
+def test_split_in_tail_refetches_the_whole_series(mock_ticker, session):
+    first = make_bars("2024-05-01", 30)
+    tail = make_bars("2024-05-30", 3, base=50.0)
+    tail["Stock Splits"] = [0.0, 2.0, 0.0]  # Split 2:1 el 31/5
+    refetch = make_bars("2024-05-01", 32, base=50.0)
+    yahoo = mock_yahoo(mock_ticker, first, tail, refetch)
+
+    HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW)
+    session.add(PriceBar(ticker="AAPL", intervalo="15m", ts=1717000000, open=1, high=1, low=1, close=200.0))
+    session.add(PriceSeries(ticker="AAPL", intervalo="15m", inicio=1716900000, actualizado=NOW))
+    session.commit()
+    ts, close = HistoryStore.get_series(session, "AAPL", "max", "1d", now=NOW + timedelta(hours=1))
+
+    assert yahoo.history.call_count == 3
+    assert yahoo.history.call_args.kwargs == {"period": "max", "interval": "1d", "auto_adjust": False}
+    # Toda la serie en la base nueva, sin velas viejas mezcladas
+    assert len(ts) == 32
+    assert close[0] == 50.0
+    assert session.get(PriceSeries, ("AAPL", "1d")).completo is True
+    # Los otros intervalos del ticker también se descartan
+    assert session.exec(select(PriceBar).where(PriceBar.intervalo == "15m")).first() is None
+    assert session.get(PriceSeries, ("AAPL", "15m")) is None
+
+
+@patch("services.history_store.yf.Ticker")
+def test_intraday_bars_are_pruned_to_the_retention_window(mock_ticker, session):
+    dates = pd.date_range(start="2024-05-01", periods=20 * 96, freq="15min", tz="America/New_York")
+    closes = [100.0] * len(dates)
+    frame = pd.DataFrame({"Open": closes, "High": closes, "Low": closes, "Close": closes}, index=dates)
+    mock_yahoo(mock_ticker, frame)
+
+    HistoryStore.sync(session, "AAPL", "1mo", "15m", now=NOW)
+
+    ts = [r for r in session.exec(select(PriceBar.ts).where(PriceBar.intervalo == "15m"))]
+    last = int(dates[-1].timestamp())
+    assert max(ts) == last
+    assert min(ts) >= last - HistoryStore.RETENTION_SECONDS["15m"]
+    assert session.get(PriceSeries, ("AAPL", "15m")).inicio == last - HistoryStore.RETENTION_SECONDS["15m"]
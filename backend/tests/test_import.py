@@ -117,3 +117,52 @@ def test_import_snapshot_case_insensitive_lookup(session):
     assert asset_ticker == "MSFT"
     assert asset.cantidad_total == 20
     assert asset.precio_promedio == 25000
+
+
+def test_import_snapshot_reports_row_errors(session):
+    json_content = json.dumps([
+        { "Ticker": "AAPL", "Cantidad_Total": 2, "Precio_Promedio": 100.0 },
+        { "Ticker": "", "Cantidad_Total": 1, "Precio_Promedio": 10.0 },
+        { "Ticker": "MSFT", "Cantidad_Total": "abc", "Precio_Promedio": 10.0 },
+        "no soy un objeto",
+        { "Ticker": "nvda", "Cantidad_Total": 3, "Precio_Promedio": 50.0 },
+    ])
+
+    result = ImportService.import_snapshot(session, json_content)
+
+    assert result["processed"] == 2
+    assert [e["fila"] for e in result["errors"]] == [1, 2, 3]
+    tickers = sorted(a.ticker for a in session.query(Asset).all())
+    assert tickers == ["AAPL", "NVDA"]
+
+
+def test_import_snapshot_batches_price_refresh(session, monkeypatch):
+    from services.market_service import MarketDataService
+
+    calls = []
+    monkeypatch.setattr(MarketDataService, "get_market_prices", lambda session, assets: calls.append(len(assets)) or {})
+
+    json_content = json.dumps([
+        { "Ticker": f"T{i}", "Cantidad_Total": 1, "Precio_Promedio": 10.0 + i } for i in range(2000)
+    ])
+    result = ImportService.import_snapshot(session, json_content)
+
+    assert result["processed"] == 2000
+    assert calls == [2000] # Una sola descarga para todo el snapshot
+    assert session.query(Asset).count() == 2000
+
+
+def test_import_snapshot_rejects_non_finite_numbers(session):
+    json_content = json.dumps([
+        { "Ticker": "AAPL", "Cantidad_Total": 1, "Precio_Promedio": "Infinity" },
+        { "Ticker": "MSFT", "Cantidad_Total": 1, "Precio_Promedio": "1e400" },
+        { "Ticker": "NVDA", "Cantidad_Total": float("inf"), "Precio_Promedio": 10.0 },
+        { "Ticker": "KO", "Cantidad_Total": "NaN", "Precio_Promedio": 10.0 },
+        { "Ticker": "TSLA", "Cantidad_Total": 1, "Precio_Promedio": 10.0 },
+    ])
+
+    result = ImportService.import_snapshot(session, json_content)
+
+    assert result["processed"] == 1
+    assert [e["fila"] for e in result["errors"]] == [0, 1, 2, 3]
+    assert [a.ticker for a in session.query(Asset).all()] == ["TSLA"]
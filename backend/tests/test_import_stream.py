@@ -0,0 +1,96 @@
+import io
+import json
+import tracemalloc
+import pytest
+from models.models import Asset
+from services.import_service import ImportService, _JsonArrayStream
+
+
+def test_iter_positions_handles_code_fence():
+    content = '```json\n[{"Ticker": "AAPL", "Cantidad_Total": 1, "Precio_Promedio": 10}]\n```'
+    assert list(ImportService.iter_positions(content)) == [
+        {"Ticker": "AAPL", "Cantidad_Total": 1, "Precio_Promedio": 10}
+    ]
+
+
+def test_iter_positions_across_chunk_boundaries(monkeypatch):
+    # Chunks diminutos: cada objeto y número queda partido entre lecturas
+    monkeypatch.setattr(_JsonArrayStream, "CHUNK_SIZE", 3)
+    items = [{"Ticker": f"T{i}", "Cantidad_Total": 12345.678 + i, "Precio_Promedio": 1000 + i} for i in range(50)]
+    stream = io.BytesIO(("```json\n" + json.dumps(items, indent=2) + "\n```").encode())
+
+    assert list(ImportService.iter_positions(stream)) == items
+
+
+@pytest.mark.parametrize("content, message", [
+    ('{"Ticker": "AAPL"}', "lista de objetos"),
+    ('[{"Ticker": "AAPL"} {"Ticker": "MSFT"}]', "Error parseando JSON"),
+    ('[{"Ticker": "AAPL"', "Error parseando JSON"),
+    ("", "Error parseando JSON"),
+])
+def test_iter_positions_invalid_json(content, message):
+    with pytest.raises(ValueError, match=message):
+        list(ImportService.iter_positions(content))
+
+
+class LazySnapshot(io.RawIOBase):
+    """Archivo binario que genera el JSON al vuelo (nunca existe entero en memoria)."""
+
+    def __init__(self, n):
+        self._rows = (
+            ("[" if i == 0 else ",") + json.dumps({"Ticker": f"T{i % 100}", "Cantidad_Total": 1.5, "Precio_Promedio": 10.25})
+            for i in range(n)
+        )
+        self._pending = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while len(self._pending) < size and not self._done:
+            row = next(self._rows, None)
+            if row is None:
+                self._pending += b"]"
+                self._done = True
+            else:
+                self._pending += row.encode()
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def test_iter_positions_memory_is_flat():
+    def peak_for(n):
+        tracemalloc.start()
+        count = sum(1 for _ in ImportService.iter_positions(LazySnapshot(n)))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert count == n
+        return peak
+
+    small, large = peak_for(1_000), peak_for(20_000)
+    # 20x más filas no debe multiplicar el pico de memoria
+    assert large < small * 2
+
+
+def test_import_snapshot_file_upload(client, session, monkeypatch):
+    from services.market_service import MarketDataService
+    monkeypatch.setattr(MarketDataService, "get_market_prices", lambda session, assets: {})
+
+    payload = '```json\n[{"Ticker": "nvda", "Cantidad_Total": 5, "Precio_Promedio": 100.0}]\n```'
+    response = client.post(
+        "/api/portfolio/import/file",
+        files={"archivo": ("snapshot.json", payload.encode(), "application/json")},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["processed"] == 1
+    asset = session.query(Asset).filter(Asset.ticker == "NVDA").one()
+    assert asset.precio_promedio == 10000
+
+
+def test_import_snapshot_invalid_json_rolls_back(session):
+    content = '[{"Ticker": "AAPL", "Cantidad_Total": 1, "Precio_Promedio": 10}, {"Ticker": '
+    with pytest.raises(ValueError):
+        ImportService.import_snapshot(session, content)
+    assert session.query(Asset).count() == 0
@@ -0,0 +1,116 @@
+import random
+import pytest
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel, create_engine, select
+from migrations import run_migrations
+from models.models import Asset, BrokerCash, BrokerSettings, TradeHistory
+from services.lot_engine import LotBook, replay_lots
+from services.position_engine import apply_trade
+
+# (id, tipo, cantidad, precio CENTS, commission CENTS)
+ROWS = [
+    (1, "BUY", 10.0, 100, 0),
+    (2, "BUY", 10.0, 200, 0),
+    (3, "DIVIDEND", 0.0, 50, 0),
+    (4, "SELL", 15.0, 300, 0),
+]
+
+
+@pytest.mark.parametrize("method,realized,lots", [
+    ("FIFO", 4500 - (10 * 100 + 5 * 200), [(5.0, 200.0)]),
+    ("LIFO", 4500 - (10 * 200 + 5 * 100), [(5.0, 100.0)]),
+    ("AVERAGE", 4500 - 15 * 150, [(5.0, 150.0)]),
+])
+def test_methods_consume_lots(method, realized, lots):
+    result = replay_lots(ROWS, method)
+
+    assert result.realized == {4: realized}
+    assert result.book.open_lots() == lots
+    assert result.book.shares == 5.0
+
+
+def test_buy_commission_is_part_of_lot_cost():
+    book = LotBook("FIFO")
+    book.buy(10.0, 100, 50)
+    # Neto de la venta: 10 * 120 - 20; costo: 10 * 105
+    assert book.sell(10.0, 120, 20) == 1180 - 1050
+    assert book.open_lots() == []
+
+
+def test_average_matches_position_engine():
+    rng = random.Random(7)
+    book = LotBook("AVERAGE")
+    shares, cost_basis = 0.0, 0.0
+    for _ in range(2000):
+        tipo = "SELL" if rng.random() < 0.3 and shares > 5 else "BUY"
+        qty, price, comm = round(rng.uniform(0.1, 5.0), 4), rng.randint(5000, 50000), rng.randint(0, 200)
+        shares, cost_basis = apply_trade(shares, cost_basis, tipo, qty, price, comm)
+        book.buy(qty, price, comm) if tipo == "BUY" else book.sell(qty, price, comm)
+
+    assert book.shares == pytest.approx(shares)
+    assert book.cost_basis == pytest.approx(cost_basis)
+
+
+def test_fifo_compacts_consumed_lots():
+    book = LotBook("FIFO")
+    for _ in range(1000):
+        book.buy(1.0, 100)
+    for _ in range(990):
+        book.sell(1.0, 100)
+
+    assert book.shares == 10.0
+    assert len(book.qty) < 100
+
+
+def test_fifo_sale_and_method_switch_recompute_realized(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=1_000_000))
+    session.add(BrokerSettings(id=1, lot_method="FIFO"))
+    session.commit()
+
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 10, "precio": 100.0})
+    client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 10, "precio": 200.0})
+    venta = client.post("/api/trade/sell", json={"ticker": "AAPL", "cantidad": 15, "precio": 300.0})
+
+    assert venta.json()["ganancia_realizada"] == 2500.0
+
+    response = client.post("/api/settings/", json={"default_fee_integer": 0, "default_fee_fractional": 0, "lot_method": "LIFO"})
+
+    assert response.json()["lot_method"] == "LIFO"
+    sell = session.exec(select(TradeHistory).where(TradeHistory.tipo == "SELL")).one()
+    session.refresh(sell)
+    assert sell.ganancia_realizada == 200000
+    # La posición (precio promedio) no depende del método
+    asset = session.exec(select(Asset).where(Asset.ticker == "AAPL")).one()
+    assert asset.cantidad_total == 5.0
+
+
+def test_backdated_buy_recomputes_later_sales(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=1_000_000))
+    session.add(BrokerSettings(id=1, lot_method="FIFO"))
+    session.commit()
+
+    client.post("/api/trade/buy", json={"ticker": "MSFT", "cantidad": 5, "precio": 200.0, "fecha": "2024-02-01T10:00:00"})
+    client.post("/api/trade/sell", json={"ticker": "MSFT", "cantidad": 5, "precio": 250.0, "fecha": "2024-03-01T10:00:00"})
+    # Compra anterior a todo: FIFO ahora vende primero estas acciones
+    client.post("/api/trade/buy", json={"ticker": "MSFT", "cantidad": 5, "precio": 100.0, "fecha": datetime(2024, 1, 1).isoformat()})
+
+    sell = session.exec(select(TradeHistory).where(TradeHistory.tipo == "SELL")).one()
+    session.refresh(sell)
+    assert sell.ganancia_realizada == 5 * (25000 - 10000)
+
+
+def test_migration_adds_lot_method_to_existing_settings(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE brokersettings (id INTEGER PRIMARY KEY, default_fee_integer INTEGER NOT NULL, "
+                          "default_fee_fractional INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO brokersettings VALUES (1, 100, 50)"))
+
+    SQLModel.metadata.create_all(engine)
+    applied = run_migrations(engine)
+
+    assert "brokersettings_lot_method" in applied
+    assert "lot_method" in {c["name"] for c in inspect(engine).get_columns("brokersettings")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT lot_method FROM brokersettings")).scalar() == "AVERAGE"
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import text
+from services.metrics import EXTERNAL_ERRORS, SPAN_COMPONENT_SECONDS, SPAN_ROWS, span, timed
+
+
+def test_metrics_endpoint_exposes_route_latency(client):
+    client.get("/api/dashboard")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/dashboard",status="200"}' in body
+    assert "# TYPE span_duration_seconds histogram" in body
+    assert 'span_duration_seconds_count{span="get_dashboard_summary"}' in body
+
+
+def test_span_records_db_time_and_rows(session):
+    antes = SPAN_COMPONENT_SECONDS.count(span="test_db", component="db")
+
+    with span("test_db") as s:
+        session.execute(text("SELECT 1")).all()
+        s.rows(3)
+
+    assert SPAN_COMPONENT_SECONDS.count(span="test_db", component="db") == antes + 1
+    assert SPAN_ROWS.value(span="test_db") >= 3
+
+
+def test_timed_counts_external_errors():
+    antes = EXTERNAL_ERRORS.value(service="test_ext")
+
+    with pytest.raises(RuntimeError):
+        with span("test_ext_span"):
+            with timed("test_ext"):
+                raise RuntimeError("timeout")
+
+    assert EXTERNAL_ERRORS.value(service="test_ext") == antes + 1
+    assert SPAN_COMPONENT_SECONDS.count(span="test_ext_span", component="test_ext") == 1
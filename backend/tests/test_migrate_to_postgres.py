@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, text
+from sqlmodel import Session, SQLModel, create_engine, select
+from models.models import Asset, BrokerCash, CashBalance, TradeHistory, Transaction
+from migrate_to_postgres import migrate
+
+
+def seed_source(url):
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(BrokerCash(id=1, saldo_usd=123456))
+        session.add(Asset(ticker="AAPL", cantidad_total=3.5, precio_promedio=15000))
+        session.add(Transaction(tipo="ingreso", monto=100000, moneda="USD", categoria="Sueldo"))
+        session.add(Transaction(tipo="gasto", monto=2500, moneda="USD", categoria="Comida"))
+        for i in range(50):
+            session.add(TradeHistory(ticker="AAPL", tipo="BUY", cantidad=1.0, precio=10000 + i, total=10000 + i,
+                                     commission=i, fecha=datetime(2024, 1, 1) + timedelta(days=i)))
+        session.commit()
+    engine.dispose()
+
+
+def test_migrate_preserves_rows_ids_and_commission(tmp_path):
+    source, dest = f"sqlite:///{tmp_path / 'src.db'}", f"sqlite:///{tmp_path / 'dst.db'}"
+    seed_source(source)
+
+    copied = migrate(source, dest, chunk_size=7, workers=3)
+
+    assert copied["tradehistory"] == 50
+    engine = create_engine(dest)
+    with Session(engine) as session:
+        trades = session.exec(select(TradeHistory).order_by(TradeHistory.id)).all()
+        assert [t.id for t in trades] == list(range(1, 51))
+        assert [t.commission for t in trades] == list(range(50))
+        assert trades[10].fecha == datetime(2024, 1, 11)
+        assert session.get(BrokerCash, 1).saldo_usd == 123456
+        # El ledger de caja se reconstruye en el destino
+        assert session.get(CashBalance, "USD").saldo == 97500
+
+
+def test_migrate_resumes_after_interruption(tmp_path):
+    source, dest = f"sqlite:///{tmp_path / 'src.db'}", f"sqlite:///{tmp_path / 'dst.db'}"
+    seed_source(source)
+    migrate(source, dest, chunk_size=10)
+
+    # Simula un corte a mitad de la tabla: sólo quedaron los primeros bloques
+    engine = create_engine(dest)
+    with Session(engine) as session:
+        session.execute(delete(TradeHistory).where(TradeHistory.id > 20))
+        session.commit()
+
+    copied = migrate(source, dest, chunk_size=10)
+
+    assert copied == {"tradehistory": 30}
+    with Session(engine) as session:
+        ids = session.exec(select(TradeHistory.id).order_by(TradeHistory.id)).all()
+    assert ids == list(range(1, 51))
+
+
+def test_migrate_fills_columns_missing_in_old_schema(tmp_path):
+    source, dest = f"sqlite:///{tmp_path / 'old.db'}", f"sqlite:///{tmp_path / 'dst.db'}"
+    old = create_engine(source)
+    with old.begin() as conn:
+        # Esquema viejo: sin commission ni precio cacheado
+        conn.execute(text("CREATE TABLE tradehistory (id INTEGER PRIMARY KEY, ticker VARCHAR, tipo VARCHAR, "
+                          "cantidad FLOAT, precio INTEGER, total INTEGER, fecha DATETIME, ganancia_realizada INTEGER)"))
+        conn.execute(text("INSERT INTO tradehistory VALUES (1, 'MSFT', 'BUY', 2.0, 30000, 60000, '2024-03-01 10:00:00', NULL)"))
+        conn.execute(text("CREATE TABLE asset (id INTEGER PRIMARY KEY, ticker VARCHAR, cantidad_total FLOAT, precio_promedio INTEGER)"))
+        conn.execute(text("INSERT INTO asset VALUES (1, 'MSFT', 2.0, 30000)"))
+    old.dispose()
+
+    migrate(source, dest)
+
+    with Session(create_engine(dest)) as session:
+        trade = session.get(TradeHistory, 1)
+        asset = session.get(Asset, 1)
+    assert trade.commission == 0
+    assert trade.fecha == datetime(2024, 3, 1, 10)
+    assert asset.cached_price is None
+    assert asset.cantidad_total == 2.0
@@ -0,0 +1,153 @@
+import json
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, insert, update
+from sqlmodel import select
+from models.models import CorporateAction, NetWorthPoint, PriceBar, TradeHistory, Transaction
+from services.import_service import ImportService
+from services.networth_history import EPOCH, NOT_AN_INPUT, NetWorthHistory
+
+DAY1 = date(2024, 1, 1)
+
+
+def bar(ticker, day, close):
+    ts = (day - EPOCH).days * 86400
+    return PriceBar(ticker=ticker, intervalo="1d", ts=ts, open=close, high=close, low=close, close=close)
+
+
+def seed(session):
+    session.add(TradeHistory(ticker="CASH", tipo="DEPOSIT", cantidad=1, precio=500000, total=500000,
+                             fecha=datetime(2024, 1, 1, 9)))
+    session.add(TradeHistory(ticker="AAPL", tipo="BUY", cantidad=10, precio=10000, total=100000,
+                             fecha=datetime(2024, 1, 1, 10)))
+    session.add(Transaction(tipo="ingreso", monto=200000, moneda="USD", categoria="Sueldo", fecha=datetime(2024, 1, 2, 8)))
+    session.add(Transaction(tipo="ingreso", monto=400000, moneda="UYU", categoria="Sueldo", fecha=datetime(2024, 1, 3, 8)))
+    session.add(bar("AAPL", date(2024, 1, 2), 110.0))
+    session.add(bar("AAPL", date(2024, 1, 4), 120.0))
+    session.commit()
+
+
+def points(session):
+    return {p.fecha: p for p in session.exec(select(NetWorthPoint).order_by(NetWorthPoint.fecha))}
+
+
+def test_sync_materializes_closed_days(session):
+    seed(session)
+
+    assert NetWorthHistory.sync(session, today=date(2024, 1, 6)) == DAY1
+    serie = points(session)
+
+    # Sólo días cerrados: el 6 (hoy) queda abierto
+    assert list(serie) == [DAY1 + timedelta(days=i) for i in range(5)]
+    # Día 1 sin vela: precio del trade; día 3 sin vela: forward-fill del día 2
+    assert [p.valor_portafolio for p in serie.values()] == [100000, 110000, 110000, 120000, 120000]
+    assert all(p.caja_broker == 400000 for p in serie.values())
+    assert [p.billetera_usd for p in serie.values()] == [0, 200000, 200000, 200000, 200000]
+    assert [p.billetera_uyu for p in serie.values()] == [0, 0, 400000, 400000, 400000]
+    assert serie[date(2024, 1, 4)].pnl == 20000
+    # Nada nuevo que guardar
+    assert NetWorthHistory.sync(session, today=date(2024, 1, 6)) is None
+
+
+def test_writes_discard_stored_days_from_the_day_they_touch(session):
+    seed(session)
+    NetWorthHistory.sync(session, today=date(2024, 1, 6))
+
+    # Vela de un día todavía no guardado: no borra nada; el próximo sync sigue desde el último
+    session.add(bar("AAPL", date(2024, 1, 6), 130.0))
+    session.commit()
+    assert len(points(session)) == 5
+    assert NetWorthHistory.sync(session, today=date(2024, 1, 7)) == date(2024, 1, 6)
+    assert points(session)[date(2024, 1, 6)].valor_portafolio == 130000
+
+    # Velas intradiarias y ganancia_realizada (declarada por quien escribe) no son entradas de la serie
+    session.add(PriceBar(ticker="AAPL", intervalo="15m", ts=1704067200, open=1, high=1, low=1, close=1))
+    session.execute(update(TradeHistory).values(ganancia_realizada=1), execution_options=NOT_AN_INPUT)
+    session.commit()
+    assert len(points(session)) == 6
+
+    # Venta con fecha pasada: se descartan los días desde el 3, en la misma transacción
+    session.add(TradeHistory(ticker="AAPL", tipo="SELL", cantidad=5, precio=11500, total=57500,
+                             fecha=datetime(2024, 1, 3, 12)))
+    session.commit()
+    assert list(points(session)) == [DAY1, date(2024, 1, 2)]
+    assert NetWorthHistory.sync(session, today=date(2024, 1, 7)) == date(2024, 1, 3)
+
+    serie = points(session)
+    assert serie[date(2024, 1, 2)].valor_portafolio == 110000
+    assert serie[date(2024, 1, 3)].valor_portafolio == 5 * 11500
+    assert serie[date(2024, 1, 6)].valor_portafolio == 5 * 13000
+    assert serie[date(2024, 1, 6)].caja_broker == 400000 + 57500
+    assert serie[date(2024, 1, 6)].pnl == 5 * 13000 + 57500 - 100000
+
+    # Mover un trade: cuenta la fecha más vieja (la original)
+    venta = session.exec(select(TradeHistory).where(TradeHistory.tipo == "SELL")).one()
+    venta.fecha = datetime(2024, 1, 5, 12)
+    session.add(venta)
+    session.commit()
+    assert max(points(session)) == date(2024, 1, 2)
+
+    # Insert en bloque (importación): desde su fecha
+    NetWorthHistory.sync(session, today=date(2024, 1, 7))
+    session.execute(insert(Transaction), [{"tipo": "gasto", "monto": 100, "moneda": "USD", "categoria": "Varios",
+                                            "fecha": datetime(2024, 1, 4, 9)}])
+    session.commit()
+    assert max(points(session)) == date(2024, 1, 3)
+
+    # UPDATE en bloque estilo executemany: sin las fechas afectadas se descarta todo
+    NetWorthHistory.sync(session, today=date(2024, 1, 7))
+    table = TradeHistory.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam("trade_id")).values(cantidad=bindparam("cantidad")),
+        [{"trade_id": venta.id, "cantidad": 4}],
+    )
+    session.commit()
+    assert points(session) == {}
+
+
+def test_history_endpoint_is_read_only(client, session):
+    seed(session)
+
+    data = client.get("/api/dashboard/history").json()
+
+    # Nada guardado: todos los días salen del cálculo en memoria
+    assert points(session) == {}
+    assert data[0]["fecha"] == "2024-01-01"
+    assert data[-1]["fecha"] == date.today().isoformat()
+    assert data[0]["net_worth"] == 1000.0 + 4000.0
+    assert data[-1]["acciones"] == 1200.0
+    assert len(client.get("/api/dashboard/history?points=10").json()) == 10
+    assert [p["fecha"] for p in client.get("/api/dashboard/history?desde=2024-01-02&hasta=2024-01-03").json()] == ["2024-01-02", "2024-01-03"]
+
+    # Con los días cerrados guardados la respuesta es la misma
+    NetWorthHistory.sync(session)
+    assert client.get("/api/dashboard/history").json() == data
+
+
+def test_splits_apply_to_positions_in_the_adjusted_base(session):
+    # Mismo escenario con un split 2:1 el 3: Yahoo ya ajustó los cierres (110 -> 55, 120 -> 60)
+    session.add(TradeHistory(ticker="AAPL", tipo="BUY", cantidad=10, precio=10000, total=100000,
+                             fecha=datetime(2024, 1, 1, 10)))
+    session.add(CorporateAction(ticker="AAPL", tipo="SPLIT", fecha=datetime(2024, 1, 3), valor=2.0))
+    session.add(bar("AAPL", date(2024, 1, 2), 55.0))
+    session.add(bar("AAPL", date(2024, 1, 4), 60.0))
+    session.commit()
+
+    serie = NetWorthHistory.compute(session, DAY1, date(2024, 1, 5))
+    assert serie["valor_portafolio"].tolist() == [100000, 110000, 110000, 120000, 120000]
+    # Estado inicial desde los agregados, antes y después del split
+    assert NetWorthHistory.compute(session, date(2024, 1, 2), date(2024, 1, 2))["valor_portafolio"].tolist() == [110000]
+    assert NetWorthHistory.compute(session, date(2024, 1, 4), date(2024, 1, 4))["valor_portafolio"].tolist() == [120000]
+
+    # Un split sincronizado después descarta los días guardados desde su ex-date
+    NetWorthHistory.sync(session, today=date(2024, 1, 6))
+    session.add(CorporateAction(ticker="AAPL", tipo="SPLIT", fecha=datetime(2024, 1, 5), valor=3.0))
+    session.commit()
+    assert max(points(session)) == date(2024, 1, 4)
+
+
+def test_imported_snapshot_does_not_move_broker_cash(client, session):
+    ImportService.import_snapshot(session, json.dumps([{"Ticker": "AAPL", "Cantidad_Total": 10, "Precio_Promedio": 100.0}]))
+
+    hoy = client.get("/api/dashboard/history").json()[-1]
+    assert hoy["caja_broker"] == 0.0
+    assert hoy["acciones"] == hoy["net_worth"] == 1000.0
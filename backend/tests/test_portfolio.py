@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from models.models import Asset
+from services.market_service import MarketDataService
+
+
+def seed_assets(session, age=timedelta(minutes=1)):
+    session.add(Asset(ticker="AAPL", cantidad_total=10.0, precio_promedio=15000, cached_price=20000, last_updated=datetime.now() - age))
+    session.add(Asset(ticker="MSFT", cantidad_total=2.0, precio_promedio=30000, cached_price=25000, last_updated=datetime.now() - age))
+    session.commit()
+
+
+def test_portfolio_uses_cached_prices(client, session):
+    seed_assets(session)
+
+    with patch.object(MarketDataService, "download_prices") as mock_download:
+        response = client.get("/api/portfolio")
+
+    assert response.status_code == 200
+    mock_download.assert_not_called()
+    data = response.json()
+    aapl = next(p for p in data["posiciones"] if p["Ticker"] == "AAPL")
+    assert aapl["Precio_Actual"] == 200.0
+    assert aapl["Valor_Mercado"] == 2000.0
+    assert aapl["Rendimiento_Porc"] == 33.33
+    # 2000 + 500 de valor, 1500 + 600 de costo
+    assert data["resumen"]["valor_total_portafolio"] == 2500.0
+    assert data["resumen"]["ganancia_total_usd"] == 400.0
+
+
+def test_portfolio_max_age_forces_refresh_of_older_prices(client, session):
+    seed_assets(session, age=timedelta(minutes=5))
+
+    with patch.object(MarketDataService, "download_prices", return_value={"AAPL": 210.0, "MSFT": 260.0}) as mock_download:
+        response = client.get("/api/portfolio?max_age=60")
+
+    assert response.status_code == 200
+    mock_download.assert_called_once()
+    precios = {p["Ticker"]: p["Precio_Actual"] for p in response.json()["posiciones"]}
+    assert precios == {"AAPL": 210.0, "MSFT": 260.0}
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+from sqlmodel import select
+from models.models import Asset, BrokerCash, PositionCheckpoint, TradeHistory
+from services.portfolio_service import PortfolioService
+from services.position_engine import PositionEngine
+
+BASE = datetime(2024, 1, 1)
+
+
+def seed_history(session, ticker="AAPL", n=20):
+    # Compras de 1 acción a precios crecientes, una venta cada 5 trades
+    for i in range(n):
+        if i % 5 == 4:
+            session.add(TradeHistory(ticker=ticker, tipo="SELL", cantidad=1.0, precio=12000, total=12000, fecha=BASE + timedelta(days=i)))
+        else:
+            session.add(TradeHistory(ticker=ticker, tipo="BUY", cantidad=2.0, precio=10000 + i * 100, total=0, commission=50, fecha=BASE + timedelta(days=i)))
+    session.commit()
+
+
+def snapshot(asset):
+    return (round(asset.cantidad_total, 6), asset.precio_promedio)
+
+
+def test_full_replay_builds_checkpoints(session, monkeypatch):
+    monkeypatch.setattr(PositionEngine, "CHECKPOINT_INTERVAL", 4)
+    seed_history(session)
+
+    asset = PortfolioService.recalculate_asset_from_history(session, "AAPL")
+
+    checkpoints = session.exec(select(PositionCheckpoint).where(PositionCheckpoint.ticker == "AAPL")).all()
+    assert len(checkpoints) == 5  # 20 trades / 4
+    # 16 compras de 2 acciones - 4 ventas de 1
+    assert asset.cantidad_total == 28.0
+
+
+def test_incremental_replay_matches_full_replay(client, session, monkeypatch):
+    monkeypatch.setattr(PositionEngine, "CHECKPOINT_INTERVAL", 4)
+    seed_history(session)
+    PortfolioService.recalculate_asset_from_history(session, "AAPL")
+
+    # Editamos un trade cerca del final vía API (replay incremental)
+    trade = session.exec(select(TradeHistory).order_by(TradeHistory.fecha.desc())).first()
+    response = client.put(f"/api/trading/history/{trade.id}", json={"cantidad": 5.0})
+    assert response.status_code == 200
+    incremental = snapshot(session.exec(select(Asset).where(Asset.ticker == "AAPL")).one())
+
+    # Reproducción completa como referencia
+    full = snapshot(PortfolioService.recalculate_asset_from_history(session, "AAPL"))
+    assert incremental == full
+
+
+def test_moving_trade_earlier_replays_from_new_date(client, session, monkeypatch):
+    monkeypatch.setattr(PositionEngine, "CHECKPOINT_INTERVAL", 4)
+    seed_history(session)
+    PortfolioService.recalculate_asset_from_history(session, "AAPL")
+
+    # Movemos la última compra al principio de la historia
+    last_buy = session.exec(
+        select(TradeHistory).where(TradeHistory.tipo == "BUY").order_by(TradeHistory.fecha.desc())
+    ).first()
+    response = client.put(
+        f"/api/trading/history/{last_buy.id}",
+        json={"fecha": (BASE - timedelta(days=1)).isoformat(), "precio": 1.0},
+    )
+    assert response.status_code == 200
+    incremental = snapshot(session.exec(select(Asset).where(Asset.ticker == "AAPL")).one())
+
+    full = snapshot(PortfolioService.recalculate_asset_from_history(session, "AAPL"))
+    assert incremental == full
+
+
+def test_delete_trade_uses_checkpoints(client, session, monkeypatch):
+    monkeypatch.setattr(PositionEngine, "CHECKPOINT_INTERVAL", 4)
+    seed_history(session)
+    PortfolioService.recalculate_asset_from_history(session, "AAPL")
+
+    trade = session.exec(select(TradeHistory).order_by(TradeHistory.fecha.asc())).first()
+    response = client.delete(f"/api/trading/history/{trade.id}")
+    assert response.status_code == 200
+    incremental = snapshot(session.exec(select(Asset).where(Asset.ticker == "AAPL")).one())
+
+    full = snapshot(PortfolioService.recalculate_asset_from_history(session, "AAPL"))
+    assert incremental == full
+
+
+def test_backdated_buy_invalidates_later_checkpoints(client, session, monkeypatch):
+    monkeypatch.setattr(PositionEngine, "CHECKPOINT_INTERVAL", 4)
+    seed_history(session)
+    PortfolioService.recalculate_asset_from_history(session, "AAPL")
+    session.add(BrokerCash(id=1, saldo_usd=10_000_00))
+    session.commit()
+
+    payload = {
+        "ticker": "AAPL",
+        "cantidad": 1.0,
+        "precio": 50.0,
+        "fecha": (BASE + timedelta(days=6, hours=1)).isoformat(),
+        "usar_caja_broker": True,
+    }
+    assert client.post("/api/trade/buy", json=payload).status_code == 200
+
+    remaining = session.exec(select(PositionCheckpoint)).all()
+    assert all(cp.fecha <= BASE + timedelta(days=6, hours=1) for cp in remaining)
+
+
+def test_editing_trade_with_timezone_stores_naive_utc(client, session):
+    seed_history(session, n=3)
+    PortfolioService.recalculate_asset_from_history(session, "AAPL")
+    trade = session.exec(select(TradeHistory).order_by(TradeHistory.fecha.desc())).first()
+
+    # Fecha con zona horaria (ej: el navegador manda "-03:00"): se compara con las naive del historial
+    response = client.put(f"/api/trading/history/{trade.id}", json={"fecha": "2024-01-01T09:00:00-03:00"})
+
+    assert response.status_code == 200
+    session.refresh(trade)
+    assert trade.fecha == datetime(2024, 1, 1, 12, 0)
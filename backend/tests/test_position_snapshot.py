@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import numpy as np
+import pytest
+from sqlalchemy import event
+from sqlmodel import select
+from models.models import Account, Asset, BrokerCash
+from services.market_service import MarketDataService
+from services.position_snapshot import position_snapshot
+
+
+def seed(session):
+    session.add(Account(id=1, nombre="Principal"))
+    session.add(Account(id=2, nombre="Secundaria"))
+    session.add(BrokerCash(id=1, saldo_usd=50000))
+    session.add(BrokerCash(id=2, saldo_usd=10000))
+    ahora = datetime.now()
+    session.add(Asset(account_id=1, ticker="AAPL", cantidad_total=10.0, precio_promedio=15000, cached_price=20000, last_updated=ahora))
+    session.add(Asset(account_id=1, ticker="MSFT", cantidad_total=0.0, precio_promedio=0, cached_price=30000, last_updated=ahora))
+    session.add(Asset(account_id=2, ticker="AAPL", cantidad_total=1.0, precio_promedio=18000, cached_price=19000,
+                      last_updated=ahora - timedelta(hours=1)))
+    session.commit()
+
+
+def test_reads_share_one_snapshot_until_a_write(client, session):
+    seed(session)
+    cargados = []
+
+    def on_load(target, context):
+        cargados.append(target.ticker)
+
+    event.listen(Asset, "load", on_load)
+    try:
+        dashboard = client.get("/api/dashboard").json()
+        portfolio = client.get("/api/portfolio", params={"account_id": 1}).json()
+        cash = client.get("/api/broker/cash", params={"account_id": 2}).json()
+    finally:
+        event.remove(Asset, "load", on_load)
+    # Las lecturas no materializan objetos ORM: una sola consulta columnar para las tres
+    assert cargados == []
+    assert position_snapshot.stats()["builds"] == 1
+
+    # AAPL: el precio guardado más reciente vale para las dos cuentas
+    assert dashboard["assets"][0]["amount"] == 2200.0
+    assert [p["Ticker"] for p in portfolio["posiciones"]] == ["AAPL"]  # MSFT está en 0
+    assert cash == {"saldo_usd": 100.0}
+
+    version = position_snapshot.stats()["version"]
+    assert client.post("/api/trade/buy", json={"ticker": "AAPL", "cantidad": 1, "precio": 100, "account_id": 2}).status_code == 200
+    cantidades = {p["Cuenta"]: p["Cantidad_Total"] for p in client.get("/api/portfolio").json()["posiciones"]}
+    assert cantidades == {1: 10.0, 2: 2.0}
+    assert position_snapshot.stats()["version"] > version
+    assert client.get("/api/broker/cash", params={"account_id": 2}).json() == {"saldo_usd": 0.0}
+
+
+def test_snapshot_is_immutable_and_account_views_are_slices(session):
+    seed(session)
+    snapshot = position_snapshot.get(session)
+
+    assert snapshot.tickers == ("AAPL", "MSFT", "AAPL")
+    assert snapshot.simbolos == ("AAPL", "MSFT")
+    assert snapshot.precio_guardado.tolist() == [20000, 30000]
+    with pytest.raises(ValueError):
+        snapshot.cantidades[0] = 1.0
+    with pytest.raises(TypeError):
+        snapshot.broker_cash[1] = 0
+
+    segunda = snapshot.cuenta(2)
+    assert segunda.tickers == ("AAPL",)
+    assert dict(segunda.broker_cash) == {2: 10000}
+    assert np.shares_memory(segunda.cantidades, snapshot.cantidades)
+    assert snapshot.cuenta(1).abiertas().tickers == ("AAPL",)
+    assert len(snapshot.cuenta(3)) == 0
+    assert position_snapshot.get(session) is snapshot
+
+
+def test_snapshot_prices_update_every_holder_in_one_batch(session):
+    seed(session)
+    snapshot = position_snapshot.get(session)
+
+    with patch.object(MarketDataService, "download_prices", return_value={"AAPL": 210.0}) as download:
+        precios = MarketDataService.get_snapshot_prices(session, snapshot, max_age=0)
+    download.assert_called_once_with(["AAPL", "MSFT"])
+    # MSFT no vino: queda el precio guardado
+    assert precios == {"AAPL": 21000, "MSFT": 30000}
+
+    session.expire_all()
+    assert {a.account_id: a.cached_price for a in session.exec(select(Asset).where(Asset.ticker == "AAPL"))} == {1: 21000, 2: 21000}
+    # El UPDATE cuenta como escritura: la próxima lectura arma otra foto
+    assert position_snapshot.lookup() is None
@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch
+from models.models import Asset
+from services.market_service import MarketDataService, price_cache
+from services.price_cache import PriceCache
+
+
+def test_cache_ttl_eviction(monkeypatch):
+    cache = PriceCache(ttl_seconds=60)
+    clock = [1000.0]
+    monkeypatch.setattr("services.price_cache.time.monotonic", lambda: clock[0])
+
+    cache.put("AAPL", 15000)
+    assert cache.get("AAPL") == 15000
+
+    clock[0] += 61
+    assert cache.get("AAPL") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_newer_stored_price_wins_over_memory(monkeypatch):
+    cache = PriceCache(ttl_seconds=60)
+    clock = [1000.0]
+    monkeypatch.setattr("services.price_cache.time.monotonic", lambda: clock[0])
+
+    cache.put("AAPL", 15000)
+    clock[0] += 30
+    assert cache.get("AAPL", stored_age=40) == 15000
+    # Otro worker guardó un precio hace 10s: la entrada de 30s ya no sirve
+    assert cache.get("AAPL", stored_age=10) is None
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = PriceCache(ttl_seconds=60)
+    calls = []
+
+    def slow_fetcher(tickers):
+        calls.append(list(tickers))
+        time.sleep(0.2)
+        return {t: 100.0 for t in tickers}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.fetch_many(["AAPL", "MSFT"], slow_fetcher)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r == {"AAPL": 10000, "MSFT": 10000} for r in results)
+    assert cache.stats()["refreshes"] == 1
+    assert cache.stats()["coalesced"] == 8
+
+
+def test_failed_fetch_releases_waiters():
+    cache = PriceCache(ttl_seconds=60)
+
+    def broken_fetcher(tickers):
+        raise RuntimeError("yahoo caído")
+
+    try:
+        cache.fetch_many(["AAPL"], broken_fetcher)
+    except RuntimeError:
+        pass
+    assert cache.stats()["inflight"] == 0
+    assert cache.get("AAPL") is None
+
+
+def test_market_prices_served_from_memory_after_first_download(session):
+    asset = Asset(ticker="AAPL", cantidad_total=1, precio_promedio=10000)
+    session.add(asset)
+    session.commit()
+
+    with patch.object(MarketDataService, "download_prices", return_value={"AAPL": 190.5}) as mock_download:
+        assert MarketDataService.get_market_prices(session, [asset]) == {"AAPL": 19050}
+        # Segundo request: la DB y la memoria están frescas, no hay descarga
+        assert MarketDataService.get_market_prices(session, [asset]) == {"AAPL": 19050}
+
+    assert mock_download.call_count == 1
+    assert price_cache.stats()["hits"] == 1
+
+
+def test_price_stored_by_another_worker_is_served(session):
+    asset = Asset(ticker="AAPL", cantidad_total=1, precio_promedio=10000)
+    session.add(asset)
+    session.commit()
+    price_cache.put("AAPL", 19050, age_seconds=60)
+
+    # Descarga de otro proceso, guardada en la DB después de la entrada en memoria
+    asset.cached_price = 19500
+    asset.last_updated = datetime.now()
+    session.add(asset)
+    session.commit()
+
+    with patch.object(MarketDataService, "download_prices") as mock_download:
+        assert MarketDataService.get_market_prices(session, [asset]) == {"AAPL": 19500}
+
+    mock_download.assert_not_called()
+    assert price_cache.get("AAPL") == 19500
+
+
+def test_cache_stats_endpoint(client):
+    response = client.get("/api/market/cache/stats")
+    assert response.status_code == 200
+    assert {"hits", "misses", "refreshes"} <= response.json().keys()
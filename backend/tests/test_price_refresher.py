@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlmodel import Session
+from models.models import Asset
+from services.market_service import MarketDataService
+from services.price_refresher import MARKET_TZ, PriceRefresher, is_market_open
+
+# Miércoles 11:00 ET (mercado abierto) y sábado (cerrado)
+OPEN = datetime(2024, 3, 6, 11, 0, tzinfo=MARKET_TZ)
+WEEKEND = datetime(2024, 3, 9, 11, 0, tzinfo=MARKET_TZ)
+
+
+def local_naive(dt):
+    return dt.astimezone().replace(tzinfo=None)
+
+
+def make_refresher(session):
+    return PriceRefresher(lambda: Session(session.get_bind()))
+
+
+def test_market_hours():
+    assert is_market_open(OPEN)
+    assert not is_market_open(WEEKEND)
+    assert not is_market_open(datetime(2024, 3, 6, 17, 0, tzinfo=MARKET_TZ))
+
+
+def test_refreshes_held_tickers_before_ttl(session):
+    session.add(Asset(ticker="OLD", cantidad_total=1, precio_promedio=100, cached_price=100, last_updated=local_naive(OPEN - timedelta(minutes=13))))
+    session.add(Asset(ticker="NEW", cantidad_total=1, precio_promedio=100, cached_price=100, last_updated=local_naive(OPEN - timedelta(minutes=1))))
+    session.add(Asset(ticker="SOLD", cantidad_total=0, precio_promedio=0))
+    session.commit()
+
+    with patch.object(MarketDataService, "download_prices", return_value={"OLD": 12.5}) as mock_download:
+        status = make_refresher(session).run_once(now=OPEN)
+
+    # 13 min > 80% del TTL de 15 min: se anticipa; NEW sigue fresco y SOLD no está en cartera
+    mock_download.assert_called_once_with(["OLD"])
+    assert status["last_refreshed"] == 1
+    assert status["last_failed"] == []
+    assert status["last_duration_ms"] is not None
+
+
+def test_closed_market_skips_prices_after_last_close(session):
+    friday_close = datetime(2024, 3, 8, 16, 30, tzinfo=MARKET_TZ)
+    session.add(Asset(ticker="AAPL", cantidad_total=1, precio_promedio=100, cached_price=100, last_updated=local_naive(friday_close)))
+    session.commit()
+
+    with patch.object(MarketDataService, "download_prices") as mock_download:
+        make_refresher(session).run_once(now=WEEKEND)
+
+    mock_download.assert_not_called()
+
+
+def test_backoff_on_errors(session):
+    session.add(Asset(ticker="AAPL", cantidad_total=1, precio_promedio=100))
+    session.commit()
+    refresher = make_refresher(session)
+
+    with patch.object(MarketDataService, "download_prices", side_effect=RuntimeError("yahoo caído")):
+        refresher.run_once(now=OPEN)
+        status = refresher.run_once(now=OPEN)
+
+    assert status["consecutive_failures"] == 2
+    assert "yahoo caído" in status["last_error"]
+    assert refresher.next_delay() == PriceRefresher.INTERVAL_SECONDS * 4
+
+    with patch.object(MarketDataService, "download_prices", return_value={"AAPL": 1.0}):
+        refresher.run_once(now=OPEN)
+    assert refresher.next_delay() == PriceRefresher.INTERVAL_SECONDS
+
+
+def test_status_endpoint(client):
+    response = client.get("/api/market/refresher/status")
+    assert response.status_code == 200
+    assert {"last_run", "last_duration_ms", "last_failed", "consecutive_failures"} <= response.json().keys()
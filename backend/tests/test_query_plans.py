@@ -0,0 +1,118 @@
+"""
+Auditoría de planes (EXPLAIN QUERY PLAN, SQLite) de las consultas calientes.
+Falla si alguna vuelve a recorrer la tabla completa o a ordenar en memoria.
+"""
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlmodel import SQLModel
+from migrations import run_migrations
+from models.models import TradeHistory
+from routers.transactions import movimientos_query
+from services.corporate_actions import CorporateActionService
+from services.lot_engine import LotEngine
+from services.position_engine import PositionEngine
+from services.trade_history_service import TradeHistoryService
+
+FECHA = datetime(2024, 1, 1)
+CURSOR = TradeHistoryService.encode_cursor(FECHA, 10)
+
+# Las consultas salen de los mismos builders que usan los servicios y routers:
+# si uno cambia y deja de usar su índice, este test lo detecta.
+HOT_QUERIES = {
+    # PositionEngine.replay: historial completo de un ticker de la cuenta
+    "replay_full": PositionEngine.tail_query("AAPL", 1),
+    # PositionEngine.replay: cola desde un checkpoint
+    "replay_tail": PositionEngine.tail_query("AAPL", 1, after=(FECHA, 10)),
+    # PositionEngine.rebuild: varios tickers en una pasada
+    "rebuild": PositionEngine.rebuild_query(["AAPL", "MSFT"], 1),
+    # PositionEngine.replay: checkpoint de partida
+    "checkpoint": PositionEngine.checkpoint_query("AAPL", FECHA, 1),
+    # LotEngine.replay: BUY/SELL de algunos tickers de la cuenta
+    "lots": LotEngine._history_query(["AAPL", "MSFT"], 1),
+    # Acciones corporativas intercaladas en el replay
+    "corporate_actions": CorporateActionService.actions_query(["AAPL", "MSFT"], desde=FECHA),
+    # GET /api/trading/history/{ticker}
+    "trading_history": TradeHistoryService.ticker_query("AAPL", 1),
+    # GET /api/trade/history (primera página y siguientes)
+    "trade_history_first_page": TradeHistoryService.page_query(limit=500),
+    "trade_history_next_page": TradeHistoryService.page_query(CURSOR, limit=500),
+    # GET /api/trade/history?account_id=
+    "trade_history_account_page": TradeHistoryService.page_query(CURSOR, limit=500, account_id=2),
+    # GET /api/movimientos
+    "movimientos": movimientos_query(skip=100, limit=100),
+}
+
+
+@pytest.fixture(name="db")
+def db_fixture():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with engine.connect() as conn:
+        # Algo de volumen para que el planner tenga estadísticas realistas
+        conn.execute(TradeHistory.__table__.insert(), [
+            {"account_id": 1 + i % 2, "ticker": f"T{i % 50}", "tipo": "BUY", "cantidad": 1.0, "precio": 100, "total": 100, "commission": 0,
+             "fecha": datetime(2020, 1, 1 + i % 28)}
+            for i in range(2000)
+        ])
+        conn.execute(text("ANALYZE"))
+        conn.commit()
+    yield engine
+    engine.dispose()
+
+
+def explain(engine, query):
+    compiled = query.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_queries_use_indexes(db, name):
+    plan = explain(db, HOT_QUERIES[name])
+
+    for step in plan:
+        assert "TEMP B-TREE" not in step, f"{name} ordena en memoria: {plan}"
+        if step.startswith("SCAN"):
+            # Recorrer un índice en orden (con LIMIT) es aceptable; la tabla completa no
+            assert "INDEX" in step, f"{name} hace full scan: {plan}"
+
+
+@pytest.mark.parametrize("name", ["replay_full", "replay_tail", "rebuild", "lots", "corporate_actions", "trading_history",
+                                  "trade_history_next_page", "trade_history_account_page"])
+def test_filtered_queries_are_range_searches(db, name):
+    plan = explain(db, HOT_QUERIES[name])
+    assert any(step.startswith("SEARCH") for step in plan), f"{name}: {plan}"
+
+
+def test_migrations_add_indexes_to_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    # Esquema previo: las tablas ya existen sin los índices compuestos (ni account_id)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE tradehistory (id INTEGER PRIMARY KEY, ticker VARCHAR NOT NULL, tipo VARCHAR NOT NULL, "
+            "cantidad FLOAT NOT NULL, precio INTEGER NOT NULL, total INTEGER NOT NULL, fecha DATETIME NOT NULL, "
+            "ganancia_realizada INTEGER, commission INTEGER NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE \"transaction\" (id INTEGER PRIMARY KEY, tipo VARCHAR NOT NULL, monto INTEGER NOT NULL, "
+            "moneda VARCHAR NOT NULL, categoria VARCHAR NOT NULL, fecha DATETIME NOT NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO tradehistory (ticker, tipo, cantidad, precio, total, fecha, commission) "
+            "VALUES ('AAPL', 'BUY', 1, 100, 100, '2024-01-01 00:00:00', 0)"
+        ))
+
+    SQLModel.metadata.create_all(engine)
+    applied = run_migrations(engine)
+
+    assert {"tradehistory_account_id", "ix_tradehistory_account_ticker_fecha", "ix_tradehistory_fecha_id",
+            "ix_transaction_fecha_id"} <= set(applied)
+    inspector = inspect(engine)
+    assert "ix_tradehistory_account_ticker_fecha" in {ix["name"] for ix in inspector.get_indexes("tradehistory")}
+    # Los datos existentes se conservan y una segunda corrida no hace nada
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM tradehistory WHERE account_id = 1")).scalar() == 1
+    assert run_migrations(engine) == []
+    assert "SEARCH" in explain(engine, HOT_QUERIES["replay_full"])[0]
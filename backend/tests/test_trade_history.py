@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timedelta
+from sqlmodel import Session
+from models.models import TradeHistory
+from services.trade_history_service import TradeHistoryService
+
+
+def seed_history(session: Session, n: int):
+    base = datetime(2024, 1, 1, 10, 0)
+    for i in range(n):
+        # Pares de trades con la misma fecha: el id desempata el orden
+        session.add(TradeHistory(
+            ticker="AAPL", tipo="BUY", cantidad=1.0,
+            precio=15025 + i, total=15025 + i, commission=150,
+            fecha=base + timedelta(days=i // 2),
+        ))
+    session.commit()
+
+
+def test_history_pages_with_cursor(client, session):
+    seed_history(session, 25)
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        url = "/api/trade/history?limit=10" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(response.json())
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert pages == 3
+    ids = [row["id"] for row in seen]
+    assert len(ids) == len(set(ids)) == 25
+    # Orden (fecha, id) descendente
+    keys = [(row["fecha"], row["id"]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_history_without_cursor_or_limit_returns_everything(client, session, monkeypatch):
+    monkeypatch.setattr(TradeHistoryService, "DEFAULT_PAGE_SIZE", 10)
+    seed_history(session, 25)
+
+    response = client.get("/api/trade/history")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 25
+    assert "X-Next-Cursor" not in response.headers
+    assert len(client.get("/api/trade/history?limit=10").json()) == 10
+
+
+def test_history_converts_cents_in_sql(client, session):
+    session.add(TradeHistory(ticker="AAPL", tipo="SELL", cantidad=2.0, precio=15050, total=30100,
+                             commission=199, ganancia_realizada=-1234, fecha=datetime(2024, 1, 1)))
+    session.add(TradeHistory(ticker="MSFT", tipo="BUY", cantidad=1.0, precio=40000, total=40000,
+                             commission=0, fecha=datetime(2023, 1, 1)))
+    session.commit()
+
+    rows = client.get("/api/trade/history").json()
+
+    assert rows[0]["precio"] == 150.5
+    assert rows[0]["total"] == 301.0
+    assert rows[0]["commission"] == 1.99
+    assert rows[0]["ganancia_realizada"] == -12.34
+    assert rows[1]["ganancia_realizada"] is None
+    assert set(rows[0]) == {"id", "account_id", "ticker", "tipo", "cantidad", "precio", "total", "fecha", "ganancia_realizada", "commission"}
+
+
+def test_history_ndjson_streams_everything(client, session):
+    seed_history(session, 23)
+
+    response = client.get("/api/trade/history?format=ndjson&limit=5")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 23
+    assert rows == client.get("/api/trade/history").json()
+
+
+def test_history_rejects_bad_cursor(client):
+    assert client.get("/api/trade/history?cursor=nope").status_code == 400
@@ -1,4 +1,6 @@
-from models.models import Asset, BrokerCash, Transaction
+from datetime import datetime
+from sqlmodel import select
+from models.models import Asset, BrokerCash, TradeHistory, Transaction
 
 def test_trade_buy_execution(client, session):
     """
@@ -81,3 +83,62 @@ def test_fund_deposit_side_effect_transaction(client, session):
     assert txs[0].tipo == "gasto"
     assert txs[0].monto == 100000 # Cents
     assert txs[0].categoria == "Transferencia a Broker"
+
+def test_trade_batch_applies_in_date_order(client, session):
+    """El lote se aplica por fecha: la venta del día 2 usa la compra del día 1 aunque venga antes."""
+    session.add(BrokerCash(id=1, saldo_usd=100000))
+    session.commit()
+
+    payload = [
+        {"tipo": "SELL", "ticker": "AAPL", "cantidad": 1.0, "precio": 150.0, "fecha": "2024-01-02T10:00:00"},
+        {"tipo": "BUY", "ticker": "AAPL", "cantidad": 4.0, "precio": 100.0, "fecha": "2024-01-01T10:00:00"},
+        # Con el saldo acumulado (1000 - 400 + 150 = 750) alcanza justo
+        {"tipo": "BUY", "ticker": "MSFT", "cantidad": 1.0, "precio": 750.0, "fecha": "2024-01-03T10:00:00"},
+    ]
+
+    response = client.post("/api/trade/batch", json=payload)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["indice"] for r in results] == [0, 1, 2]
+    assert results[0]["ganancia_realizada"] == 50.0
+    assert results[1]["nuevo_promedio"] == 100.0
+    assert session.get(BrokerCash, 1).saldo_usd == 0
+    cantidades = {a.ticker: a.cantidad_total for a in session.query(Asset).all()}
+    assert cantidades == {"AAPL": 3.0, "MSFT": 1.0}
+
+def test_trade_batch_mixes_naive_and_aware_dates(client, session):
+    """Fechas con zona horaria se ordenan (y guardan) como UTC naive junto a las que no la tienen."""
+    session.add(BrokerCash(id=1, saldo_usd=100000))
+    session.commit()
+
+    payload = [
+        # 10:00 en Montevideo = 13:00 UTC: va después de la compra de las 12:00
+        {"tipo": "SELL", "ticker": "AAPL", "cantidad": 1.0, "precio": 150.0, "fecha": "2024-01-02T10:00:00-03:00"},
+        {"tipo": "BUY", "ticker": "AAPL", "cantidad": 2.0, "precio": 100.0, "fecha": "2024-01-02T12:00:00"},
+        {"tipo": "BUY", "ticker": "MSFT", "cantidad": 1.0, "precio": 10.0},
+    ]
+
+    response = client.post("/api/trade/batch", json=payload)
+
+    assert response.status_code == 200
+    assert response.json()[0]["ganancia_realizada"] == 50.0
+    venta = session.exec(select(TradeHistory).where(TradeHistory.tipo == "SELL")).one()
+    assert venta.fecha == datetime(2024, 1, 2, 13, 0)
+
+def test_trade_batch_is_all_or_nothing(client, session):
+    session.add(BrokerCash(id=1, saldo_usd=50000))
+    session.commit()
+
+    payload = [
+        {"tipo": "BUY", "ticker": "AAPL", "cantidad": 2.0, "precio": 200.0},
+        {"tipo": "BUY", "ticker": "MSFT", "cantidad": 1.0, "precio": 200.0},  # Saldo acumulado: 100
+    ]
+
+    response = client.post("/api/trade/batch", json=payload)
+
+    assert response.status_code == 400
+    assert "#1" in response.json()["detail"]
+    assert "Saldo insuficiente" in response.json()["detail"]
+    assert session.get(BrokerCash, 1).saldo_usd == 50000
+    assert session.query(Asset).count() == 0
@@ -0,0 +1,29 @@
+import math
+import numpy as np
+from services.valuation import valuar_posiciones
+
+
+def test_valuation_kernel_matches_row_by_row():
+    cantidades = [10.0, 0.5, 3.0]
+    promedios = [15000, 40000, 0]      # CENTS
+    precios = [20000, 30000, 1000]     # CENTS
+
+    v = valuar_posiciones(cantidades, promedios, precios)
+
+    assert v.valor_mercado.tolist() == [200000.0, 15000.0, 3000.0]
+    assert v.costo_base.tolist() == [150000.0, 20000.0, 0.0]
+    assert v.ganancia.tolist() == [50000.0, -5000.0, 3000.0]
+    # Sin costo base el rendimiento es 0 (no división por cero)
+    assert np.allclose(v.rendimiento_porc, [33.333333, -25.0, 0.0])
+    assert v.valor_total == 218000.0
+    assert v.ganancia_total == 48000.0
+    assert math.isclose(v.rendimiento_total_porc, 48000 / 170000 * 100)
+
+
+def test_valuation_kernel_handles_dirty_data_and_empty_input():
+    v = valuar_posiciones([float("nan"), 2.0], [1000, 1000], [2000, float("inf")])
+    assert v.valor_mercado.tolist() == [0.0, 0.0]
+
+    empty = valuar_posiciones([], [], [])
+    assert empty.valor_total == 0.0
+    assert empty.rendimiento_total_porc == 0.0
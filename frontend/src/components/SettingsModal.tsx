@@ -6,15 +6,19 @@ interface Props {
     onClose: () => void;
 }
 
+type LotMethod = 'FIFO' | 'LIFO' | 'AVERAGE';
+
 interface BrokerSettings {
     default_fee_integer: number;
     default_fee_fractional: number;
+    lot_method: LotMethod;
 }
 
 export const SettingsModal: React.FC<Props> = ({ isOpen, onClose }) => {
     const [settings, setSettings] = useState<BrokerSettings>({
         default_fee_integer: 0,
-        default_fee_fractional: 0
+        default_fee_fractional: 0,
+        lot_method: 'AVERAGE'
     });
     const [isLoading, setIsLoading] = useState(false);
     const [isSaving, setIsSaving] = useState(false);
@@ -34,7 +38,8 @@ export const SettingsModal: React.FC<Props> = ({ isOpen, onClose }) => {
                 const data = await res.json();
                 setSettings({
                     default_fee_integer: data.default_fee_integer,
-                    default_fee_fractional: data.default_fee_fractional
+                    default_fee_fractional: data.default_fee_fractional,
+                    lot_method: data.lot_method ?? 'AVERAGE'
                 });
             }
         } catch (error) {
@@ -115,6 +120,22 @@ export const SettingsModal: React.FC<Props> = ({ isOpen, onClose }) => {
                                 <p className="text-[10px] text-slate-600 mt-1">Se aplica cuando operas fracciones (ej: 0.5, 1.25)</p>
                             </div>
 
+                            <div>
+                                <label className="text-xs text-slate-400 font-bold uppercase tracking-wider mb-1 block">
+                                    Cálculo de Ganancia Realizada
+                                </label>
+                                <select
+                                    className="w-full bg-slate-950 border border-slate-800 rounded-lg p-3 text-white focus:border-indigo-500 outline-none transition-colors"
+                                    value={settings.lot_method}
+                                    onChange={e => setSettings({ ...settings, lot_method: e.target.value as LotMethod })}
+                                >
+                                    <option value="AVERAGE">Precio Promedio</option>
+                                    <option value="FIFO">FIFO (primero en entrar, primero en salir)</option>
+                                    <option value="LIFO">LIFO (último en entrar, primero en salir)</option>
+                                </select>
+                                <p className="text-[10px] text-slate-600 mt-1">Al cambiarlo se recalcula la ganancia de todas las ventas</p>
+                            </div>
+
                             <button
                                 type="submit"
                                 disabled={isSaving}
@@ -3,6 +3,9 @@ import { X, RefreshCw } from 'lucide-react';
 import PriceChart from './PriceChart';
 import HistoryTable, { type TradeHistoryItem } from './HistoryTable';
 
+// El gráfico tiene unos cientos de píxeles de ancho: más puntos no se ven
+const CHART_POINTS = 500;
+
 interface AssetDetailViewProps {
     ticker: string;
     onClose: () => void;
@@ -20,8 +23,8 @@ const AssetDetailView: React.FC<AssetDetailViewProps> = ({ ticker, onClose, curr
     const fetchData = async () => {
         setLoading(true);
         try {
-            // 1. Chart Data
-            const chartRes = await fetch(`http://localhost:8000/api/market/history/${ticker}?range=${range}`);
+            // 1. Chart Data (el backend reduce a CHART_POINTS conservando la forma)
+            const chartRes = await fetch(`http://localhost:8000/api/market/history/${ticker}?range=${range}&points=${CHART_POINTS}`);
             const chartJson = await chartRes.json();
             if (chartJson.data) setChartData(chartJson.data);
 